@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Persistent, content-addressed cache of synthesized audio.
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from audiblez.tracing import traced
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.audiblez/audio_cache')
+DEFAULT_MAX_MB = 2048
+
+
+def normalize_text(text):
+    """Collapses whitespace so that re-flowed paragraphs still hit the cache."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AudioCache:
+    """
+    On-disk cache of synthesized audio keyed by (normalized text, voice, speed, model version).
+    Entries are stored as 16-bit PCM .npy files, the same resolution as the chapter WAVs, so a cache hit produces
+    exactly the same output as a fresh synthesis. Reading an entry refreshes its mtime, and when the cache grows
+    past max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, model_version, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.model_version = model_version
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self._entries())
+
+    def key(self, text, voice, speed):
+        data = f'{self.model_version}\0{voice}\0{float(speed):.3f}\0{normalize_text(text)}'
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f'{key}.npy'
+
+    def _entries(self):
+        return self.cache_dir.glob('*/*.npy')
+
+    @traced('audio_cache.get', 'cache')
+    def get(self, key):
+        """Returns the cached float32 audio for key, or None."""
+        path = self._path(key)
+        try:
+            pcm = np.load(path)
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pcm.astype(np.float32) / 32767
+
+    @traced('audio_cache.put', 'cache')
+    def put(self, key, audio):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        pcm = np.round(np.clip(np.asarray(audio, dtype=np.float32), -1, 1) * 32767).astype(np.int16)
+        tmp_path = path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, pcm)
+        os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial entry
+        with self._lock:
+            self._size += path.stat().st_size
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    @traced('audio_cache.evict', 'cache')
+    def evict(self):
+        """Deletes least recently used entries until the cache is back under 90% of max_bytes."""
+        with self._lock:
+            entries = []
+            for f in self._entries():
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((st.st_mtime, st.st_size, f))
+            entries.sort()
+            self._size = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, f in entries:
+                if self._size <= target:
+                    break
+                f.unlink(missing_ok=True)
+                self._size -= size
+
+    def size_bytes(self):
+        return self._size
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return (f'Audio cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), '
+                f'{self._size / 1024 / 1024:.0f} MB of {self.max_bytes / 1024 / 1024:.0f} MB used')
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Length-bucketed batched inference: several sentences per Kokoro forward pass instead of one.
+import threading
+
+import numpy as np
+import torch
+from kokoro import KModel
+
+from audiblez.phonemes import phonemize
+from audiblez.tracing import span, traced_iter
+
+DEFAULT_BATCH_SIZE = 8
+
+# Per-thread frame counts of the padded batch being decoded, read by the masking below
+_padding = threading.local()
+
+
+def length_buckets(lengths, batch_size):
+    """
+    Groups indices into batches of at most batch_size items of similar length (sorted by length, then sliced),
+    so that little of each padded batch is wasted on padding. Returns a list of index lists.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _valid_lengths(x):
+    """How much of each item of x (at its own resolution) is not padding, or None outside of _decode_batch."""
+    frames = getattr(_padding, 'frames', None)
+    if frames is None:
+        return None
+    # Every item is padded at the same resolution, and upsampling scales all of them alike. Rounding up matches
+    # layers that output a * frames + 1 steps (STFT frames, the generator's reflection pad).
+    length = x.shape[-1]
+    return torch.ceil(frames * length / _padding.max_frames).clamp(1, length).long()
+
+
+def _masked_instance_norm(norm, x):
+    valid = _valid_lengths(x)
+    if valid is None:
+        return torch.nn.InstanceNorm1d.forward(norm, x)
+    # Statistics over each item's own frames only
+    out = torch.zeros_like(x)
+    for row, n in enumerate(valid.tolist()):
+        out[row, :, :n] = torch.nn.functional.instance_norm(x[row:row + 1, :, :n], eps=norm.eps)[0]
+    return out
+
+
+def _zero_padding(conv, args):
+    # Convolutions must see zeros past the end of each item, like the zero padding they get in an unbatched pass
+    x = args[0]
+    valid = _valid_lengths(x)
+    if valid is not None:
+        mask = torch.arange(x.shape[-1], device=x.device) < valid.unsqueeze(1)
+        return (x * mask.unsqueeze(1),) + args[1:]
+
+
+def _install_padding_masks(model):
+    # Done once per model. Outside of _decode_batch (no frames set for this thread) nothing changes, so the same
+    # model keeps serving unbatched pipelines, e.g. UI previews.
+    if getattr(model, '_padding_masks', False):
+        return
+    for module in model.modules():
+        if isinstance(module, torch.nn.InstanceNorm1d):
+            module.forward = _masked_instance_norm.__get__(module)
+        elif isinstance(module, (torch.nn.Conv1d, torch.nn.ConvTranspose1d)):
+            module.register_forward_pre_hook(_zero_padding)
+    model._padding_masks = True
+
+
+def _lstm(lstm, x, lengths):
+    # Packed, so that the backward direction of shorter items doesn't run over padding
+    packed = torch.nn.utils.rnn.pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+    out, _ = lstm(packed)
+    out, _ = torch.nn.utils.rnn.pad_packed_sequence(out, batch_first=True, total_length=x.shape[1])
+    return out
+
+
+def _encode_batch(model, phonemes, ref_s, speed):
+    """Text side of KModel.forward for a padded batch. Returns (en, asr) per item, each [channels, frames]."""
+    ids = [[0, *(model.vocab[p] for p in ps if p in model.vocab), 0] for ps in phonemes]
+    lengths = torch.LongTensor([len(i) for i in ids]).to(model.device)
+    input_ids = torch.zeros(len(ids), int(lengths.max()), dtype=torch.long, device=model.device)
+    for row, item in enumerate(ids):
+        input_ids[row, :len(item)] = torch.LongTensor(item)
+    text_mask = torch.arange(input_ids.shape[1], device=model.device).unsqueeze(0) >= lengths.unsqueeze(1)
+    bert_dur = model.bert(input_ids, attention_mask=(~text_mask).int())
+    d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+    d = model.predictor.text_encoder(d_en, ref_s[:, 128:], lengths, text_mask)
+    x = _lstm(model.predictor.lstm, d, lengths)
+    duration = torch.sigmoid(model.predictor.duration_proj(x)).sum(axis=-1) / speed
+    t_en = model.text_encoder(input_ids, lengths, text_mask)
+    encoded = []
+    for row, length in enumerate(lengths.tolist()):
+        pred_dur = torch.round(duration[row, :length]).clamp(min=1).long()
+        alignment = torch.repeat_interleave(torch.eye(length, dtype=d.dtype, device=model.device), pred_dur, dim=1)
+        encoded.append((d[row, :length].transpose(0, 1) @ alignment, t_en[row, :, :length] @ alignment))
+    return encoded
+
+
+def _decode_batch(model, encoded, ref_s):
+    """Acoustic side of KModel.forward for items of similar frame counts, padded to the longest. Returns audio."""
+    frames = torch.LongTensor([en.shape[-1] for en, _ in encoded]).to(model.device)
+    max_frames = int(frames.max())
+    en = torch.stack([torch.nn.functional.pad(en, (0, max_frames - en.shape[-1])) for en, _ in encoded])
+    asr = torch.stack([torch.nn.functional.pad(asr, (0, max_frames - asr.shape[-1])) for _, asr in encoded])
+    s = ref_s[:, 128:]
+    _padding.frames, _padding.max_frames = frames, max_frames
+    try:
+        predictor = model.predictor
+        x = _lstm(predictor.shared, en.transpose(-1, -2), frames).transpose(-1, -2)
+        F0, N = x, x
+        for block in predictor.F0:
+            F0 = block(F0, s)
+        for block in predictor.N:
+            N = block(N, s)
+        F0_pred, N_pred = predictor.F0_proj(F0).squeeze(1), predictor.N_proj(N).squeeze(1)
+        audio = model.decoder(asr, F0_pred, N_pred, ref_s[:, :128])
+    finally:
+        _padding.frames = None
+    audio = audio.reshape(len(encoded), -1)
+    samples_per_frame = audio.shape[-1] // max_frames
+    return [audio[row, :int(n) * samples_per_frame].cpu() for row, n in enumerate(frames.tolist())]
+
+
+@torch.no_grad()
+def forward_batch(model, phonemes, ref_s, speed=1, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batched KModel.forward: returns the audio of each phoneme string in `phonemes`, in order. ref_s holds one style
+    vector per item. Items are bucketed by phoneme count for the text encoders, and again by predicted frame count
+    for the decoder, which is where most of the time goes.
+    """
+    _install_padding_masks(model)
+    ref_s = ref_s.to(model.device)
+    encoded = [None] * len(phonemes)
+    for bucket in length_buckets([len(ps) for ps in phonemes], batch_size):
+        with span('encode_batch', 'model', items=len(bucket)):
+            for i, item in zip(bucket, _encode_batch(model, [phonemes[i] for i in bucket], ref_s[bucket], speed)):
+                encoded[i] = item
+    audio = [None] * len(phonemes)
+    for bucket in length_buckets([en.shape[-1] for en, _ in encoded], batch_size):
+        with span('decode_batch', 'model', items=len(bucket)):
+            for i, item in zip(bucket, _decode_batch(model, [encoded[i] for i in bucket], ref_s[bucket])):
+                audio[i] = item
+    return audio
+
+
+def synthesize_batched(pipeline, texts, voice, speed=1, batch_size=DEFAULT_BATCH_SIZE, phoneme_cache=None):
+    """
+    Synthesizes every text in `texts` with batched forward passes over all of their sentences, and returns one
+    float32 array per text, in the original order (empty when a text produced no audio).
+    Pipelines without a torch KModel (e.g. the ONNX engine) synthesize one sentence at a time instead.
+    """
+    if not isinstance(getattr(pipeline, 'model', None), KModel) or batch_size <= 1:
+        return [_concat([np.asarray(a, dtype=np.float32) for a in chunk_audio(pipeline, text, voice, speed,
+                                                                              phoneme_cache)])
+                for text in texts]
+    pack = pipeline.load_voice(voice)
+    owners, phonemes = [], []
+    for t, text in enumerate(texts):
+        for ps in phoneme_cache.phonemize(pipeline, text) if phoneme_cache else phonemize(pipeline, text):
+            owners.append(t)
+            phonemes.append(ps)
+    pieces = [[] for _ in texts]
+    if phonemes:
+        ref_s = torch.cat([pack[len(ps) - 1] for ps in phonemes])
+        for t, audio in zip(owners, forward_batch(pipeline.model, phonemes, ref_s, speed, batch_size)):
+            pieces[t].append(audio.numpy().astype(np.float32))
+    return [_concat(p) for p in pieces]
+
+
+def chunk_audio(pipeline, text, voice, speed=1, phoneme_cache=None):
+    """Yields the audio of text, one pipeline forward pass at a time, with its phonemes from phoneme_cache if given."""
+    if phoneme_cache is None:
+        # G2P and the model, for each sentence
+        for gs, ps, audio in traced_iter(pipeline(text, voice=voice, speed=speed, split_pattern=r'\n\n\n'),
+                                         'pipeline', 'model'):
+            yield audio
+        return
+    for ps in phoneme_cache.phonemize(pipeline, text):
+        for result in traced_iter(pipeline.generate_from_tokens(ps, voice, speed), 'model', 'model'):
+            yield result.audio
+
+
+def _concat(pieces):
+    return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+# Small benchmarks for audiblez synthesis settings, and an end-to-end benchmark of a whole (generated) book.
+# Run with: audiblez bench [<benchmark>] [options], or python -m audiblez.bench <benchmark> [options]
+import argparse
+import html
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+
+import numpy as np
+
+# Dialogue-heavy passage: lots of short sentences, which is where per-sentence inference hurts the most.
+DIALOGUE_SAMPLE = (
+    '"Are you coming?" she asked.\n'
+    '"Yes." He nodded. "In a minute."\n'
+    'She waited by the door. The rain had stopped. Somewhere a dog barked twice, then fell silent.\n'
+    '"Well?"\n'
+    '"I said a minute." He laughed. "You never could wait."\n'
+    '"No. I never could." She smiled, and for a moment neither of them spoke.\n'
+    'Outside, the street lamps flickered on one by one, and the last of the light drained from the sky.\n'
+)
+
+# Narration: long sentences, numbers and abbreviations, the bulk of a typical novel.
+NARRATIVE_SAMPLE = (
+    'The town of Millbrook lay in a shallow valley, some 40 miles north of the coast, where the river slowed and '
+    'widened before turning east. In the spring of 1923 Dr. Harold Finch arrived there with two trunks, a bicycle '
+    'and a letter of introduction that nobody ever asked to see.\n'
+    'He rented the rooms above the bakery on Main St., paid three months in advance, and spent his first week '
+    'walking: along the towpath, up to the quarry, out past the orchards to where the road gave up and became a '
+    'track. People noticed him, of course. In a place that size, everybody noticed everything.\n'
+    'By the end of the month he had been invited to dinner twice, had politely declined to join the choir, and had '
+    'mended the church clock, which had been stuck at a quarter past four for as long as anyone could remember.\n'
+)
+
+
+def _time_synthesis(pipeline, text, voice, speed, **kwargs):
+    from audiblez.core import gen_audio_segments, get_segmenter
+    sentences = get_segmenter().split(text)
+    start = time.perf_counter()
+    segments = gen_audio_segments(pipeline, text, voice, speed, sentences=sentences, **kwargs)
+    elapsed = time.perf_counter() - start
+    samples = sum(len(s) for s in segments)
+    return elapsed, samples, len(sentences)
+
+
+def bench_packing(voice='af_sky', speed=1.0, repeats=3, text=DIALOGUE_SAMPLE):
+    """Compares chars/sec of per-sentence inference against packed inference on the same text."""
+    from audiblez.core import pack_sentences, get_segmenter, get_pipeline
+    pipeline = get_pipeline(voice[0])
+    text = text * repeats
+    # Warm up so the first mode doesn't pay for lazy model/voice loading
+    _time_synthesis(pipeline, DIALOGUE_SAMPLE, voice, speed, pack=False)
+
+    results = {}
+    for mode, pack in [('per_sentence', False), ('packed', True)]:
+        elapsed, samples, n_sentences = _time_synthesis(pipeline, text, voice, speed, pack=pack)
+        calls = len(pack_sentences(get_segmenter().split(text))) if pack else n_sentences
+        results[mode] = {
+            'pipeline_calls': calls,
+            'seconds': round(elapsed, 3),
+            'chars_per_sec': round(len(text) / elapsed, 1),
+            'audio_seconds': round(samples / 24000, 2),
+        }
+    results['speedup'] = round(results['packed']['chars_per_sec'] / results['per_sentence']['chars_per_sec'], 2)
+    return results
+
+
+def make_epub(path, chapters=3, repeats=2):
+    """Writes an EPUB of `chapters` synthetic chapters (narration and dialogue, `repeats` times each) to path."""
+    from ebooklib import epub
+    book = epub.EpubBook()
+    book.set_identifier('audiblez-bench')
+    book.set_title('Millbrook')
+    book.set_language('en')
+    book.add_author('Audiblez Bench')
+    lines = (NARRATIVE_SAMPLE + DIALOGUE_SAMPLE).splitlines() * repeats
+    items = []
+    for n in range(1, chapters + 1):
+        item = epub.EpubHtml(title=f'Chapter {n}', file_name=f'chapter_{n}.xhtml', lang='en')
+        item.content = f'<h1>Chapter {n}</h1>' + ''.join(f'<p>{html.escape(line)}</p>' for line in lines)
+        book.add_item(item)
+        items.append(item)
+    book.toc = items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(str(path), book)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None where the resource module is missing, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KB elsewhere
+
+
+def _package_version(name):
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:  # e.g. running from a source checkout that was never installed
+        return 'unknown'
+
+
+def host_info():
+    import torch
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'audiblez': _package_version('audiblez'),
+        'kokoro': _package_version('kokoro'),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.get_device_name() if torch.cuda.is_available() else None,
+    }
+
+
+@contextmanager
+def _timed(stages, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = round(time.perf_counter() - start, 3)
+
+
+def bench_book(voice='af_sky', speed=1.0, engine=None, chapters=3, repeats=2, batch_size=1):
+    """
+    Converts a generated EPUB to an m4b the way audiblez.core.main does, timing each stage separately: EPUB parsing,
+    chapter text extraction, filters, sentence segmentation, phonemization, inference, WAV writing, and the ffmpeg
+    chapter index and m4b steps (skipped without ffmpeg). Like in main, each chapter's audio is streamed to its file
+    through a ChapterWriter as it is synthesized, so inference and WAV writing are timed chunk by chunk and peak
+    memory doesn't grow with the book. The model is loaded and warmed up before timing starts, and no audio cache
+    is used.
+    realtime_factor is processing time over audio duration: below 1 is faster than real time.
+    """
+    from ebooklib import epub
+    from audiblez import core
+    from audiblez.checkpoint import ChapterWriter
+    from audiblez.phonemes import PhonemeCache, prephonemize_chunks
+    from audiblez.pipelines import default_device
+
+    engine = engine or default_device()
+    core.set_espeak_library()
+    pipeline = core.get_pipeline(voice[0], engine, voice=voice)
+    _time_synthesis(pipeline, DIALOGUE_SAMPLE, voice, speed)  # warm up
+
+    stages = {}
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    with tempfile.TemporaryDirectory() as folder:
+        book_path = Path(folder) / 'bench.epub'
+        make_epub(book_path, chapters, repeats)
+        with _timed(stages, 'epub_parse'):
+            book = epub.read_epub(str(book_path))
+        with _timed(stages, 'extract_texts'):
+            selected = core.find_good_chapters(core.find_document_chapters_and_extract_texts(book))
+        with _timed(stages, 'apply_filters'):
+            texts = [core.apply_filters(c.extracted_text) for c in selected]
+        with _timed(stages, 'segmentation'):
+            chunks = [core.text_chunks(text, sentences)
+                      for text, sentences in zip(texts, core.get_segmenter().split_many(texts))]
+        phoneme_cache = PhonemeCache(str(Path(folder) / 'phonemes.db'))
+        with _timed(stages, 'phonemization'):
+            for chapter_chunks in chunks:
+                prephonemize_chunks(pipeline.lang_code, chapter_chunks, phoneme_cache)
+        wav_files = [Path(folder) / f'bench_chapter_{i}.wav' for i in range(1, len(texts) + 1)]
+        chapter_frames = {}
+        writing = [0.0]
+
+        def timed_writing(method, *args):  # the writes, checkpoints and renames, in between inference
+            write_start = time.perf_counter()
+            result = method(*args)
+            writing[0] += time.perf_counter() - write_start
+            return result
+
+        start = time.perf_counter()
+        for path, text, chapter_chunks in zip(wav_files, texts, chunks):
+            with ChapterWriter(path, core.chapter_fingerprint(voice, speed, chapter_chunks)) as writer:
+                for audio in core.iter_audio_segments(pipeline, text, voice, speed, chunks=chapter_chunks,
+                                                      verbose=False,
+                                                      on_chunk_done=lambda n: timed_writing(writer.checkpoint, n),
+                                                      batch_size=batch_size, phoneme_cache=phoneme_cache):
+                    timed_writing(writer.write, audio)
+                chapter_frames[path] = timed_writing(writer.finish)
+        stages['inference'] = round(time.perf_counter() - start - writing[0], 3)
+        stages['wav_writing'] = round(writing[0], 3)
+        samples = sum(chapter_frames.values())
+        if has_ffmpeg:
+            with _timed(stages, 'create_index_file'):
+                core.create_index_file('Millbrook', 'Audiblez Bench', wav_files, folder, chapter_frames)
+            with _timed(stages, 'create_m4b'):
+                core.create_m4b(wav_files, book_path.name, None, folder)
+        else:
+            stages['create_index_file'] = stages['create_m4b'] = None
+
+    chars = sum(map(len, texts))
+    audio_seconds = samples / core.sample_rate
+    total_seconds = sum(seconds for seconds in stages.values() if seconds is not None)
+    return {
+        'host': host_info(),
+        'settings': {'voice': voice, 'speed': speed, 'engine': engine, 'batch_size': batch_size,
+                     'chapters': len(texts), 'ffmpeg': has_ffmpeg},
+        'chars': chars,
+        'audio_seconds': round(audio_seconds, 2),
+        'stages_seconds': stages,
+        'total_seconds': round(total_seconds, 3),
+        'chars_per_sec': round(chars / total_seconds, 1),
+        'inference_chars_per_sec': round(chars / stages['inference'], 1),
+        'realtime_factor': round(total_seconds / audio_seconds, 4) if audio_seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_intermediates(voice='af_sky', speed=1.0, engine=None, minutes=10):
+    """
+    Writes the same chapter as a WAV and as a FLAC chapter file, a chunk at a time with a checkpoint after each like
+    the writer stage does, then reads each back like the M4B assembly does. Compares the bytes written and the wall
+    time of both. The chapter is synthesized speech repeated to `minutes` long, so FLAC compresses it like a book.
+    """
+    import soundfile
+    from audiblez import core
+    from audiblez.checkpoint import ChapterWriter
+    from audiblez.pipelines import default_device
+
+    engine = engine or default_device()
+    core.set_espeak_library()
+    pipeline = core.get_pipeline(voice[0], engine, voice=voice)
+    text = NARRATIVE_SAMPLE + DIALOGUE_SAMPLE
+    segments = [np.asarray(audio, dtype=np.float32)
+                for audio in core.iter_audio_segments(pipeline, text, voice, speed, verbose=False)]
+    repeats = max(1, round(minutes * 60 * core.sample_rate / sum(map(len, segments))))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for chapter_format in core.chapter_formats:
+            path = Path(folder) / f'bench_chapter.{chapter_format}'
+            stages = {}
+            with _timed(stages, 'write_seconds'):
+                writer = ChapterWriter(path, 'bench')
+                for n, audio in enumerate(segments * repeats, start=1):
+                    writer.write(audio)
+                    writer.checkpoint(n)
+                frames = writer.finish()
+            with _timed(stages, 'read_seconds'):
+                for _ in soundfile.blocks(str(path), blocksize=65536, dtype='int16'):
+                    pass
+            results[chapter_format] = {'bytes_written': path.stat().st_size, **stages}
+    return {
+        'host': host_info(),
+        'settings': {'voice': voice, 'speed': speed, 'engine': engine},
+        'audio_seconds': round(frames / core.sample_rate, 1),
+        **results,
+        'flac_bytes_ratio': round(results['flac']['bytes_written'] / results['wav']['bytes_written'], 3),
+    }
+
+
+def _log_mel_spectrogram(audio, n_fft=1024, hop=256, n_mels=80, sample_rate=24000):
+    audio = np.asarray(audio, dtype=np.float32)
+    if len(audio) < n_fft:
+        audio = np.pad(audio, (0, n_fft - len(audio)))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[::hop] * np.hanning(n_fft)
+    power = np.abs(np.fft.rfft(frames, axis=-1)) ** 2
+    # Triangular mel filterbank
+    mel = lambda f: 2595 * np.log10(1 + f / 700)
+    hz = lambda m: 700 * (10 ** (m / 2595) - 1)
+    edges = hz(np.linspace(mel(0), mel(sample_rate / 2), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    filters = np.maximum(0, np.minimum((bins - lower) / (center - lower), (upper - bins) / (upper - center)))
+    log_mel = 10 * np.log10(power @ filters.T + 1e-10)
+    return np.maximum(log_mel, log_mel.max() - 80)  # an 80 dB dynamic range, so near-silent bands don't dominate
+
+
+def log_spectral_distance(reference, audio):
+    """
+    Mean RMS difference, in dB, between the log-mel spectra of two renditions of the same text, after aligning
+    their frames with dynamic time warping (durations are predicted, so the two rarely have the same length).
+    """
+    ref, test = _log_mel_spectrogram(reference), _log_mel_spectrogram(audio)
+    cost = np.sqrt(((ref[:, None, :] - test[None, :, :]) ** 2).mean(axis=-1))
+    n, m = cost.shape
+    total = np.full((n + 1, m + 1), np.inf)
+    steps = np.zeros((n + 1, m + 1))
+    total[0, 0] = 0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            prev = min((total[i - 1, j - 1], i - 1, j - 1), (total[i - 1, j], i - 1, j), (total[i, j - 1], i, j - 1))
+            total[i, j] = cost[i - 1, j - 1] + prev[0]
+            steps[i, j] = steps[prev[1], prev[2]] + 1
+    return float(total[n, m] / steps[n, m])
+
+
+def bench_quantize(voices=('af_sky',), speed=1.0, repeats=3, text=DIALOGUE_SAMPLE):
+    """
+    For each voice, compares chars/sec of the regular CPU model against the int8-quantized one, and measures how
+    much the quantized audio differs: log-spectral distance (dB, lower is closer) and change in total duration.
+    """
+    from audiblez.core import get_pipeline
+    text = text * repeats
+    segments = {}
+    results = {voice: {} for voice in voices}
+    for engine in ['cpu', 'int8']:
+        for voice in voices:
+            pipeline = get_pipeline(voice[0], engine, voice=voice)
+            _time_synthesis(pipeline, DIALOGUE_SAMPLE, voice, speed)  # warm up
+            start = time.perf_counter()
+            segments[engine, voice] = [audio for _, _, audio in pipeline(text, voice=voice, speed=speed)]
+            elapsed = time.perf_counter() - start
+            results[voice][f'{engine}_chars_per_sec'] = round(len(text) / elapsed, 1)
+
+    for voice in voices:
+        reference, quantized = segments['cpu', voice], segments['int8', voice]
+        distances = [log_spectral_distance(r, q) for r, q in zip(reference, quantized)]
+        ref_samples, q_samples = sum(map(len, reference)), sum(map(len, quantized))
+        results[voice].update({
+            'speedup': round(results[voice]['int8_chars_per_sec'] / results[voice]['cpu_chars_per_sec'], 2),
+            'log_spectral_distance_db': round(float(np.mean(distances)), 2),
+            'duration_change_pct': round(100 * (q_samples - ref_samples) / ref_samples, 2),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='audiblez bench', description='audiblez benchmarks. Results are printed as '
+                                     'JSON; progress messages go to stderr.')
+    parser.add_argument('--json', default=None, help='Also write the results to this file', metavar='FILE')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', default=argparse.SUPPRESS, help='Also write the results to this file', metavar='FILE')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    book = subparsers.add_parser('book', parents=[common],
+                                 help='End-to-end conversion of a generated EPUB, timed stage by stage (the default)')
+    book.add_argument('-v', '--voice', default='af_sky')
+    book.add_argument('-s', '--speed', default=1.0, type=float)
+    book.add_argument('-e', '--engine', default=None, choices=['cpu', 'cuda', 'int8', 'onnx'], help='(default: cpu)')
+    book.add_argument('-c', '--chapters', default=3, type=int)
+    book.add_argument('-r', '--repeats', default=2, type=int, help='How many times the sample text is repeated per chapter')
+    book.add_argument('-b', '--batch-size', default=1, type=int)
+
+    packing = subparsers.add_parser('packing', parents=[common], help='Per-sentence vs packed inference throughput')
+    packing.add_argument('-v', '--voice', default='af_sky')
+    packing.add_argument('-s', '--speed', default=1.0, type=float)
+    packing.add_argument('-r', '--repeats', default=3, type=int, help='How many times the sample text is repeated')
+
+    quantize = subparsers.add_parser('quantize', parents=[common], help='Regular vs int8-quantized CPU model: throughput and audio difference')
+    quantize.add_argument('-v', '--voices', default='af_sky', help='Comma-separated list of voices to compare')
+    quantize.add_argument('-s', '--speed', default=1.0, type=float)
+    quantize.add_argument('-r', '--repeats', default=3, type=int, help='How many times the sample text is repeated')
+
+    intermediates = subparsers.add_parser('intermediates', parents=[common],
+                                          help='WAV vs FLAC chapter files: bytes written, write and read time')
+    intermediates.add_argument('-v', '--voice', default='af_sky')
+    intermediates.add_argument('-s', '--speed', default=1.0, type=float)
+    intermediates.add_argument('-e', '--engine', default=None, choices=['cpu', 'cuda', 'int8', 'onnx'], help='(default: cpu)')
+    intermediates.add_argument('-m', '--minutes', default=10, type=float, help='Length of the chapter written, in minutes of audio')
+
+    args = parser.parse_args(argv)
+    with redirect_stdout(sys.stderr):  # keep stdout for the JSON
+        if args.benchmark == 'packing':
+            results = bench_packing(voice=args.voice, speed=args.speed, repeats=args.repeats)
+        elif args.benchmark == 'quantize':
+            results = bench_quantize(voices=args.voices.split(','), speed=args.speed, repeats=args.repeats)
+        elif args.benchmark == 'intermediates':
+            results = bench_intermediates(voice=args.voice, speed=args.speed, engine=args.engine, minutes=args.minutes)
+        elif args.benchmark == 'book':
+            results = bench_book(voice=args.voice, speed=args.speed, engine=args.engine, chapters=args.chapters,
+                                 repeats=args.repeats, batch_size=args.batch_size)
+        else:
+            results = bench_book()
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.json:
+        Path(args.json).write_text(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Crash-safe, resumable writing of chapter audio files.
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+sample_rate = 24000
+
+
+class ChapterWriter:
+    """
+    Writes a chapter WAV so that a crash never leaves a truncated file under the final name.
+    Audio goes to `<chapter>.wav.part`; after every chunk of text the file is flushed and `<chapter>.wav.journal`
+    records how many chunks are done and how many samples they produced. finish() renames the .part file to the
+    final name. If a previous run was interrupted with the same fingerprint (same chunks, voice and speed),
+    the .part file is truncated to the last checkpoint and synthesis resumes from chunks_done.
+    A chapter path ending in .flac is written as lossless FLAC instead. libsndfile can't reopen an unfinished FLAC
+    file, so those chapters restart from the beginning after a crash and keep no journal.
+    """
+
+    def __init__(self, chapter_wav_path, fingerprint):
+        self.path = Path(chapter_wav_path)
+        self.part_path = self.path.with_name(self.path.name + '.part')
+        self.journal_path = self.path.with_name(self.path.name + '.journal')
+        self.fingerprint = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+        self.format = 'FLAC' if self.path.suffix.lower() == '.flac' else 'WAV'
+        self.chunks_done = 0
+        self.frames = 0
+        self._out = None
+        self._resume()
+
+    def _resume(self):
+        if self.format != 'WAV':
+            return
+        try:
+            journal = json.loads(self.journal_path.read_text())
+        except (OSError, ValueError):
+            return
+        if journal.get('fingerprint') != self.fingerprint or not journal.get('frames'):
+            return
+        try:
+            out = soundfile.SoundFile(self.part_path, 'r+')
+        except (OSError, RuntimeError):
+            return
+        if out.frames < journal['frames']:
+            out.close()
+            return
+        out.seek(journal['frames'])
+        out.truncate()  # drop whatever was written after the last checkpoint
+        self._out = out
+        self.chunks_done = journal['chunks_done']
+        self.frames = journal['frames']
+
+    def write(self, audio):
+        # Quantized like the audio cache's entries, rather than by libsndfile, which rounds differently for each format
+        pcm = np.round(np.clip(np.asarray(audio, dtype=np.float32), -1, 1) * 32767).astype(np.int16)
+        if self._out is None:
+            self._out = soundfile.SoundFile(self.part_path, 'w', samplerate=sample_rate, channels=1, format=self.format,
+                                            subtype='PCM_16')
+        self._out.write(pcm)
+        self.frames += len(pcm)
+
+    def checkpoint(self, chunks_done):
+        """Records that the first chunks_done chunks are safely on disk."""
+        self.chunks_done = chunks_done
+        if self.format != 'WAV':
+            return  # not resumable, see _resume
+        if self._out is not None:
+            self._out.flush()
+        journal = {'fingerprint': self.fingerprint, 'chunks_done': chunks_done, 'frames': self.frames}
+        tmp_path = self.journal_path.with_name(self.journal_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(journal))
+        os.replace(tmp_path, self.journal_path)
+
+    def finish(self):
+        """Moves the completed chapter to its final path and returns its number of samples (0: no file written)."""
+        self.close()
+        if self.frames:
+            os.replace(self.part_path, self.path)
+        else:
+            self.part_path.unlink(missing_ok=True)
+        self.journal_path.unlink(missing_ok=True)
+        return self.frames
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()  # keeps the .part file and journal around, for the next run to resume from
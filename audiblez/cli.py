@@ -4,14 +4,25 @@ import sys
 import torch # Added for torch.set_default_device and torch.cuda.is_available
 
 from audiblez.voices import voices, available_voices_str
+from audiblez.silence import DEFAULT_SENTENCE_GAP, DEFAULT_PARAGRAPH_GAP
 from audiblez.database import load_all_user_settings # Added
 
+def threads_arg(value):
+    return value if value == 'auto' else int(value)
+
+
 def cli_main():
+    if sys.argv[1:2] == ['bench']:
+        from audiblez.bench import main as bench_main
+        return bench_main(sys.argv[2:])
+
     voices_str = ', '.join(voices)
     epilog = ('example:\n' +
               '  audiblez book.epub -l en-us -v af_sky\n\n' +
               'to run GUI just run:\n'
               '  audiblez-ui\n\n' +
+              'to benchmark this machine (JSON results, see audiblez bench -h):\n'
+              '  audiblez bench\n\n' +
               'available voices:\n' +
               available_voices_str)
 
@@ -30,24 +41,55 @@ def cli_main():
 
 
     parser = argparse.ArgumentParser(epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('epub_file_path', help='Path to the epub file')
+    parser.add_argument('epub_file_path', nargs='+', help='Path to the epub file (several with --dry-run)')
     parser.add_argument('-v', '--voice', default=default_voice_from_db, help=f'Choose narrating voice: {voices_str} (default: {default_voice_from_db})')
     parser.add_argument('-p', '--pick', default=False, help=f'Interactively select which chapters to read in the audiobook', action='store_true')
     parser.add_argument('-s', '--speed', default=default_speed_from_db, help=f'Set speed from 0.5 to 2.0 (default: {default_speed_from_db})', type=float)
     # For CUDA, default is False. We handle DB setting after parsing args.
     parser.add_argument('-c', '--cuda', default=False, help=f'Use GPU via Cuda in Torch if available', action='store_true')
+    parser.add_argument('--quantize', default=False, help='Run on CPU with a dynamically int8-quantized model: faster, with slightly different audio', action='store_true')
+    parser.add_argument('--onnx', default=False, help='Run on CPU with ONNX Runtime (the model is exported to ~/.audiblez/models on first use)', action='store_true')
+    parser.add_argument('-t', '--threads', default=None, type=threads_arg, help='Number of torch threads, or "auto" to time a few thread counts once and save the fastest (default: the saved value, else torch\'s default)', metavar='N')
+    parser.add_argument('--interop-threads', default=None, type=int, help='Number of torch inter-op threads (default: the saved value, else torch\'s default)', metavar='N')
     parser.add_argument('-o', '--output', default='.', help='Output folder for the audiobook and temporary files', metavar='FOLDER')
+    parser.add_argument('--cache-size', default=None, type=int, help='Size limit of the sentence audio cache in ~/.audiblez, in MB. 0 disables it (default: 2048, or the value saved in settings)', metavar='MB')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='Number of worker processes synthesizing chapters in parallel (default: 1)', metavar='N')
+    parser.add_argument('--sentence-gap', default=None, type=float, help=f'Trim the silence the model leaves around each chunk (a few sentences read in one pass) and put SECONDS of silence between chunks instead. Pauses between the sentences of a chunk are the model\'s own (default: off, {DEFAULT_SENTENCE_GAP} with --paragraph-gap)', metavar='SECONDS')
+    parser.add_argument('--paragraph-gap', default=None, type=float, help=f'Like --sentence-gap, with SECONDS of silence before a chunk that starts a paragraph (default: off, {DEFAULT_PARAGRAPH_GAP} with --sentence-gap)', metavar='SECONDS')
+    parser.add_argument('--dry-run', default=False, help='Only print the chapters with their length, sentence count, and estimated audio duration and synthesis time, without loading the model', action='store_true')
+    parser.add_argument('--trace', default=None, help='Record where the time goes (chapters, batches, model calls, filters, ffmpeg, database) to FILE, in the Chrome trace format that ui.perfetto.dev opens', metavar='FILE')
+    default_m4b_method = db_settings.get('m4b_assembly_method') or 'original'
+    parser.add_argument('--m4b-assembly', default=default_m4b_method, choices=['original', 'crispy', 'pipe', 'parallel', 'stream'], help=f'How the M4B is assembled: "original" and "crispy" join the chapter WAVs then encode them, "pipe" encodes them without joining them first, "parallel" encodes the chapter WAVs on every CPU then joins them, only encoding again the chapters that changed since the last build, "stream" encodes the audio as it is synthesized, without chapter WAVs (default: {default_m4b_method})', metavar='METHOD')
+    parser.add_argument('--chapter-format', default=None, choices=['wav', 'flac'], help='Format of the chapter files the M4B is assembled from: "flac" is lossless and about half the size of "wav" (default: the saved setting, else wav)', metavar='FORMAT')
+    parser.add_argument('-b', '--batch-size', default=1, type=int, help='Synthesize up to N sentences of similar length per forward pass (default: 1, no batching)', metavar='N')
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
     args = parser.parse_args()
+    silence_gaps = None
+    if args.sentence_gap is not None or args.paragraph_gap is not None:
+        silence_gaps = (DEFAULT_SENTENCE_GAP if args.sentence_gap is None else args.sentence_gap,
+                        DEFAULT_PARAGRAPH_GAP if args.paragraph_gap is None else args.paragraph_gap)
+    if len(args.epub_file_path) > 1 and not args.dry_run:
+        parser.error('converting several epub files at once is not supported, only estimating them with --dry-run')
 
     # CUDA/Engine Handling Logic
     use_cuda_from_cli = args.cuda # True if --cuda is present
     engine_from_db = db_settings.get('engine')
+    engine = None  # None: whatever torch default device is set below
 
-    if use_cuda_from_cli:
+    if args.onnx:
+        print('Using ONNX Runtime on CPU (specified by user via --onnx).')
+        torch.set_default_device('cpu')
+        engine = 'onnx'
+    elif args.quantize:
+        if use_cuda_from_cli:
+            print('--quantize runs on CPU, ignoring --cuda.')
+        print('Using dynamic int8 quantization on CPU (specified by user via --quantize).')
+        torch.set_default_device('cpu')
+        engine = 'int8'
+    elif use_cuda_from_cli:
         if torch.cuda.is_available():
             print('CUDA GPU available (specified by user via --cuda). Using CUDA.')
             torch.set_default_device('cuda')
@@ -61,15 +103,47 @@ def cli_main():
         else:
             print('CUDA GPU not available (from database settings, but unavailable). Defaulting to CPU.')
             torch.set_default_device('cpu')
+    elif engine_from_db in ('int8', 'onnx'):
+        print(f'Using the {engine_from_db} engine on CPU (from database settings).')
+        torch.set_default_device('cpu')
+        engine = engine_from_db
     else:
         # Default to CPU if --cuda not used and DB setting is not 'cuda' or not present
         print('Defaulting to CPU (no CUDA specified by user and not set to CUDA in DB).')
         torch.set_default_device('cpu')
 
 
-    from core import main # Consider moving core import to top if it's safe / no circular deps
+    if args.trace:
+        from audiblez.tracing import tracer
+        tracer.enable()
+
+    threads = args.threads
+    if threads == 'auto' and not args.dry_run:
+        from core import autotune_threads, set_espeak_library
+        set_espeak_library()
+        threads, _ = autotune_threads(args.voice, engine)
+
+    from core import main, estimate_books # Consider moving core import to top if it's safe / no circular deps
     # Pass the potentially modified args.voice and args.speed
-    main(file_path=args.epub_file_path, voice=args.voice, pick_manually=args.pick, speed=args.speed, output_folder=args.output)
+    try:
+        estimates = []
+        for file_path in args.epub_file_path:
+            if len(args.epub_file_path) > 1:
+                print(f'\n{file_path}')
+            estimate = main(file_path=file_path, voice=args.voice, pick_manually=args.pick, speed=args.speed,
+                            output_folder=args.output, workers=args.workers, audio_cache_mb=args.cache_size,
+                            engine=engine, threads=threads, interop_threads=args.interop_threads,
+                            batch_size=args.batch_size, dry_run=args.dry_run, m4b_assembly_method=args.m4b_assembly,
+                            chapter_format=args.chapter_format,
+                            silence_gaps=silence_gaps)
+            if estimate:  # None when no chapters were found
+                estimates.append(estimate)
+        if len(args.epub_file_path) > 1 and estimates:
+            print()
+            estimate_books(estimates)
+    finally:
+        if args.trace:
+            tracer.save(args.trace)
 
 
 if __name__ == '__main__':
@@ -17,27 +17,166 @@ import shutil
 import subprocess
 import platform
 import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from queue import Empty, Full, Queue
 from io import StringIO
 from types import SimpleNamespace
 from tabulate import tabulate
 from pathlib import Path
 from string import Formatter
 from bs4 import BeautifulSoup
-from kokoro import KPipeline
 from ebooklib import epub
 from pick import pick
 import importlib.resources # Added for accessing package data files
+import importlib.metadata
 import markdown # Added for unmark function
 
-from audiblez.database import load_user_setting # Added
+from audiblez.database import load_user_setting, save_user_setting, load_measured_rate, save_measured_rate
+from audiblez.audio_cache import AudioCache, DEFAULT_MAX_MB
+from audiblez.batching import chunk_audio, synthesize_batched
+from audiblez.checkpoint import ChapterWriter
+from audiblez.m4b import (EncodedChapterCache, StreamingM4bEncoder, chapter_bounds_ms, create_m4b_parallel,
+                          create_m4b_piped, write_index_file)
+from audiblez.phonemes import phoneme_cache, prephonemize_chunks
+from audiblez.silence import SilenceTrimmer
+from audiblez.tracing import span, traced, tracer
+from audiblez.pipelines import get_pipeline, registry as pipeline_registry, voice_cache, default_device, engine_device
 
 sample_rate = 24000
+# Formats of the chapter files, see ChapterWriter: WAV, or FLAC for about half the bytes
+chapter_formats = ('wav', 'flac')
+# Kokoro's context is 510 phoneme tokens; ~400 characters of text stays comfortably below it for every language.
+pack_max_chars = 400
+# With batched synthesis, this many batches worth of chunks are phonemized and bucketed by length together
+batch_window = 4
+# Bounds of the queues between the text, synthesis and writing stages of synthesize_chapters_pipelined
+prepare_ahead_chapters = 1
+write_queue_chunks = 16
+# Weight of the latest batch in the moving average of the synthesis speed that drives the ETA
+throughput_alpha = 0.2
+# Shortest interval the speed of a pool of workers is measured over: their progress events arrive in bursts
+pool_rate_seconds = 1.0
+# Rough speaking rate of the voices at speed 1.0, used to predict the audio duration before synthesis
+spoken_chars_per_sec = 15
+
+
+class SentenceSegmenter:
+    """Sentence splitter built on a blank multilingual spaCy pipeline with only the sentencizer."""
+
+    def __init__(self):
+        self.nlp = spacy.blank('xx')
+        self.nlp.add_pipe('sentencizer')
+        # No parser or NER in the pipeline, so long chapters don't need the default memory guard.
+        self.nlp.max_length = 50_000_000
+
+    def split(self, text):
+        return [sent.text for sent in self.nlp(text).sents]
+
+    def split_many(self, texts, batch_size=16):
+        """Segments several texts (e.g. all selected chapters) in a single nlp.pipe batch."""
+        return [[sent.text for sent in doc.sents] for doc in self.nlp.pipe(texts, batch_size=batch_size)]
+
+
+_segmenter = None
+_segmenter_lock = threading.Lock()
+
+
+def get_segmenter():
+    """Returns the process-wide SentenceSegmenter, building it on first use."""
+    global _segmenter
+    with _segmenter_lock:
+        if _segmenter is None:
+            _segmenter = SentenceSegmenter()
+        return _segmenter
+
+
+def model_version(engine=None):
+    """
+    Identifies the acoustic model, so cached audio is invalidated when kokoro is upgraded or the engine changes.
+    The torch engines (cpu, cuda) run the same model and share entries; int8 and onnx run models of their own
+    (quantized layers, or the ONNX export with its swapped STFT and norms), so each gets its own.
+    """
+    version = f"hexgrad/Kokoro-82M@kokoro-{importlib.metadata.version('kokoro')}"
+    return f'{version}+{engine}' if engine in ('int8', 'onnx') else version
+
+
+def open_audio_cache(max_mb=None, engine=None):
+    """Returns the AudioCache for this run, or None when it's disabled (max_mb == 0)."""
+    if max_mb is None:
+        max_mb = load_user_setting('audio_cache_max_mb')
+    max_mb = DEFAULT_MAX_MB if max_mb is None else int(max_mb)
+    if max_mb <= 0:
+        return None
+    return AudioCache(model_version(engine), max_bytes=max_mb * 1024 * 1024)
+
+
+def apply_thread_settings(threads=None, interop_threads=None):
+    """
+    Sets torch's intra-op and inter-op thread counts from the arguments, or else from the saved settings
+    (torch_threads, torch_interop_threads). When neither is set torch keeps its defaults.
+    Returns the configured intra-op thread count, or None.
+    """
+    threads = threads or load_user_setting('torch_threads')
+    interop_threads = interop_threads or load_user_setting('torch_interop_threads')
+    if threads:
+        torch.set_num_threads(int(threads))
+    if interop_threads and int(interop_threads) != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(int(interop_threads))
+        except RuntimeError:
+            # torch only accepts this before its first parallel work, e.g. not for the second book of a UI session
+            print(f'Could not change inter-op threads to {interop_threads} after torch started, '
+                  f'keeping {torch.get_num_interop_threads()}')
+    print(f'Using {torch.get_num_threads()} torch threads ({torch.get_num_interop_threads()} inter-op)')
+    return int(threads) if threads else None
+
+
+# Fixed passage for autotune_threads, so that timings are comparable between runs
+AUTOTUNE_PASSAGE = (
+    'The old lighthouse keeper climbed the stairs every evening at dusk. '
+    'From the top he could see the whole bay: the fishing boats coming home, the gulls circling the harbour, '
+    'and far away, the dark line of the mainland. "Another quiet night," he said to no one in particular, '
+    'and lit the lamp.'
+)
+
+
+def autotune_threads(voice='af_sky', engine=None, candidates=None, save=True):
+    """
+    Synthesizes AUTOTUNE_PASSAGE with several torch thread counts and returns (fastest, {threads: chars_per_sec}).
+    The fastest count is saved as the torch_threads setting, so this only needs to run once per machine.
+    """
+    cpu_count = os.cpu_count() or 1
+    if not candidates:
+        candidates = sorted({n for n in (1, 2, 4, 8, 16, 32, 64) if n < cpu_count} | {max(1, cpu_count // 2), cpu_count})
+    sentences = get_segmenter().split(AUTOTUNE_PASSAGE)
+    original_threads = torch.get_num_threads()
+    results = {}
+    print(f'Auto-tuning torch threads, trying {candidates}')
+    try:
+        for n in candidates:
+            torch.set_num_threads(n)  # the registry rebuilds an onnx session for the new count
+            pipeline = get_pipeline(voice[0], engine, voice=voice)
+            timings = []
+            for _ in range(2):  # the first run also warms up the pipeline
+                start = time.perf_counter()
+                gen_audio_segments(pipeline, AUTOTUNE_PASSAGE, voice, 1.0, sentences=sentences)
+                timings.append(time.perf_counter() - start)
+            results[n] = len(AUTOTUNE_PASSAGE) / min(timings)
+            print(f'{n} threads: {results[n]:.0f} chars/sec')
+    finally:
+        torch.set_num_threads(original_threads)
+    best = max(results, key=results.get)
+    print(f'Fastest: {best} threads ({results[best]:.0f} chars/sec)')
+    if save:
+        save_user_setting('torch_threads', best)
+    return best, results
 
 
 def load_spacy():
-    if not spacy.util.is_package("xx_ent_wiki_sm"):
-        print("Downloading Spacy model xx_ent_wiki_sm...")
-        spacy.cli.download("xx_ent_wiki_sm")
+    # The blank 'xx' pipeline ships with spaCy, so there is nothing to download anymore: just warm up the segmenter.
+    return get_segmenter()
 
 
 def set_espeak_library():
@@ -73,14 +212,26 @@ def set_espeak_library():
         print("On Linux: sudo apt install espeak-ng")
 
 
+@traced('main', 'run')
 def main(file_path, voice, pick_manually, speed, output_folder='.',
          max_chapters=None, max_sentences=None, selected_chapters=None, post_event=None,
          calibre_metadata: dict | None = None, calibre_cover_image_path: str | None = None,
-         m4b_assembly_method: str = 'original'):
+         m4b_assembly_method: str = 'original', workers: int = 1, audio_cache_mb: int | None = None,
+         engine: str | None = None, threads: int | None = None, interop_threads: int | None = None,
+         batch_size: int = 1, dry_run: bool = False,
+         silence_gaps: tuple | None = None, chapter_format: str | None = None):
+    """
+    Converts file_path to an audiobook. With dry_run, only extracts, selects and filters the chapters, then prints
+    and returns the estimate of estimate_book without loading the model.
+    silence_gaps=(sentence_gap, paragraph_gap) in seconds replaces the silence around each chunk of packed sentences;
+    None (the default) keeps the model's own pauses.
+    m4b_assembly_method 'original' or 'crispy' joins the chapter WAVs then encodes them, 'pipe' encodes them without
+    joining them first, 'parallel' encodes the chapters in parallel then joins them, 'stream' encodes the audio as it
+    is synthesized, without chapter WAVs (see m4b.py).
+    chapter_format is the format of the chapter files, one of chapter_formats (default: the saved setting, else 'wav').
+    """
     if post_event: post_event('CORE_STARTED')
     load_spacy()
-    if output_folder != '.':
-        Path(output_folder).mkdir(parents=True, exist_ok=True)
 
     filename = Path(file_path).name # Original filename, used for output naming
     title = "Untitled Book"
@@ -123,7 +274,8 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
 
     else: # Standard EPUB workflow
         print("Processing with EPUB data.")
-        book = epub.read_epub(file_path)
+        with span('read_epub', 'text'):
+            book = epub.read_epub(file_path)
         meta_title_dc = book.get_metadata('DC', 'title')
         title = meta_title_dc[0][0] if meta_title_dc else title
         meta_creator_dc = book.get_metadata('DC', 'creator')
@@ -148,53 +300,44 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
         return
     print_selected_chapters(document_chapters, selected_chapters)
     texts = [c.extracted_text for c in selected_chapters]
+    if dry_run:
+        return estimate_book(selected_chapters, title, creator, voice, speed, engine or default_device(), max_chapters,
+                             workers)
+    if output_folder != '.':
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
 
     has_ffmpeg = shutil.which('ffmpeg') is not None
     if not has_ffmpeg:
         print('\033[91m' + 'ffmpeg not found. Please install ffmpeg to create mp3 and m4b audiobook files.' + '\033[0m')
-
-    # Load custom rate from database and determine chars_per_sec for stats
-    db_custom_rate = load_user_setting('custom_rate')
-    default_chars_per_sec = 500 if torch.cuda.is_available() else 50
-    current_chars_per_sec = default_chars_per_sec
-
-    if db_custom_rate is not None:
-        try:
-            rate_from_db = int(db_custom_rate)
-            if rate_from_db > 0:
-                current_chars_per_sec = rate_from_db
-                print(f"Using custom characters-per-second rate from database: {current_chars_per_sec}")
-            else:
-                print(f"Invalid custom rate from database ({db_custom_rate}), using default: {default_chars_per_sec}")
-        except ValueError:
-            print(f"Could not parse custom rate from database ('{db_custom_rate}'), using default: {default_chars_per_sec}")
-    else:
-        print(f"No custom rate in database, using default: {default_chars_per_sec}")
-
+    # 'stream' encodes the audio as it is synthesized, chapter after chapter, instead of writing chapter WAVs
+    streaming = m4b_assembly_method == 'stream' and has_ffmpeg
+    if streaming and workers and workers > 1:
+        print('The stream M4B assembly method encodes the chapters in order as they are read, ignoring workers.')
+        workers = 1
+
+    engine = engine or default_device()  # 'cpu', 'cuda', 'int8' or 'onnx', see pipelines.ENGINES
+    initial_chars_per_sec = starting_chars_per_sec(engine, voice[0], workers or 1)
     stats = SimpleNamespace(
         total_chars=sum(map(len, texts)),
         processed_chars=0,
-        chars_per_sec=current_chars_per_sec # Use the determined rate
+        chars_per_sec=initial_chars_per_sec  # refined as chunks are synthesized, see update_throughput
     )
     print('Started at:', time.strftime('%H:%M:%S'))
     print(f'Total characters: {stats.total_chars:,}')
     print('Total words:', len(' '.join(texts).split()))
     eta = strfdelta((stats.total_chars - stats.processed_chars) / stats.chars_per_sec)
-    print(f'Estimated time remaining (assuming {stats.chars_per_sec} chars/sec): {eta}')
+    print(f'Estimated time remaining (assuming {stats.chars_per_sec:.0f} chars/sec): {eta}')
     set_espeak_library()
-    pipeline = KPipeline(lang_code=voice[0])  # a for american or b for british etc.
+    threads = apply_thread_settings(threads, interop_threads)
+    audio_cache = open_audio_cache(audio_cache_mb, engine)
+    chapter_format = chapter_format or load_user_setting('chapter_format') or 'wav'
 
     chapter_wav_files = []
+    pending_chapters = []  # (i, chapter, chapter_wav_path, text, filtered_text) still to be synthesized
     for i, chapter in enumerate(selected_chapters, start=1):
         if max_chapters and i > max_chapters: break
         text = chapter.extracted_text
-        # Use chapter.title if get_name() is not available (for ChapterForCore objects from queue or Calibre)
-        if hasattr(chapter, 'get_name') and callable(chapter.get_name): # For EPUB chapters
-            original_name = chapter.get_name()
-        elif hasattr(chapter, 'title') and chapter.title: # For Calibre SimpleNamespace chapters or queued chapters
-            original_name = chapter.title
-        else:
-            original_name = f"chapter_{i}" # Fallback if neither is present
+        original_name = chapter_name(chapter, i)
 
         # Sanitize original_name for use in filename
         # Replace common problematic characters, limit length
@@ -205,8 +348,10 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
         # Determine output filename based on original input filename's stem
         base_filename_stem = Path(filename).stem # e.g., "mybook" from "mybook.epub" or "mybook.mobi"
 
-        chapter_wav_path = Path(output_folder) / f'{base_filename_stem}_chapter_{i}_{voice}_{safe_original_name}.wav'
-        chapter_wav_files.append(chapter_wav_path)
+        chapter_wav_path = Path(output_folder) / f'{base_filename_stem}_chapter_{i}_{voice}_{safe_original_name}.{chapter_format}'
+        # A chapter completed by an earlier run counts whatever its format
+        existing_paths = [p for p in (chapter_wav_path.with_suffix(f'.{f}') for f in chapter_formats) if p.exists()]
+        chapter_wav_files.append(existing_paths[0] if existing_paths and not streaming else chapter_wav_path)
 
         # Apply filters before checking length or existence, so stats are based on filtered text length
         # (though current stats.processed_chars uses pre-filter length if skipping)
@@ -214,15 +359,7 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
             # add intro text
             text = f'{title} – {creator}.\n\n' + text
 
-        # Apply filters to the chapter text
-        # The default filter_file_path in apply_filters is "audiblez/filter.txt"
-        filtered_text = apply_filters(text)
-        # It might be useful to know if text changed:
-        # if filtered_text != text:
-        #    print(f"DEBUG: Filters applied to chapter {i}. Original length: {len(text)}, New length: {len(filtered_text)}")
-        # text = filtered_text # Use filtered text from here
-
-        if Path(chapter_wav_path).exists():
+        if not streaming and existing_paths:
             print(f'File for chapter {i} already exists. Skipping')
             # Note: stats.processed_chars here will use original text length if we don't update 'text' var earlier
             stats.processed_chars += len(text) # Original text length for skip consistency
@@ -230,6 +367,10 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
                 post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
             continue
 
+        # Apply filters to the chapter text
+        # The default filter_file_path in apply_filters is "audiblez/filter.txt"
+        filtered_text = apply_filters(text)
+
         # Use filtered text for length check and processing
         if len(filtered_text.strip()) < 10:
             print(f'Skipping empty chapter {i} (after filtering)')
@@ -237,33 +378,333 @@ def main(file_path, voice, pick_manually, speed, output_folder='.',
             # Potentially add original length to processed_chars if skipping here, or adjust logic
             # For now, skipping means it doesn't contribute to processed_chars beyond initial estimate
             continue
-
-        start_time = time.time()
-        if post_event: post_event('CORE_CHAPTER_STARTED', chapter_index=chapter.chapter_index)
-        audio_segments = gen_audio_segments(
-            pipeline, filtered_text, voice, speed, stats, post_event=post_event, max_sentences=max_sentences)
-        if audio_segments:
-            final_audio = np.concatenate(audio_segments)
-            soundfile.write(chapter_wav_path, final_audio, sample_rate)
-            end_time = time.time()
-            delta_seconds = end_time - start_time
-            chars_per_sec = len(text) / delta_seconds
-            print('Chapter written to', chapter_wav_path)
-            if post_event: post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
-            print(f'Chapter {i} read in {delta_seconds:.2f} seconds ({chars_per_sec:.0f} characters per second)')
+        pending_chapters.append((i, chapter, chapter_wav_path, text, filtered_text))
+    # How many chapters are read at once, which the measured speed is saved for
+    rate_workers = min(workers, len(pending_chapters)) if workers and workers > 1 and len(pending_chapters) > 1 else 1
+
+    encoder = None
+    open_chapter = ChapterWriter
+    if streaming:
+        encoder = StreamingM4bEncoder(output_folder, filename, title, creator, cover_image)
+        open_chapter = lambda chapter_wav_path, fingerprint: encoder.chapter()
+    try:
+        if rate_workers > 1:
+            # Segment every chapter that still needs synthesis in one batch, with the shared segmenter.
+            chapter_sentences = get_segmenter().split_many([p[4] for p in pending_chapters])
+            jobs = [(i, chapter.chapter_index, chapter_wav_path, filtered_text, sentences)
+                    for (i, chapter, chapter_wav_path, text, filtered_text), sentences in zip(pending_chapters, chapter_sentences)]
+            written = synthesize_chapters_in_pool(jobs, voice, speed, stats, workers, post_event, max_sentences,
+                                                  audio_cache, engine, threads, batch_size, silence_gaps)
         else:
-            print(f'Warning: No audio generated for chapter {i}')
+            pipeline = get_pipeline(voice[0], engine, voice=voice)  # a for american or b for british etc.
+            # Chapters are segmented and phonemized one ahead of synthesis, in the text stage
+            jobs = [(i, chapter.chapter_index, chapter_wav_path, filtered_text, None)
+                    for i, chapter, chapter_wav_path, text, filtered_text in pending_chapters]
+            written = synthesize_chapters_pipelined(pipeline, jobs, voice, speed, stats, post_event, max_sentences,
+                                                    audio_cache, batch_size, phoneme_cache, silence_gaps,
+                                                    open_chapter)
+    except BaseException:
+        if encoder is not None:
+            encoder.abort()
+        raise
+    finally:
+        if stats.chars_per_sec != initial_chars_per_sec:  # something was actually synthesized
+            save_measured_rate(engine, voice[0], stats.chars_per_sec, rate_workers)
+            print(f'Measured synthesis speed: {stats.chars_per_sec:.0f} chars/sec (saved for the next run)')
+    for i, chapter, chapter_wav_path, text, filtered_text in pending_chapters:
+        if chapter_wav_path not in written:
             chapter_wav_files.remove(chapter_wav_path)
+    print(pipeline_registry.summary())
+    print(phoneme_cache.summary())
+    if audio_cache is not None:
+        print(audio_cache.summary())
 
-    if has_ffmpeg:
+    if streaming:
+        try:
+            if final_filename := encoder.close():
+                print(f"'{final_filename}' created successfully. Enjoy your audiobook.")
+        except RuntimeError as e:
+            print(f"ERROR: M4B creation failed. Reason: {e}")
+        if post_event: post_event('CORE_FINISHED')
+    elif has_ffmpeg:
         # Use the original input filename (which includes original extension) for M4B naming logic
-        create_index_file(title, creator, chapter_wav_files, output_folder)
+        create_index_file(title, creator, chapter_wav_files, output_folder, written)
         create_m4b(chapter_wav_files, Path(file_path).name, cover_image, output_folder, m4b_assembly_method)
         if post_event: post_event('CORE_FINISHED')
     else:
         if post_event: post_event('CORE_FINISHED', error_message="ffmpeg not found, M4B not created.")
 
 
+# State of a synthesis worker process, set up once by _init_synthesis_worker
+_worker = SimpleNamespace(pipeline=None, events=None, audio_cache=None)
+
+
+def _init_synthesis_worker(voice, torch_threads, interop_threads, engine, events, audio_cache_mb, trace):
+    if trace:
+        tracer.enable(process_name=multiprocessing.current_process().name)
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(interop_threads)
+    torch.set_default_device(engine_device(engine))
+    set_espeak_library()
+    _worker.pipeline = get_pipeline(voice[0], engine, voice=voice)
+    _worker.events = events
+    _worker.audio_cache = open_audio_cache(audio_cache_mb, engine)
+
+
+def _synthesize_chapter_job(job):
+    """Runs in a worker process: synthesizes one chapter to its WAV file, reporting progress on the event queue."""
+    i, chapter_index, chapter_wav_path, text, sentences, voice, speed, chars_per_sec, max_sentences, batch_size, gaps = job
+    events = _worker.events
+    events.put(('CORE_CHAPTER_STARTED', i, chapter_index, None))
+    start_time = time.time()
+    stats = SimpleNamespace(total_chars=len(text), processed_chars=0, chars_per_sec=chars_per_sec)
+
+    def forward_progress(event_name, stats):
+        events.put((event_name, i, chapter_index, stats.processed_chars))
+
+    cache = _worker.audio_cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    phoneme_hits, phoneme_misses = phoneme_cache.hits, phoneme_cache.misses
+    with span('chapter', 'synthesis', chapter=i, chars=len(text)):
+        frames = synthesize_chapter(_worker.pipeline, chapter_wav_path, text, voice, speed, stats,
+                                    post_event=forward_progress, max_sentences=max_sentences, sentences=sentences,
+                                    verbose=False, audio_cache=cache, batch_size=batch_size,
+                                    phoneme_cache=phoneme_cache, gaps=gaps)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    phoneme_hits, phoneme_misses = phoneme_cache.hits - phoneme_hits, phoneme_cache.misses - phoneme_misses
+    return frames, time.time() - start_time, hits, misses, phoneme_hits, phoneme_misses, tracer.take()
+
+
+class PoolProgress:
+    """
+    Merges the progress events of the pool workers into `stats`. The speed of all the workers together is measured
+    over at least pool_rate_seconds since the last measurement, not between events, which arrive in bursts.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.base_processed_chars = stats.processed_chars
+        self.chapter_progress = {}  # i -> processed chars reported by the worker handling chapter i
+        self.rate_time, self.rate_chars = time.time(), stats.processed_chars
+
+    def drain(self, events, post_event=None):
+        """Handles every event waiting in the events queue."""
+        stats = self.stats
+        while True:
+            try:
+                event_name, i, chapter_index, value = events.get_nowait()
+            except Empty:
+                break
+            if event_name == 'CORE_PROGRESS':
+                self.chapter_progress[i] = value
+                stats.processed_chars = self.base_processed_chars + sum(self.chapter_progress.values())
+                update_progress(stats)
+                if post_event: post_event('CORE_PROGRESS', stats=stats)
+            elif post_event:
+                post_event(event_name, chapter_index=chapter_index)
+        now = time.time()
+        chars = stats.processed_chars - self.rate_chars
+        if chars > 0 and now - self.rate_time >= pool_rate_seconds:
+            update_throughput(stats, chars, now - self.rate_time)
+            self.rate_time, self.rate_chars = now, stats.processed_chars
+
+
+def synthesize_chapters_in_pool(jobs, voice, speed, stats, workers, post_event=None, max_sentences=None,
+                                audio_cache=None, engine=None, threads=None, batch_size=1, gaps=None):
+    """
+    Shards chapters across a pool of worker processes, each with its own pipeline registry and an equal share of the
+    CPU threads (`threads`, or all the CPUs).
+    jobs is a list of (i, chapter_index, chapter_wav_path, filtered_text, sentences) tuples.
+    Progress from the workers is merged into `stats` and forwarded to post_event like in the single-process path.
+    Workers open the same on-disk audio and phoneme caches; their hit/miss counts (and trace events, when tracing)
+    are added to ours.
+    Returns {chapter WAV path: number of samples} for the chapters that were written.
+    """
+    ctx = multiprocessing.get_context('spawn')  # torch and fork don't mix
+    events = ctx.Queue()
+    workers = min(workers, len(jobs))
+    torch_threads = max(1, (threads or os.cpu_count() or 1) // workers)
+    engine = engine or default_device()
+    print(f'Synthesizing {len(jobs)} chapters with {workers} worker processes ({torch_threads} torch threads each)')
+    for name in voice.split(','):
+        if not name.endswith('.pt'):
+            voice_cache.ensure(name)  # download once here, so that the workers only have to map it
+
+    progress = PoolProgress(stats)
+    written = {}
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_synthesis_worker,
+                               initargs=(voice, torch_threads, torch.get_num_interop_threads(), engine, events,
+                                         audio_cache.max_bytes // (1024 * 1024) if audio_cache else 0,
+                                         tracer.enabled))
+    try:
+        futures = {pool.submit(_synthesize_chapter_job,
+                               job + (voice, speed, stats.chars_per_sec, max_sentences, batch_size, gaps)): job
+                   for job in jobs}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            progress.drain(events, post_event)
+            for future in done:
+                i, chapter_index, chapter_wav_path, text, _ = futures[future]
+                frames, delta_seconds, hits, misses, phoneme_hits, phoneme_misses, trace_events = future.result()
+                tracer.extend(trace_events)
+                if audio_cache:
+                    audio_cache.hits += hits
+                    audio_cache.misses += misses
+                phoneme_cache.hits += phoneme_hits
+                phoneme_cache.misses += phoneme_misses
+                if frames:
+                    written[chapter_wav_path] = frames
+                    print('Chapter written to', chapter_wav_path)
+                    print(f'Chapter {i} read in {delta_seconds:.2f} seconds ({len(text) / delta_seconds:.0f} characters per second)')
+                    if post_event: post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter_index)
+                else:
+                    print(f'Warning: No audio generated for chapter {i}')
+        pool.shutdown()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    return written
+
+
+class _StageFailed(Exception):
+    """Raised in a stage when another stage of synthesize_chapters_pipelined failed or was interrupted."""
+
+
+def _put(q, item, failed):
+    # Blocks while q is full (backpressure), but never on a stage that is gone
+    while not failed.is_set():
+        try:
+            return q.put(item, timeout=0.1)
+        except Full:
+            pass
+    raise _StageFailed()
+
+
+def _get(q, failed):
+    while not failed.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except Empty:
+            pass
+    raise _StageFailed()
+
+
+def synthesize_chapters_pipelined(pipeline, jobs, voice, speed, stats, post_event=None, max_sentences=None,
+                                  audio_cache=None, batch_size=1, phoneme_cache=None, gaps=None,
+                                  open_chapter=ChapterWriter):
+    """
+    Synthesizes chapters in three stages connected by bounded queues, so the model never waits for text or disk:
+    a text thread segments, chunks and phonemizes chapter N+1 while this thread runs the model on chapter N,
+    and a writer thread appends chapter N-1's remaining audio to its file and checkpoints it.
+    If synthesis fails (or is interrupted) the writer still saves what was already synthesized; if the text or
+    writer stage fails everything stops. Either way unfinished chapters keep their .part file and journal to resume
+    from, and the error is raised here.
+    jobs is a list of (i, chapter_index, chapter_wav_path, filtered_text, sentences) tuples, sentences may be None.
+    open_chapter(chapter_wav_path, fingerprint) returns what the chapter's audio is written to: a ChapterWriter,
+    or a StreamedChapter when the whole book goes to one encoder (see m4b.StreamingM4bEncoder).
+    Returns {chapter WAV path: number of samples} for the chapters that were written.
+    """
+    prepared = Queue(maxsize=prepare_ahead_chapters)
+    to_write = Queue(maxsize=write_queue_chunks)
+    failed = threading.Event()  # the text or writer stage died: stop everything
+    text_done = threading.Event()  # nobody will take more chapters from the text stage
+    errors = []
+    written = {}
+
+    def run_stage(target, stop_all=True):
+        try:
+            target()
+        except _StageFailed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            if stop_all:
+                failed.set()
+
+    def prepare_text():
+        for job in jobs:
+            with span('prepare_text', 'text', chapter=job[0]):
+                chunks = text_chunks(job[3], job[4], max_sentences)
+                if phoneme_cache is not None:
+                    prephonemize_chunks(pipeline.lang_code, chunks, phoneme_cache)
+            _put(prepared, (job, chunks), text_done)
+        _put(prepared, None, text_done)
+
+    def write_audio():
+        writer = None
+        try:
+            while (item := _get(to_write, failed)) is not None:
+                if isinstance(item, np.ndarray):
+                    with span('write', 'io', samples=len(item)):
+                        writer.write(item)
+                elif isinstance(item, int):
+                    with span('checkpoint', 'io'):
+                        writer.checkpoint(item)
+                elif isinstance(item, tuple):  # end of chapter
+                    (i, chapter_index, chapter_wav_path, text, _), start_time = item
+                    with span('finish_chapter', 'io', chapter=i):
+                        frames = writer.finish()
+                    path, writer = writer.path, None
+                    if frames:
+                        written[chapter_wav_path] = frames
+                        delta_seconds = time.time() - start_time
+                        print('Chapter written to', path)
+                        if post_event: post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter_index)
+                        print(f'Chapter {i} read in {delta_seconds:.2f} seconds ({len(text) / delta_seconds:.0f} characters per second)')
+                    else:
+                        print(f'Warning: No audio generated for chapter {i}')
+                else:  # start of a chapter
+                    writer = item
+        finally:
+            if writer is not None:
+                writer.close()  # keeps the .part file and journal, to resume from
+
+    def synthesize():
+        while (item := _get(prepared, failed)) is not None:
+            job, chunks = item
+            i, chapter_index, chapter_wav_path, text, _ = job
+            start_time = time.time()
+            if post_event: post_event('CORE_CHAPTER_STARTED', chapter_index=chapter_index)
+            writer = open_chapter(chapter_wav_path, chapter_fingerprint(voice, speed, chunks, gaps))
+            if writer.chunks_done:
+                print(f'Resuming {chapter_wav_path} from checkpoint ({writer.chunks_done}/{len(chunks)} chunks done)')
+            trimmer = SilenceTrimmer(*gaps, started=writer.chunks_done > 0) if gaps else None
+            try:
+                _put(to_write, writer, failed)
+            except _StageFailed:
+                writer.close()
+                raise
+            with span('chapter', 'synthesis', chapter=i, chars=len(text)):
+                for audio in iter_audio_segments(pipeline, text, voice, speed, stats, post_event=post_event,
+                                                 audio_cache=audio_cache, chunks=chunks, start_chunk=writer.chunks_done,
+                                                 on_chunk_done=lambda n: _put(to_write, n, failed),
+                                                 batch_size=batch_size, phoneme_cache=phoneme_cache, trimmer=trimmer):
+                    _put(to_write, np.asarray(audio, dtype=np.float32), failed)
+            if trimmer:
+                print(f'Trimmed {trimmer.removed_seconds:.1f} seconds of silence from chapter {i}')
+            _put(to_write, (job, start_time), failed)
+
+    text_stage = threading.Thread(target=run_stage, args=(prepare_text,), name='text stage', daemon=True)
+    writer_stage = threading.Thread(target=run_stage, args=(write_audio,), name='writer stage', daemon=True)
+    text_stage.start()
+    writer_stage.start()
+    try:
+        run_stage(synthesize, stop_all=False)
+    finally:
+        text_done.set()
+        try:
+            _put(to_write, None, failed)  # the writer saves whatever is queued, then exits
+        except _StageFailed:
+            pass
+        writer_stage.join()
+        text_stage.join()
+    if errors:
+        raise errors[0]
+    return written
+
+
 def find_cover(book):
     def is_image(item):
         return item is not None and item.media_type.startswith('image/')
@@ -287,6 +728,53 @@ def find_cover(book):
     return None
 
 
+def chapter_name(chapter, i):
+    # Use chapter.title if get_name() is not available (for ChapterForCore objects from queue or Calibre)
+    if hasattr(chapter, 'get_name') and callable(chapter.get_name): # For EPUB chapters
+        return chapter.get_name()
+    elif hasattr(chapter, 'title') and chapter.title: # For Calibre SimpleNamespace chapters or queued chapters
+        return chapter.title
+    return f"chapter_{i}" # Fallback if neither is present
+
+
+def estimate_book(selected_chapters, title, creator, voice, speed, engine, max_chapters=None, workers=1):
+    """
+    Estimates what synthesizing selected_chapters would take, without loading the model: the chapter texts go
+    through the same intro, filters and sentence segmentation as in main, the audio duration is predicted from
+    spoken_chars_per_sec and the wall time from the starting rate of the ETA with that many worker processes
+    (see starting_chars_per_sec).
+    Prints a per-chapter table and returns a dict with the per-chapter rows and the totals.
+    """
+    chapters = []
+    for i, chapter in enumerate(selected_chapters, start=1):
+        if max_chapters and i > max_chapters: break
+        text = chapter.extracted_text
+        if i == 1:
+            text = f'{title} – {creator}.\n\n' + text
+        filtered_text = apply_filters(text)
+        if len(filtered_text.strip()) >= 10:  # shorter chapters are skipped by main
+            chapters.append((i, chapter_name(chapter, i), filtered_text))
+    chapter_sentences = get_segmenter().split_many([text for _, _, text in chapters])
+    workers = min(workers or 1, len(chapters)) or 1
+    chars_per_sec = starting_chars_per_sec(engine, voice[0], workers)
+    rows = []
+    for (i, name, text), sentences in zip(chapters, chapter_sentences):
+        rows.append({'chapter': i, 'name': name, 'chars': len(text), 'sentences': len(sentences),
+                     'audio_seconds': len(text) / (spoken_chars_per_sec * speed),
+                     'synthesis_seconds': len(text) / chars_per_sec})
+    totals = {key: sum(row[key] for row in rows) for key in ('chars', 'sentences', 'audio_seconds', 'synthesis_seconds')}
+    table = [[row['chapter'], row['name'], f"{row['chars']:,}", row['sentences'], strfdelta(row['audio_seconds']),
+              strfdelta(row['synthesis_seconds'])] for row in rows]
+    table.append(['Total', '', f"{totals['chars']:,}", totals['sentences'], strfdelta(totals['audio_seconds']),
+                  strfdelta(totals['synthesis_seconds'])])
+    table = tabulate(table, headers=['#', 'Chapter', 'Chars', 'Sentences', 'Audio (est.)', 'Synthesis (est.)'])
+    print(table)
+    on = f'{workers} {engine} workers' if workers > 1 else engine
+    print(f'Estimated with {chars_per_sec:.0f} chars/sec on {on}; the model was not loaded.')
+    return {'title': title, 'engine': engine, 'chars_per_sec': chars_per_sec, 'chapters': rows, **totals,
+            'table': table}
+
+
 def print_selected_chapters(document_chapters, chapters):
     ok = 'X' if platform.system() == 'Windows' else '✅'
     print(tabulate([
@@ -295,41 +783,229 @@ def print_selected_chapters(document_chapters, chapters):
     ], headers=['#', 'Chapter', 'Text Length', 'Selected', 'First words']))
 
 
-def gen_audio_segments(pipeline, text, voice, speed, stats=None, max_sentences=None, post_event=None):
-    nlp = spacy.load('xx_ent_wiki_sm')
-    nlp.add_pipe('sentencizer')
-    audio_segments = []
-    doc = nlp(text)
-    sentences = list(doc.sents)
-    for i, sent in enumerate(sentences):
-        if max_sentences and i > max_sentences: break
-        for gs, ps, audio in pipeline(sent.text, voice=voice, speed=speed, split_pattern=r'\n\n\n'):
-            audio_segments.append(audio)
-        if stats:
-            stats.processed_chars += len(sent.text)
-            # Use floating point division for more accurate progress percentage
-            if stats.total_chars > 0:
-                stats.progress = int((stats.processed_chars / stats.total_chars) * 100)
-            else:
-                stats.progress = 100
-            stats.eta = strfdelta((stats.total_chars - stats.processed_chars) / stats.chars_per_sec)
-            if post_event: post_event('CORE_PROGRESS', stats=stats)
-            print(f'Estimated time remaining: {stats.eta}')
-            print('Progress:', f'{stats.progress}%\n')
-    return audio_segments
+def pack_sentences(sentences, max_chars=pack_max_chars):
+    """
+    Greedily merges consecutive sentences into chunks of at most max_chars characters, so the pipeline runs
+    one forward pass per chunk instead of one per (often tiny) sentence, e.g. for dialogue where every line is its
+    own paragraph. A sentence that starts a paragraph keeps a newline before it, also inside a chunk (after a space,
+    since G2Ps keep the newline and the model drops it), so a chunk that starts a paragraph begins with a newline.
+    Returns a list of (chunk_text, chars) tuples, where chars is the summed length of the packed sentences.
+    """
+    packs = []
+    current, current_chars = '', 0
+    for sent in sentences:
+        starts_paragraph = '\n' in sent[:len(sent) - len(sent.lstrip())]
+        if current and current_chars + len(sent) > max_chars:
+            packs.append((current, current_chars))
+            current, current_chars = '', 0
+        if sent.strip():
+            separator = ' ' if current else ''
+            current += (separator + '\n' if starts_paragraph else separator) + sent.strip()
+        current_chars += len(sent)
+    if current or current_chars:
+        packs.append((current, current_chars))
+    return packs
+
+
+def estimate_books(estimates):
+    """Prints one row per book estimated by estimate_book, with the total across all of them, and returns the totals."""
+    keys = ('chars', 'sentences', 'audio_seconds', 'synthesis_seconds')
+    totals = {key: sum(estimate[key] for estimate in estimates) for key in keys}
+    table = [[estimate['title'], len(estimate['chapters']), f"{estimate['chars']:,}", estimate['sentences'],
+              strfdelta(estimate['audio_seconds']), strfdelta(estimate['synthesis_seconds'])] for estimate in estimates]
+    table.append([f'Total ({len(estimates)} books)', sum(len(e['chapters']) for e in estimates), f"{totals['chars']:,}",
+                  totals['sentences'], strfdelta(totals['audio_seconds']), strfdelta(totals['synthesis_seconds'])])
+    table = tabulate(table, headers=['Book', 'Chapters', 'Chars', 'Sentences', 'Audio (est.)', 'Synthesis (est.)'])
+    print(table)
+    return {'books': estimates, **totals, 'table': table}
+
+
+def starting_chars_per_sec(engine, lang_code, workers=1):
+    """
+    The synthesis speed the ETA starts from: the custom rate from the settings if there is one, else the speed
+    measured by the last run with this engine, voice language and number of worker processes, else the speed of the
+    last single-process run (a pool is faster, so the ETA errs on the long side), else a rough default.
+    """
+    default_chars_per_sec = 500 if torch.cuda.is_available() else 50
+    db_custom_rate = load_user_setting('custom_rate')
+    if db_custom_rate is not None:
+        try:
+            rate_from_db = int(db_custom_rate)
+            if rate_from_db > 0:
+                print(f"Using custom characters-per-second rate from database: {rate_from_db}")
+                return rate_from_db
+            print(f"Invalid custom rate from database ({db_custom_rate}), ignoring it")
+        except ValueError:
+            print(f"Could not parse custom rate from database ('{db_custom_rate}'), ignoring it")
+    measured = load_measured_rate(engine, lang_code, workers)
+    if measured:
+        runs = f'{workers}-worker {engine}' if workers > 1 else engine
+        print(f"Using the speed measured by the last {runs} run for this language: {measured:.0f} chars/sec")
+        return measured
+    measured = load_measured_rate(engine, lang_code) if workers > 1 else None
+    if measured:
+        print(f"Using the speed measured by the last single-process {engine} run for this language: {measured:.0f} chars/sec")
+        return measured
+    print(f"No custom or measured rate yet, using default: {default_chars_per_sec}")
+    return default_chars_per_sec
+
+
+def update_throughput(stats, chars, seconds):
+    """Folds the speed of one synthesized batch into stats.chars_per_sec, an exponentially weighted moving average."""
+    if chars > 0 and seconds > 0:
+        stats.chars_per_sec += throughput_alpha * (chars / seconds - stats.chars_per_sec)
+
+
+def update_progress(stats, verbose=True):
+    """Refreshes stats.progress and stats.eta from stats.processed_chars."""
+    # Use floating point division for more accurate progress percentage
+    if stats.total_chars > 0:
+        stats.progress = int((stats.processed_chars / stats.total_chars) * 100)
+    else:
+        stats.progress = 100
+    stats.eta = strfdelta(max(0, stats.total_chars - stats.processed_chars) / stats.chars_per_sec)
+    if verbose:
+        print(f'Estimated time remaining: {stats.eta}')
+        print('Progress:', f'{stats.progress}%\n')
+
+
+def text_chunks(text, sentences=None, max_sentences=None, pack=True):
+    """Splits text into the (chunk_text, chars) units that are synthesized with one pipeline call each."""
+    # `sentences` can be passed in when the text was already segmented (see SentenceSegmenter.split_many)
+    if sentences is None:
+        sentences = get_segmenter().split(text)
+    if max_sentences:
+        sentences = sentences[:max_sentences + 1]
+    return pack_sentences(sentences) if pack else [(sent, len(sent)) for sent in sentences]
+
+
+def iter_audio_segments(pipeline, text, voice, speed, stats=None, max_sentences=None, post_event=None,
+                        sentences=None, pack=True, verbose=True, audio_cache=None, chunks=None, start_chunk=0,
+                        on_chunk_done=None, batch_size=1, phoneme_cache=None, trimmer=None):
+    """
+    Yields the audio chunks of `text` one at a time, as the pipeline produces them.
+    With an audio_cache, each chunk is looked up there first and only synthesized (and stored) on a miss.
+    With a phoneme_cache (see phonemes.PhonemeCache), G2P only runs for chunks that were never phonemized before.
+    The first start_chunk chunks are skipped (only counted as progress), and on_chunk_done(n) is called once the
+    audio of the first n chunks has been consumed.
+    With batch_size > 1, the chunks are synthesized a window at a time with batched forward passes over all of their
+    sentences (see batching.synthesize_batched); they are still yielded, checkpointed and counted one by one.
+    With a trimmer (see silence.SilenceTrimmer), each chunk's edge silence is replaced by a gap of controlled length.
+    The audio cache keeps the untrimmed audio.
+    """
+    if chunks is None:
+        chunks = text_chunks(text, sentences, max_sentences, pack)
+    if stats:
+        stats.processed_chars += sum(chunk_chars for _, chunk_chars in chunks[:start_chunk])
+    window = batch_size * batch_window if batch_size > 1 else 1
+    for start in range(start_chunk, len(chunks), window):
+        window_start = time.time()
+        group = chunks[start:start + window]
+        keys = [audio_cache.key(chunk, voice, speed) if audio_cache is not None and chunk.strip() else None
+                for chunk, _ in group]
+        audios = [audio_cache.get(key) if key else None for key in keys]
+        # Cache hits take no time, so they are left out of the measured speed
+        synthesized_chars = sum(chunk_chars for (_, chunk_chars), audio in zip(group, audios) if audio is None)
+        missed = [key is not None and audio is None for key, audio in zip(keys, audios)]
+        if batch_size > 1:
+            todo = [j for j, (chunk, _) in enumerate(group) if audios[j] is None and chunk.strip()]
+            with span('batch', 'synthesis', chunks=len(todo), chars=synthesized_chars):
+                batched = synthesize_batched(pipeline, [group[j][0] for j in todo], voice, speed, batch_size,
+                                             phoneme_cache)
+            for j, audio in zip(todo, batched):
+                audios[j] = audio
+        for n, ((chunk, chunk_chars), key, audio, miss) in enumerate(zip(group, keys, audios, missed), start=start + 1):
+            if audio is None and (key is not None or trimmer is not None and chunk.strip()):
+                with span('chunk', 'synthesis', chars=chunk_chars):
+                    pieces = [np.asarray(a, dtype=np.float32)
+                              for a in chunk_audio(pipeline, chunk, voice, speed, phoneme_cache)]
+                audio = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+            if miss:
+                audio_cache.put(key, audio)
+            if trimmer is not None and audio is not None:
+                audio = trimmer.process(audio, starts_paragraph=chunk.startswith('\n'))
+            if audio is None:
+                yield from chunk_audio(pipeline, chunk, voice, speed, phoneme_cache)
+            elif len(audio):
+                yield audio
+            if on_chunk_done:
+                on_chunk_done(n)
+            if stats:
+                if n == start + len(group):
+                    update_throughput(stats, synthesized_chars, time.time() - window_start)
+                stats.processed_chars += chunk_chars
+                update_progress(stats, verbose=verbose)
+                if post_event: post_event('CORE_PROGRESS', stats=stats)
+
+
+def gen_audio_segments(pipeline, text, voice, speed, stats=None, max_sentences=None, post_event=None, sentences=None,
+                       pack=True, verbose=True, batch_size=1):
+    return list(iter_audio_segments(pipeline, text, voice, speed, stats, max_sentences, post_event, sentences, pack,
+                                    verbose, batch_size=batch_size))
+
+
+def write_chapter_audio(chapter_wav_path, audio_segments):
+    """
+    Appends each audio chunk to the chapter file as soon as it is produced, so peak memory stays constant
+    regardless of chapter length. Returns the number of samples written; when there is no audio at all,
+    no file is created and 0 is returned.
+    """
+    frames = 0
+    out = None
+    try:
+        for audio in audio_segments:
+            audio = np.asarray(audio, dtype=np.float32)
+            if out is None:
+                out = soundfile.SoundFile(chapter_wav_path, 'w', samplerate=sample_rate, channels=1)
+            out.write(audio)
+            frames += len(audio)
+    finally:
+        if out is not None:
+            out.close()
+    return frames
+
+
+def chapter_fingerprint(voice, speed, chunks, gaps=None):
+    """
+    What a chapter checkpoint is only valid for: the same chunks, synthesized with the same voice and speed, and
+    the same silence gaps.
+    """
+    settings = [voice, f'{float(speed):.3f}'] + ([f'gaps={gaps[0]:.3f},{gaps[1]:.3f}'] if gaps else [])
+    return '\0'.join(settings + [chunk for chunk, _ in chunks])
+
+
+def synthesize_chapter(pipeline, chapter_wav_path, text, voice, speed, stats=None, max_sentences=None,
+                       post_event=None, sentences=None, verbose=True, audio_cache=None, batch_size=1,
+                       phoneme_cache=None, gaps=None):
+    """
+    Synthesizes a chapter into chapter_wav_path through a ChapterWriter: the file only appears once it is complete,
+    and a chapter interrupted by a crash resumes from its last checkpointed chunk. Returns the number of samples.
+    With gaps=(sentence_gap, paragraph_gap), edge silence is trimmed from every chunk (see silence.SilenceTrimmer).
+    """
+    chunks = text_chunks(text, sentences, max_sentences)
+    with ChapterWriter(chapter_wav_path, chapter_fingerprint(voice, speed, chunks, gaps)) as writer:
+        if writer.chunks_done:
+            print(f'Resuming {chapter_wav_path} from checkpoint ({writer.chunks_done}/{len(chunks)} chunks done)')
+        trimmer = SilenceTrimmer(*gaps, started=writer.chunks_done > 0) if gaps else None
+        for audio in iter_audio_segments(pipeline, text, voice, speed, stats, post_event=post_event, verbose=verbose,
+                                         audio_cache=audio_cache, chunks=chunks, start_chunk=writer.chunks_done,
+                                         on_chunk_done=writer.checkpoint, batch_size=batch_size,
+                                         phoneme_cache=phoneme_cache, trimmer=trimmer):
+            writer.write(audio)
+        if trimmer:
+            print(f'Trimmed {trimmer.removed_seconds:.1f} seconds of silence from {Path(chapter_wav_path).name}')
+        return writer.finish()
 
 
 def gen_text(text, voice='af_heart', output_file='text.wav', speed=1, play=False):
     lang_code = voice[:1]
-    pipeline = KPipeline(lang_code=lang_code)
-    load_spacy()
-    audio_segments = gen_audio_segments(pipeline, text, voice=voice, speed=speed);
-    final_audio = np.concatenate(audio_segments)
-    soundfile.write(output_file, final_audio, sample_rate)
+    pipeline = get_pipeline(lang_code, voice=voice)
+    write_chapter_audio(output_file, iter_audio_segments(pipeline, text, voice=voice, speed=speed))
     if play:
         subprocess.run(['ffplay', '-autoexit', '-nodisp', output_file])
 
 
+@traced('extract_texts', 'text')
 def find_document_chapters_and_extract_texts(book):
     """Returns every chapter that is an ITEM_DOCUMENT and enriches each chapter with extracted_text."""
     document_chapters = []
@@ -401,13 +1077,26 @@ def strfdelta(tdelta, fmt='{D:02}d {H:02}h {M:02}m {S:02}s'):
     return f.format(fmt, **values)
 
 
+def concat_output(chapter_files, wav_suffix):
+    """
+    The extension and ffmpeg codec options of the file joining chapter_files: WAVs are copied into a wav_suffix file,
+    FLAC chapters into a FLAC file, and a mix of both (from runs with different settings) is re-encoded to FLAC.
+    """
+    suffixes = {Path(f).suffix.lower() for f in chapter_files}
+    if '.flac' not in suffixes:
+        return wav_suffix, ['-c', 'copy']
+    return '.flac', ['-c', 'copy'] if suffixes == {'.flac'} else ['-c:a', 'flac']
+
+
 def concat_wavs_with_ffmpeg(chapter_files, output_folder, filename):
     wav_list_txt = Path(output_folder) / filename.replace('.epub', '_wav_list.txt')
     with open(wav_list_txt, 'w') as f:
         for wav_file in chapter_files:
             f.write(f"file '{wav_file}'\n")
-    concat_file_path = Path(output_folder) / filename.replace('.epub', '.tmp.mp4')
-    subprocess.run(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', wav_list_txt, '-c', 'copy', concat_file_path])
+    suffix, codec_args = concat_output(chapter_files, '.mp4')
+    concat_file_path = Path(output_folder) / filename.replace('.epub', '.tmp' + suffix)
+    with span('ffmpeg concat', 'subprocess', files=len(chapter_files)):
+        subprocess.run(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', wav_list_txt, *codec_args, concat_file_path])
     Path(wav_list_txt).unlink()
     return concat_file_path
 
@@ -418,6 +1107,8 @@ def concat_wavs_with_ffmpeg_crispy(chapter_files: list[Path], output_folder: str
     This is the 'Extra Crispy' method, designed to be more robust on Windows.
     """
     output_path = Path(output_folder)
+    suffix, codec_args = concat_output(chapter_files, Path(temp_concat_filename).suffix)
+    temp_concat_filename = Path(temp_concat_filename).stem + suffix
     wav_list_filename = "crispy_wav_list.txt"
     wav_list_path = output_path / wav_list_filename
     temp_concat_wav_path = output_path / temp_concat_filename
@@ -436,12 +1127,13 @@ def concat_wavs_with_ffmpeg_crispy(chapter_files: list[Path], output_folder: str
         command = [
             'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
             '-i', wav_list_filename,
-            '-c', 'copy', temp_concat_filename
+            *codec_args, temp_concat_filename
         ]
 
         print(f"Executing 'Extra Crispy' WAV concatenation in '{output_folder}': {' '.join(command)}")
         # Execute ffmpeg with cwd=output_folder to use relative paths
-        proc = subprocess.run(command, cwd=output_folder, capture_output=True, text=True, check=True)
+        with span('ffmpeg concat', 'subprocess', files=len(chapter_files)):
+            proc = subprocess.run(command, cwd=output_folder, capture_output=True, text=True, check=True)
         print("Concatenation successful.")
 
     except subprocess.CalledProcessError as e:
@@ -463,10 +1155,24 @@ def concat_wavs_with_ffmpeg_crispy(chapter_files: list[Path], output_folder: str
     return temp_concat_wav_path
 
 
+@traced('create_m4b', 'output')
 def create_m4b(chapter_files: list[str], original_input_filename: str, cover_image: bytes | None, output_folder: str, assembly_method: str = 'original'):
     if not chapter_files:
         print("No chapter files to process for M4B creation.")
         return
+    if assembly_method in ('parallel', 'pipe'):
+        print(f"Using '{assembly_method.capitalize()}' M4B assembly method.")
+        try:
+            if assembly_method == 'parallel':
+                final_filename = create_m4b_parallel(chapter_files, original_input_filename, cover_image,
+                                                     output_folder, cache=EncodedChapterCache())
+            else:
+                final_filename = create_m4b_piped(chapter_files, original_input_filename, cover_image, output_folder)
+            print(f"'{final_filename}' created successfully. Enjoy your audiobook.")
+            print("Feel free to delete the intermediary chapter files; the .m4b is all you need.")
+        except RuntimeError as e:
+            print(f"ERROR: M4B creation failed. Reason: {e}")
+        return
 
     concat_file_path = None
     temp_m4b_filepath = None
@@ -526,14 +1232,15 @@ def create_m4b(chapter_files: list[str], original_input_filename: str, cover_ima
         ])
 
         print(f"Executing ffmpeg command in '{output_folder}': {' '.join(ffmpeg_command)}")
-        proc = subprocess.run(ffmpeg_command, cwd=output_folder, capture_output=True, text=True, check=True)
+        with span('ffmpeg m4b', 'subprocess'):
+            proc = subprocess.run(ffmpeg_command, cwd=output_folder, capture_output=True, text=True, check=True)
 
         if temp_m4b_filepath.exists():
             if final_filename.exists():
                 final_filename.unlink()
             temp_m4b_filepath.rename(final_filename)
             print(f"'{final_filename}' created successfully. Enjoy your audiobook.")
-            print("Feel free to delete the intermediary .wav chapter files; the .m4b is all you need.")
+            print("Feel free to delete the intermediary chapter files; the .m4b is all you need.")
         else:
             raise RuntimeError(f"ffmpeg seemed to succeed but the output file '{temp_m4b_filepath}' was not found.")
 
@@ -561,23 +1268,16 @@ def create_m4b(chapter_files: list[str], original_input_filename: str, cover_ima
                 print(f"Warning: Could not delete temporary m4b file '{temp_m4b_filepath}': {e}")
 
 
-def probe_duration(file_name):
-    args = ['ffprobe', '-i', file_name, '-show_entries', 'format=duration', '-v', 'quiet', '-of', 'default=noprint_wrappers=1:nokey=1']
-    proc = subprocess.run(args, capture_output=True, text=True, check=True)
-    return float(proc.stdout.strip())
-
-
-def create_index_file(title, creator, chapter_mp3_files, output_folder):
-    with open(Path(output_folder) / "chapters.txt", "w", encoding="utf-8") as f:
-        f.write(f";FFMETADATA1\ntitle={title}\nartist={creator}\n\n")
-        start = 0
-        i = 0
-        for c in chapter_mp3_files:
-            duration = probe_duration(c)
-            end = start + (int)(duration * 1000)
-            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle=Chapter {i}\n\n")
-            i += 1
-            start = end
+@traced('create_index_file', 'output')
+def create_index_file(title, creator, chapter_mp3_files, output_folder, chapter_frames=None):
+    """
+    Writes chapters.txt, the book's metadata and chapter marks for create_m4b. The chapter lengths come from
+    chapter_frames ({chapter file: samples}, as counted while synthesizing); the chapters missing from it, skipped
+    because their file already existed, are measured from their WAV header.
+    """
+    chapter_frames = chapter_frames or {}
+    frames = [chapter_frames.get(c) or soundfile.info(str(c)).frames for c in chapter_mp3_files]
+    write_index_file(Path(output_folder) / "chapters.txt", title, creator, chapter_bounds_ms(frames))
 
 
 def unmark_element(element, stream=None):
@@ -601,6 +1301,7 @@ def unmark(text):
     return __md.convert(text)
 
 
+@traced('apply_filters', 'text')
 def apply_filters(text: str, filter_file_path: str = "audiblez/filter.txt") -> str:
     """
     Applies text replacements based on rules defined in the filter_file.
@@ -885,7 +1586,8 @@ def convert_ebook_with_calibre(input_ebook_path: str, output_html_dir: str, ui_c
     try:
         # Using subprocess.run with capture_output=True to get stdout/stderr
         # Timeout can be added if conversions might hang indefinitely.
-        result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8')
+        with span('ebook-convert', 'subprocess'):
+            result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8')
 
         if result.returncode == 0:
             print(f"Calibre conversion to HTMLZ successful. Output: {output_htmlz_file}")
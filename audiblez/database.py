@@ -1,6 +1,27 @@
+import json
 import sqlite3
 import os
 
+from audiblez.tracing import traced
+
+# Columns of the single-row user_settings table
+USER_SETTINGS_COLUMNS = ["engine", "voice", "speed", "custom_rate", "next_scheduled_run", "calibre_ebook_convert_path",
+                         "m4b_assembly_method", "dark_mode", "window_geometry", "audio_cache_max_mb", "torch_threads",
+                         "torch_interop_threads", "measured_rates", "chapter_format", "silence_gaps"]
+
+# Columns added after the table was first released, with their SQL type.
+# They are added with ALTER TABLE on startup for backward compatibility.
+ADDED_USER_SETTINGS_COLUMNS = {
+    "dark_mode": "TEXT",
+    "window_geometry": "TEXT",
+    "audio_cache_max_mb": "INTEGER",
+    "torch_threads": "INTEGER",
+    "torch_interop_threads": "INTEGER",
+    "measured_rates": "TEXT",  # JSON: {"<engine>:<lang_code>": chars_per_sec}
+    "chapter_format": "TEXT",  # 'wav' or 'flac'
+    "silence_gaps": "TEXT",  # JSON: [sentence_gap, paragraph_gap] in seconds, or null
+}
+
 def connect_db():
     """Connects to the SQLite database.
 
@@ -53,23 +74,15 @@ def create_tables(conn: sqlite3.Connection):
         )
     """)
 
-    # Add dark_mode column to user_settings if it doesn't exist for backward compatibility
-    try:
-        cursor.execute("ALTER TABLE user_settings ADD COLUMN dark_mode TEXT")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower():
-            pass  # Column already exists, which is fine
-        else:
-            raise  # Re-raise other operational errors
-
-    # Add window_geometry column for backward compatibility
-    try:
-        cursor.execute("ALTER TABLE user_settings ADD COLUMN window_geometry TEXT")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower():
-            pass  # Column already exists
-        else:
-            raise
+    # Add newer columns to user_settings if they don't exist, for backward compatibility
+    for column_name, column_type in ADDED_USER_SETTINGS_COLUMNS.items():
+        try:
+            cursor.execute(f"ALTER TABLE user_settings ADD COLUMN {column_name} {column_type}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e).lower():
+                pass  # Column already exists, which is fine
+            else:
+                raise  # Re-raise other operational errors
 
     # Staged Books Table
     cursor.execute("""
@@ -136,6 +149,7 @@ def create_tables(conn: sqlite3.Connection):
 
     conn.commit()
 
+@traced(cat='db')
 def save_user_setting(setting_name: str, setting_value):
     """Saves a user setting to the database.
 
@@ -150,7 +164,7 @@ def save_user_setting(setting_name: str, setting_value):
         cursor.execute("SELECT id FROM user_settings WHERE id = 1")
         row = cursor.fetchone()
 
-        valid_columns = ["engine", "voice", "speed", "custom_rate", "next_scheduled_run", "calibre_ebook_convert_path", "m4b_assembly_method", "dark_mode", "window_geometry"]
+        valid_columns = USER_SETTINGS_COLUMNS
         if setting_name not in valid_columns:
             print(f"Error: Invalid setting_name '{setting_name}' for update/insert.")
             return # Or raise an error
@@ -181,6 +195,7 @@ def save_user_setting(setting_name: str, setting_value):
     finally:
         conn.close()
 
+@traced(cat='db')
 def load_user_setting(setting_name: str):
     """Loads a specific user setting from the database.
 
@@ -193,7 +208,7 @@ def load_user_setting(setting_name: str):
     conn = connect_db()
     cursor = conn.cursor()
     try:
-        valid_columns = ["engine", "voice", "speed", "custom_rate", "next_scheduled_run", "calibre_ebook_convert_path", "m4b_assembly_method", "dark_mode", "window_geometry", "id"] # id for validation
+        valid_columns = USER_SETTINGS_COLUMNS + ["id"] # id for validation
         if setting_name not in valid_columns:
             print(f"Error: Invalid setting_name '{setting_name}' for load.")
             # Pass to let SQLite handle "no such column" if it's truly an invalid/new column
@@ -211,6 +226,7 @@ def load_user_setting(setting_name: str):
     finally:
         conn.close()
 
+@traced(cat='db')
 def load_all_user_settings() -> dict:
     """Loads all user settings from the database.
 
@@ -223,20 +239,10 @@ def load_all_user_settings() -> dict:
     settings = {}
     try:
         # Assuming settings are in a single row with id = 1
-        cursor.execute("SELECT engine, voice, speed, custom_rate, next_scheduled_run, calibre_ebook_convert_path, m4b_assembly_method, dark_mode, window_geometry FROM user_settings WHERE id = 1")
+        cursor.execute(f"SELECT {', '.join(USER_SETTINGS_COLUMNS)} FROM user_settings WHERE id = 1")
         row = cursor.fetchone()
         if row:
-            settings = {
-                "engine": row[0],
-                "voice": row[1],
-                "speed": row[2],
-                "custom_rate": row[3],
-                "next_scheduled_run": row[4],
-                "calibre_ebook_convert_path": row[5],
-                "m4b_assembly_method": row[6],
-                "dark_mode": row[7],
-                "window_geometry": row[8],
-            }
+            settings = dict(zip(USER_SETTINGS_COLUMNS, row))
         return settings
     except sqlite3.Error as e:
         print(f"Database error in load_all_user_settings: {e}")
@@ -245,8 +251,11 @@ def load_all_user_settings() -> dict:
         conn.close()
 
 
-def add_staged_book(title: str, author: str, source_path: str, output_folder: str, chapters: list) -> int | None:
-    """Adds a book and its chapters to the staging tables.
+@traced(cat='db')
+def add_staged_book(title: str, author: str, source_path: str, output_folder: str, chapters: list,
+                    voice: str | None = None) -> int | None:
+    """Adds a book and its chapters to the staging tables. With a voice, its selected chapters are then
+    pre-phonemized in the background in that voice's language (see prephonemize_book).
 
     Args:
         title (str): Book title.
@@ -256,6 +265,7 @@ def add_staged_book(title: str, author: str, source_path: str, output_folder: st
         chapters (list): A list of dictionaries, where each dictionary represents a chapter
                          and contains 'chapter_number', 'title', 'text_content',
                          and 'is_selected_for_synthesis'.
+        voice (str | None): The voice the book is going to be read with, e.g. the one selected in the UI.
 
     Returns:
         int | None: The ID of the newly added staged_book, or None if an error occurs.
@@ -288,7 +298,6 @@ def add_staged_book(title: str, author: str, source_path: str, output_folder: st
         """, staged_chapters_data)
 
         conn.commit()
-        return book_id
     except sqlite3.IntegrityError as e: # Handles UNIQUE constraint violation for source_path
         print(f"Database IntegrityError in add_staged_book (possibly duplicate source_path): {e}")
         conn.rollback()
@@ -299,7 +308,20 @@ def add_staged_book(title: str, author: str, source_path: str, output_folder: st
         return None
     finally:
         conn.close()
-
+    if voice:
+        prephonemize_book(title, [chap.get('text_content') for chap in chapters
+                                  if chap.get('is_selected_for_synthesis', 1)], voice)
+    return book_id
+
+def prephonemize_book(title: str, texts: list, voice: str):
+    """Phonemizes a staged or queued book's chapter texts in a background thread, in the language of `voice`
+    (with or without the UI's flag prefix), so that queue runs of the book only have to do acoustic inference."""
+    # Imported here: audiblez.phonemes uses audiblez.core, which imports this module
+    from audiblez.phonemes import prephonemize_in_background
+    voice = voice.split(' ')[-1]
+    prephonemize_in_background(voice[0], [text for text in texts if text], name=f'"{title}"')
+
+@traced(cat='db')
 def get_staged_books_with_chapters() -> list:
     """Retrieves all staged books along with their chapters.
 
@@ -357,6 +379,7 @@ def get_staged_books_with_chapters() -> list:
     finally:
         conn.close()
 
+@traced(cat='db')
 def update_staged_chapter_selection(chapter_id: int, is_selected: bool):
     """Updates the selection status of a staged chapter."""
     conn = connect_db()
@@ -369,6 +392,7 @@ def update_staged_chapter_selection(chapter_id: int, is_selected: bool):
     finally:
         conn.close()
 
+@traced(cat='db')
 def update_staged_book_final_compilation(book_id: int, final_compilation: bool):
     """Updates the final compilation status of a staged book."""
     conn = connect_db()
@@ -391,10 +415,30 @@ def load_schedule_time() -> int | None:
        Returns None if not set or error."""
     return load_user_setting('next_scheduled_run')
 
+def _load_measured_rates() -> dict:
+    try:
+        return json.loads(load_user_setting('measured_rates') or '{}')
+    except ValueError:
+        return {}
+
+def _measured_rate_key(engine: str, lang_code: str, workers: int) -> str:
+    # A pool of worker processes reads several chapters at once: its combined speed is kept apart
+    return f'{engine}:{lang_code}' if workers <= 1 else f'{engine}:{lang_code}:{workers}'
+
+def load_measured_rate(engine: str, lang_code: str, workers: int = 1) -> float | None:
+    """Loads the synthesis speed (chars/sec) measured by the last run with this engine, voice language and number of
+    worker processes (1 for a single-process run)."""
+    return _load_measured_rates().get(_measured_rate_key(engine, lang_code, workers))
+
+def save_measured_rate(engine: str, lang_code: str, chars_per_sec: float, workers: int = 1):
+    rates = _load_measured_rates()
+    rates[_measured_rate_key(engine, lang_code, workers)] = round(chars_per_sec, 1)
+    save_user_setting('measured_rates', json.dumps(rates))
+
 
 # --- Queue Management Functions ---
-import json
 
+@traced(cat='db')
 def get_max_queue_order(conn_param: sqlite3.Connection | None = None) -> int:
     """Gets the current maximum queue_order from the synthesis_queue table.
     Accepts an optional connection parameter."""
@@ -419,6 +463,7 @@ def get_max_queue_order(conn_param: sqlite3.Connection | None = None) -> int:
         if not was_conn_provided and conn_to_use: # Only close if created internally
             conn_to_use.close()
 
+@traced(cat='db')
 def add_item_to_queue(details: dict) -> int | None:
     """Adds an item and its chapters to the synthesis queue.
 
@@ -490,7 +535,6 @@ def add_item_to_queue(details: dict) -> int | None:
 
         conn.commit()
         # print("DEBUG_DB: add_item_to_queue committed successfully.")
-        return queue_item_id
     except sqlite3.Error as e:
         # print(f"Database error in add_item_to_queue: {e}") # Keep this one? Or rely on default Python error handling?
         print(f"Database error in add_item_to_queue: {e}") # Let's keep it for now.
@@ -500,7 +544,13 @@ def add_item_to_queue(details: dict) -> int | None:
     finally:
         if conn:
             conn.close()
+    # Already cached chunks are skipped, e.g. when the book was staged with the same voice
+    if voice := details.get('synthesis_settings', {}).get('voice'):
+        prephonemize_book(details.get('book_title'),
+                          [chap.get('text_content') for chap in details.get('chapters', [])], voice)
+    return queue_item_id
 
+@traced(cat='db')
 def get_queued_items() -> list:
     """Retrieves all items from synthesis_queue, ordered by queue_order, with their chapters."""
     conn = None # Initialize conn to None for the finally block
@@ -579,6 +629,7 @@ def get_queued_items() -> list:
         if conn:
             conn.close()
 
+@traced(cat='db')
 def update_queue_item_status(queue_item_id: int, status: str):
     """Updates the status of a specific queue item."""
     conn = connect_db()
@@ -591,6 +642,7 @@ def update_queue_item_status(queue_item_id: int, status: str):
     finally:
         conn.close()
 
+@traced(cat='db')
 def remove_queue_item(queue_item_id: int):
     """Removes a queue item and its associated chapters from the database."""
     conn = connect_db()
@@ -606,6 +658,7 @@ def remove_queue_item(queue_item_id: int):
     finally:
         conn.close()
 
+@traced(cat='db')
 def update_staged_chapter_status_in_db(staged_chapter_id: int, status: str):
     """Updates the status of a specific staged chapter."""
     conn = connect_db()
@@ -618,6 +671,7 @@ def update_staged_chapter_status_in_db(staged_chapter_id: int, status: str):
     finally:
         conn.close()
 
+@traced(cat='db')
 def get_chapter_text_content(staged_chapter_id: int) -> str | None:
     """Retrieves text_content for a given staged_chapter_id."""
     conn = connect_db()
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+# M4B assembly helpers: the FFMETADATA chapter index, and the 'stream' assembly method, which encodes the book
+# while it is being synthesized instead of from chapter WAVs.
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+from audiblez.tracing import span, traced
+
+sample_rate = 24000
+aac_frame_samples = 1024
+DEFAULT_ENCODED_CACHE_DIR = os.path.expanduser('~/.audiblez/encoded_chapters')
+DEFAULT_ENCODED_CACHE_MB = 4096
+
+
+def write_index_file(path, title, creator, chapter_bounds_ms):
+    """Writes the FFMETADATA file ffmpeg reads the book's metadata and chapter marks from (start, end in ms)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f";FFMETADATA1\ntitle={title}\nartist={creator}\n\n")
+        for i, (start, end) in enumerate(chapter_bounds_ms):
+            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle=Chapter {i}\n\n")
+
+
+def chapter_bounds_ms(chapter_frames):
+    """(start, end) in ms of consecutive chapters of the given lengths in samples, without accumulating rounding."""
+    bounds, start = [], 0
+    for frames in chapter_frames:
+        bounds.append((start * 1000 // sample_rate, (start + frames) * 1000 // sample_rate))
+        start += frames
+    return bounds
+
+
+def rewrite_index_marks(path, chapter_bounds_ms):
+    """Replaces the START and END of the chapters of an FFMETADATA file written by write_index_file, in order."""
+    bounds = iter(chapter_bounds_ms)
+
+    def chapter(match):
+        start, end = next(bounds)
+        return f'START={start}\nEND={end}\n'
+
+    text = Path(path).read_text(encoding='utf-8')
+    Path(path).write_text(re.sub(r'START=\d+\nEND=\d+\n', chapter, text), encoding='utf-8')
+
+
+def mux_m4b(audio_input, output_folder, cover_image, final_path):
+    """
+    Writes final_path from the AAC audio that ffmpeg reads with the audio_input arguments, copying it as is, with the
+    metadata and chapter marks of output_folder/chapters.txt and the cover image, if any.
+    """
+    output_path = Path(output_folder)
+    temp_m4b_path = output_path / 'temp_output_for_m4b.m4b'
+    cover_path = output_path / 'temp_cover_for_m4b.jpg'
+    command = ['ffmpeg', '-y', '-loglevel', 'error', *audio_input, '-i', str(output_path / 'chapters.txt')]
+    if cover_image:
+        cover_path.write_bytes(cover_image)
+        command += ['-i', str(cover_path)]
+    command += ['-map', '0:a', '-map_metadata', '1']
+    if cover_image:
+        command += ['-map', '2:v', '-disposition:v', 'attached_pic', '-c:v', 'mjpeg']
+    command += ['-c:a', 'copy', '-f', 'mp4', str(temp_m4b_path)]
+    try:
+        with span('ffmpeg m4b', 'subprocess'):
+            subprocess.run(command, capture_output=True, text=True, check=True)
+        temp_m4b_path.replace(final_path)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f'M4B creation failed: {e.stderr}') from None
+    finally:
+        cover_path.unlink(missing_ok=True)
+        temp_m4b_path.unlink(missing_ok=True)
+
+
+def encode_chapter(wav_path, aac_path, bitrate='64k'):
+    """
+    Encodes one chapter WAV to AAC, as a raw ADTS stream: unlike an .m4a, it has no edit list to trim the encoder's
+    priming and padding, so chapters joined byte for byte play every frame back to back (see create_m4b_parallel).
+    """
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(wav_path), '-c:a', 'aac', '-b:a', bitrate,
+               '-f', 'adts', str(aac_path)]
+    with span('ffmpeg aac', 'subprocess', file=str(wav_path)):
+        proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'Encoding {wav_path} failed: {proc.stderr}')
+    return aac_path
+
+
+def adts_frame_count(path):
+    """Number of AAC frames in an ADTS stream, counted from the frame headers without decoding anything."""
+    frames = 0
+    with open(path, 'rb') as f:
+        while len(header := f.read(7)) == 7:
+            if header[0] != 0xFF or header[1] & 0xF0 != 0xF0:
+                raise RuntimeError(f'{path} is not an ADTS stream')
+            length = (header[3] & 0x03) << 11 | header[4] << 3 | header[5] >> 5
+            frames += (header[6] & 0x03) + 1  # raw data blocks in this ADTS frame
+            f.seek(length - 7, os.SEEK_CUR)
+    return frames
+
+
+def wav_pcm16_samples(path):
+    """
+    Memory-maps the samples of a 16-bit PCM mono WAV at sample_rate (how ChapterWriter writes chapters), without
+    reading them. Returns None for any other kind of file.
+    """
+    with open(path, 'rb') as f:
+        if f.read(4) != b'RIFF' or f.read(8)[4:] != b'WAVE':
+            return None
+        fmt = None
+        while len(header := f.read(8)) == 8:
+            chunk_id, size = header[:4], int.from_bytes(header[4:], 'little')
+            if chunk_id == b'fmt ':
+                fmt = f.read(size)
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)  # chunks are padded to an even size
+        else:
+            return None
+    if (fmt is None or int.from_bytes(fmt[0:2], 'little') != 1 or int.from_bytes(fmt[2:4], 'little') != 1
+            or int.from_bytes(fmt[4:8], 'little') != sample_rate or int.from_bytes(fmt[14:16], 'little') != 16):
+        return None
+    size = min(size, os.path.getsize(path) - offset)
+    if size < 2:
+        return np.zeros(0, dtype='<i2')
+    return np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(size // 2,))
+
+
+def iter_chapter_pcm(path, block_frames=1 << 20):
+    """Yields the int16 samples of a chapter file in blocks: memory-mapped for WAVs, decoded for FLAC chapters."""
+    samples = wav_pcm16_samples(path)
+    if samples is None:
+        yield from soundfile.blocks(str(path), blocksize=block_frames, dtype='int16')
+        return
+    try:
+        for start in range(0, len(samples), block_frames):
+            yield samples[start:start + block_frames]
+    finally:
+        del samples  # unmaps the file
+
+
+def create_m4b_piped(chapter_files, original_input_filename, cover_image, output_folder):
+    """
+    The 'pipe' assembly method: instead of joining the chapter files into a temporary file for ffmpeg to encode,
+    their samples are memory-mapped and written to the stdin of a single AAC encoder, one chapter after the other
+    (see StreamingM4bEncoder), so nothing but the encoded audio is written. Uses the chapters.txt of
+    create_index_file. Returns the path of the .m4b.
+    """
+    encoder = StreamingM4bEncoder(output_folder, original_input_filename, None, None, cover_image, pcm_dtype='<i2')
+    try:
+        for path in chapter_files:
+            chapter = encoder.chapter()
+            with span('pipe chapter', 'io', file=str(path)):
+                for block in iter_chapter_pcm(path):
+                    chapter.write(block)
+            chapter.finish()
+    except BaseException:
+        encoder.abort()
+        raise
+    return encoder.close(write_index=False)
+
+
+class EncodedChapterCache:
+    """
+    On-disk cache of AAC-encoded chapters (ADTS, see encode_chapter) keyed by the hash of the chapter WAV and the bitrate, so that rebuilding a
+    book only encodes the chapters whose audio changed. Only create_m4b_parallel uses it: the other assembly methods
+    encode the book as one stream. Using an entry refreshes its mtime, and evict() deletes the least recently used
+    entries once the cache is bigger than max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_ENCODED_CACHE_DIR, max_bytes=DEFAULT_ENCODED_CACHE_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, wav_path, bitrate):
+        digest = hashlib.sha256(f'{bitrate}\0'.encode('utf-8'))
+        with open(wav_path, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / key[:2] / f'{key}.aac'
+
+    @traced('encoded_cache.encode', 'cache')
+    def encode(self, wav_path, bitrate='64k'):
+        """Returns the path of the cached AAC encoding of wav_path, encoding it first if it isn't cached yet."""
+        path = self.path(self.key(wav_path, bitrate))
+        if path.exists():
+            os.utime(path)  # mark as recently used
+            with self._lock:
+                self.hits += 1
+            return path
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            encode_chapter(wav_path, tmp_path, bitrate)
+            os.replace(tmp_path, path)  # atomic, so a concurrent build never joins a partial entry
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        with self._lock:
+            self.misses += 1
+        return path
+
+    @traced('encoded_cache.evict', 'cache')
+    def evict(self):
+        """Deletes least recently used entries until the cache is back under max_bytes."""
+        entries = []
+        for f in self.cache_dir.glob('*/*.aac'):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        entries.sort()
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, f in entries:
+            if size <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            size -= entry_size
+
+    def summary(self):
+        return f'Encoded chapters: {self.misses} encoded, {self.hits} reused from {self.cache_dir}'
+
+
+def create_m4b_parallel(chapter_files, original_input_filename, cover_image, output_folder, workers=None,
+                        cache=None):
+    """
+    The 'parallel' assembly method: AAC encoding is single-threaded, so instead of encoding the whole book in one
+    ffmpeg, every chapter WAV is encoded by its own ffmpeg, `workers` (default: one per CPU) at a time. The encoded
+    chapters are then joined by stream copy, adding the metadata, the chapter marks of chapters.txt and the cover.
+    Each encoded chapter starts with the encoder's priming frame and ends padded to a whole frame, which a joined
+    book plays too: the chapter marks are moved to the frame counts of the encoded chapters, so that they don't drift
+    from the WAV sample counts of create_index_file by up to two frames (85 ms) more with every chapter.
+    With an EncodedChapterCache, the chapters whose WAV didn't change since an earlier build aren't encoded again.
+    Returns the path of the .m4b.
+    """
+    output_path = Path(output_folder)
+    workers = workers or os.cpu_count() or 1
+    final_path = output_path / (Path(original_input_filename).stem + '.m4b')
+    temp_files = []
+    if cache is None:
+        temp_files = [Path(f).with_name(Path(f).stem + '.aac') for f in chapter_files]
+        encode = encode_chapter
+        args = (chapter_files, temp_files)
+    else:
+        encode = cache.encode
+        args = (chapter_files,)
+    print(f'Encoding {len(chapter_files)} chapters to AAC with {workers} ffmpeg processes in parallel')
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            encoded_files = list(pool.map(encode, *args))
+        if cache is not None:
+            print(cache.summary())
+        frames = [adts_frame_count(path) * aac_frame_samples for path in encoded_files]
+        rewrite_index_marks(output_path / 'chapters.txt', chapter_bounds_ms(frames))
+        # The concat protocol joins the ADTS files byte for byte, without a temporary file
+        concat = 'concat:' + '|'.join(Path(path).resolve().as_posix() for path in encoded_files)
+        mux_m4b(['-f', 'aac', '-i', concat], output_path, cover_image, final_path)
+    finally:
+        for aac_path in temp_files:
+            aac_path.unlink(missing_ok=True)
+    if cache is not None:
+        cache.evict()
+    return final_path
+
+
+class StreamedChapter:
+    """
+    Stands in for a ChapterWriter in synthesize_chapters_pipelined when the book is streamed: the audio goes to the
+    encoder instead of a WAV file. A stream can't be rewound, so there are no checkpoints to resume from.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.path = encoder.audio_path
+        self.chunks_done = 0
+        self.frames = 0
+
+    def write(self, audio):
+        self.encoder.write(audio)
+        self.frames += len(audio)
+
+    def checkpoint(self, chunks_done):
+        self.chunks_done = chunks_done
+
+    def finish(self):
+        if self.frames:
+            self.encoder.chapter_frames.append(self.frames)
+        return self.frames
+
+    def close(self):
+        pass
+
+
+class StreamingM4bEncoder:
+    """
+    Keeps one ffmpeg AAC encoder open on a stdin pipe and feeds it the book's PCM as chapters are synthesized, so the
+    uncompressed audio never touches the disk. Chapter marks come from the sample counts of each chapter.
+    close() then muxes the metadata, chapter marks and cover into the final .m4b, copying the (small) AAC stream.
+    The PCM is float32 samples, or int16 with pcm_dtype='<i2' (as read from the chapter files).
+    """
+
+    def __init__(self, output_folder, original_input_filename, title, creator, cover_image=None, bitrate='64k',
+                 pcm_dtype='<f4'):
+        self.output_path = Path(output_folder)
+        stem = Path(original_input_filename).stem
+        self.final_path = self.output_path / f'{stem}.m4b'
+        self.audio_path = self.output_path / f'{stem}.stream.m4a'
+        self.title, self.creator, self.cover_image = title, creator, cover_image
+        self.pcm_dtype = np.dtype(pcm_dtype)
+        self.chapter_frames = []
+        self.frames = 0
+        self._stderr = tempfile.TemporaryFile()
+        pcm_format = {'<f4': 'f32le', '<i2': 's16le'}[self.pcm_dtype.str]
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', pcm_format, '-ar', str(sample_rate), '-ac', '1',
+                   '-i', 'pipe:0', '-c:a', 'aac', '-b:a', bitrate, '-f', 'mp4', str(self.audio_path)]
+        print(f"Streaming the audio to an AAC encoder: {' '.join(command)}")
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=self._stderr)
+
+    def chapter(self):
+        return StreamedChapter(self)
+
+    def write(self, audio):
+        audio = np.ascontiguousarray(audio, dtype=self.pcm_dtype)
+        with span('encode', 'subprocess', samples=len(audio)):
+            try:
+                self._process.stdin.write(audio.data)
+            except BrokenPipeError:
+                raise RuntimeError(f'The AAC encoder exited early: {self._errors()}') from None
+        self.frames += len(audio)
+
+    def close(self, write_index=True):
+        """
+        Finishes encoding and writes the final .m4b; returns its path, or None if there was no audio.
+        With write_index=False, the chapters.txt already in the output folder is used as is.
+        """
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass  # the encoder already exited, its exit code tells why
+        with span('ffmpeg encode', 'subprocess'):
+            returncode = self._process.wait()
+        if returncode != 0:
+            errors = self._errors()
+            self.abort()
+            raise RuntimeError(f'The AAC encoder failed with exit code {returncode}: {errors}')
+        if not self.chapter_frames:
+            print('No audio was synthesized, M4B not created.')
+            self.abort()
+            return None
+        if write_index:
+            write_index_file(self.output_path / 'chapters.txt', self.title, self.creator,
+                             chapter_bounds_ms(self.chapter_frames))
+        try:
+            mux_m4b(['-i', str(self.audio_path)], self.output_path, self.cover_image, self.final_path)
+        finally:
+            self.audio_path.unlink(missing_ok=True)
+            self._stderr.close()
+        return self.final_path
+
+    def abort(self):
+        """Stops the encoder and removes its partial output."""
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._process.stdin and not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.audio_path.unlink(missing_ok=True)
+        self._stderr.close()
+
+    def _errors(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode('utf-8', 'replace').strip()
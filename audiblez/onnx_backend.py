@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# ONNX Runtime backend: the Kokoro acoustic model exported once to ONNX and run on CPU.
+import contextlib
+import importlib.metadata
+import json
+import os
+import types
+from pathlib import Path
+
+import numpy as np
+import torch
+from kokoro import KModel, KPipeline
+
+MODELS_DIR = os.path.expanduser('~/.audiblez/models')
+
+
+def model_path(models_dir=MODELS_DIR):
+    return Path(models_dir) / f"kokoro-{importlib.metadata.version('kokoro')}.onnx"
+
+
+class _ExportableKModel(torch.nn.Module):
+    """KModel.forward starting from token ids instead of a phoneme string, so it can be traced."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, ref_s, speed):
+        model = self.model
+        input_lengths = torch.full((input_ids.shape[0],), input_ids.shape[-1], dtype=torch.long)
+        text_mask = torch.zeros_like(input_ids, dtype=torch.bool)  # a single unpadded sequence
+        bert_dur = model.bert(input_ids, attention_mask=(~text_mask).int())
+        d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+        s = ref_s[:, 128:]
+        d = model.predictor.text_encoder(d_en, s, input_lengths, text_mask)
+        x, _ = model.predictor.lstm(d)
+        duration = model.predictor.duration_proj(x)
+        duration = torch.sigmoid(duration).sum(axis=-1) / speed
+        pred_dur = torch.round(duration).clamp(min=1).long().squeeze(0)
+        indices = torch.repeat_interleave(torch.arange(input_ids.shape[1]), pred_dur)
+        pred_aln_trg = (indices.unsqueeze(0) == torch.arange(input_ids.shape[1]).unsqueeze(1)).float().unsqueeze(0)
+        en = d.transpose(-1, -2) @ pred_aln_trg
+        F0_pred, N_pred = model.predictor.F0Ntrain(en, s)
+        t_en = model.text_encoder(input_ids, input_lengths, text_mask)
+        asr = t_en @ pred_aln_trg
+        return model.decoder(asr, F0_pred, N_pred, ref_s[:, :128]).squeeze()
+
+
+def _dft_angles(n_fft):
+    # Angles of the one-sided DFT basis reduced modulo 2*pi in integers, so e.g. sin(pi * n) comes out exactly 0
+    k = torch.arange(n_fft // 2 + 1, dtype=torch.float64).unsqueeze(1)
+    return 2 * np.pi * (k * torch.arange(n_fft, dtype=torch.float64) % n_fft) / n_fft
+
+
+def _atan2(y, x):
+    # The exporter's atan2 gives -pi instead of pi on the negative real axis, and nan at 0: spell out the quadrants
+    atan = torch.atan(y / x)
+    return torch.where(x > 0, atan, torch.where(x < 0, torch.where(y >= 0, atan + np.pi, atan - np.pi),
+                                                 torch.sign(y) * np.pi / 2))
+
+
+def _real_stft(stft, input_data):
+    # torch.stft/istft work on complex tensors, which ONNX can't express: do the same with DFT convolutions
+    n_fft, hop = stft.filter_length, stft.hop_length
+    window = stft.window.to(input_data.device)
+    angles = _dft_angles(n_fft)
+    # No sine rows for the DC and Nyquist bins: their imaginary part is exactly 0, like in torch.stft, rather than
+    # rounding noise that would put the phase of a negative bin at pi or -pi at random
+    basis = torch.cat([torch.cos(angles), -torch.sin(angles[1:-1])]).float() * window
+    padded = torch.nn.functional.pad(input_data.unsqueeze(1), (n_fft // 2, n_fft // 2), mode='reflect')
+    spec = torch.nn.functional.conv1d(padded, basis.unsqueeze(1), stride=hop)
+    real, imag = spec[:, :n_fft // 2 + 1], spec[:, n_fft // 2 + 1:]
+    zero = torch.zeros_like(real[:, :1])
+    imag = torch.cat([zero, imag, zero], dim=1)
+    return torch.sqrt(real ** 2 + imag ** 2), _atan2(imag, real)
+
+
+def _real_istft(stft, magnitude, phase):
+    n_fft, hop = stft.filter_length, stft.hop_length
+    window = stft.window.to(magnitude.device)
+    angles = _dft_angles(n_fft)
+    scale = torch.full((n_fft // 2 + 1, 1), 2.0, dtype=torch.float64)
+    scale[0] = scale[-1] = 1.0  # DC and Nyquist bins appear once in a one-sided spectrum
+    basis = (torch.cat([torch.cos(angles) * scale, -torch.sin(angles) * scale]) / n_fft).float() * window
+    spec = torch.cat([magnitude * torch.cos(phase), magnitude * torch.sin(phase)], dim=1)
+    audio = torch.nn.functional.conv_transpose1d(spec, basis.unsqueeze(1), stride=hop)
+    # Normalize by the overlapped squared window, like torch.istft does
+    norm = torch.nn.functional.conv_transpose1d(torch.ones_like(spec[:1, :1]), (window ** 2).reshape(1, 1, n_fft),
+                                                stride=hop)
+    audio = audio / norm.clamp(min=1e-11)
+    return audio[:, :, n_fft // 2:-(n_fft // 2)]
+
+
+def _instance_norm(norm, x):
+    # The exporter needs a static channel count for InstanceNormalization, which is lost after kokoro's LSTMs
+    mean = x.mean(dim=-1, keepdim=True)
+    var = ((x - mean) ** 2).mean(dim=-1, keepdim=True)
+    return (x - mean) / torch.sqrt(var + norm.eps)
+
+
+@contextlib.contextmanager
+def _exportable(model):
+    """Temporarily swaps the parts of kokoro that can't be exported for equivalent ones, for a batch of one."""
+    rnn = torch.nn.utils.rnn
+    original_pack, original_pad = rnn.pack_padded_sequence, rnn.pad_packed_sequence
+    # kokoro packs sequences with lengths from .numpy(), which would be frozen into the graph. With one unpadded
+    # sequence packing is a no-op anyway.
+    rnn.pack_padded_sequence = lambda x, lengths, batch_first=False, enforce_sorted=True: x
+    rnn.pad_packed_sequence = lambda x, batch_first=False: (x, None)
+    stft = model.decoder.generator.stft
+    stft.transform = types.MethodType(_real_stft, stft)
+    stft.inverse = types.MethodType(_real_istft, stft)
+    norms = [m for m in model.modules() if isinstance(m, torch.nn.InstanceNorm1d)]
+    for norm in norms:
+        norm.forward = types.MethodType(_instance_norm, norm)
+    try:
+        yield _ExportableKModel(model).eval()  # else the exporter puts the model back in training mode after
+    finally:
+        rnn.pack_padded_sequence, rnn.pad_packed_sequence = original_pack, original_pad
+        del stft.transform, stft.inverse
+        for norm in norms:
+            del norm.forward
+
+
+def _fix_negative_transposes(path):
+    # kokoro permutes with negative axes (s.permute(1, -1, 0)), which the exporter copies into Transpose nodes as-is
+    import onnx
+    graph = onnx.load(str(path))
+    for node in graph.graph.node:
+        if node.op_type == 'Transpose':
+            for attr in node.attribute:
+                if attr.name == 'perm' and min(attr.ints) < 0:
+                    attr.ints[:] = [axis % len(attr.ints) for axis in attr.ints]
+    onnx.save(graph, str(path))
+
+
+def export_onnx(path=None, model=None):
+    """Exports the Kokoro acoustic model to ONNX (with its phoneme vocabulary next to it) and returns the path."""
+    path = Path(path or model_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    model = model or KModel().to('cpu').eval()
+    print(f'Exporting Kokoro to ONNX in {path}, this only happens once...')
+    input_ids = torch.LongTensor([[0, *range(1, 50), 0]])
+    ref_s = torch.zeros(1, 256)
+    speed = torch.tensor(1.0)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with _exportable(model) as exportable, torch.no_grad():
+        torch.onnx.export(
+            exportable, (input_ids, ref_s, speed), str(tmp_path), dynamo=False, opset_version=17,
+            input_names=['input_ids', 'style', 'speed'], output_names=['audio'],
+            dynamic_axes={'input_ids': {1: 'tokens'}, 'audio': {0: 'samples'}})
+    _fix_negative_transposes(tmp_path)
+    path.with_suffix('.vocab.json').write_text(json.dumps(model.vocab, ensure_ascii=False))
+    os.replace(tmp_path, path)
+    return path
+
+
+class OnnxModel:
+    """The exported model in an onnxruntime CPU session. Called like KModel: (phonemes, ref_s, speed) -> audio."""
+
+    def __init__(self, path=None, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            print('The onnx engine needs onnxruntime and onnx: pip install audiblez[onnx]')
+            raise
+        path = Path(path or model_path())
+        if not path.exists():
+            export_onnx(path)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self.vocab = json.loads(path.with_suffix('.vocab.json').read_text())
+
+    def __call__(self, phonemes, ref_s, speed=1):
+        input_ids = [0, *(self.vocab[p] for p in phonemes if p in self.vocab), 0]
+        audio, = self.session.run(['audio'], {
+            'input_ids': np.array([input_ids], dtype=np.int64),
+            'style': np.asarray(ref_s, dtype=np.float32).reshape(1, -1),
+            'speed': np.array(speed, dtype=np.float32),
+        })
+        return torch.from_numpy(audio)
+
+
+class OnnxPipeline(KPipeline):
+    """A KPipeline that does G2P and chunking itself, and runs the acoustic model through onnxruntime."""
+
+    def __init__(self, lang_code, onnx_model):
+        super().__init__(lang_code=lang_code, model=False)
+        self.onnx_model = onnx_model
+
+    def __call__(self, text, voice=None, speed=1, split_pattern=r'\n+', model=None):
+        return self._synthesize(super().__call__(text, voice, speed, split_pattern), voice, speed)
+
+    def generate_from_tokens(self, tokens, voice, speed=1, model=None):
+        return self._synthesize(super().generate_from_tokens(tokens, voice, speed), voice, speed)
+
+    def _synthesize(self, results, voice, speed):
+        pack = self.load_voice(voice)
+        for result in results:
+            audio = self.onnx_model(result.phonemes, pack[len(result.phonemes) - 1], speed)
+            yield KPipeline.Result(graphemes=result.graphemes, phonemes=result.phonemes, tokens=result.tokens,
+                                   output=KModel.Output(audio=audio))
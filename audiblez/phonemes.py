@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Persistent cache of phonemization (G2P) results, so each text is only phonemized once.
+import copy
+import importlib.metadata
+import json
+import os
+import sqlite3
+import threading
+
+from audiblez.audio_cache import normalize_text
+from audiblez.tracing import traced
+
+DEFAULT_PATH = os.path.expanduser('~/.audiblez/phonemes.db')
+
+
+@traced('g2p', 'text')
+def phonemize(pipeline, text, split_pattern=r'\n\n\n'):
+    """Runs only the G2P part of pipeline on text and returns the phoneme strings it would synthesize, in order."""
+    from kokoro import KPipeline
+    g2p = copy.copy(pipeline)  # shares the G2P and loaded voices, but has no model to run
+    g2p.model = None
+    return [result.phonemes for result in KPipeline.__call__(g2p, text, None, 1, split_pattern)]
+
+
+class _CachedFallback:
+    """Wraps misaki's espeak fallback for out-of-lexicon English words, remembering every word it phonemizes."""
+
+    def __init__(self, cache, scope, fallback):
+        self.cache = cache
+        self.scope = scope
+        self.fallback = fallback
+
+    def __call__(self, token):
+        cached = self.cache.get_word(self.scope, token.text)
+        if cached is not None:
+            return cached
+        phonemes, rating = self.fallback(token)
+        self.cache.put_word(self.scope, token.text, phonemes, rating)
+        return phonemes, rating
+
+
+class PhonemeCache:
+    """
+    SQLite store of the phoneme strings that the G2P of a language produces for a chunk of text (keyed by the
+    normalized text), and of the espeak fallback's output for single English words missing from the lexicon.
+    Entries are scoped by language code and misaki version. Each thread gets its own connection, and the database
+    is shared by every process (pool workers, the UI, background pre-phonemization).
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.version = importlib.metadata.version('misaki')
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sentences (scope TEXT, text TEXT, phonemes TEXT, '
+                         'PRIMARY KEY (scope, text))')
+            conn.execute('CREATE TABLE IF NOT EXISTS words (scope TEXT, word TEXT, phonemes TEXT, rating INTEGER, '
+                         'PRIMARY KEY (scope, word))')
+            self._local.conn = conn
+        return conn
+
+    def scope(self, lang_code):
+        return f'{lang_code}@misaki-{self.version}'
+
+    @traced('phoneme_cache.get', 'db')
+    def get(self, lang_code, text):
+        """The cached list of phoneme strings for text, or None."""
+        row = self._conn().execute('SELECT phonemes FROM sentences WHERE scope = ? AND text = ?',
+                                   (self.scope(lang_code), normalize_text(text))).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0]) if row else None
+
+    @traced('phoneme_cache.put', 'db')
+    def put(self, lang_code, text, phonemes):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO sentences VALUES (?, ?, ?)',
+                     (self.scope(lang_code), normalize_text(text), json.dumps(phonemes, ensure_ascii=False)))
+        conn.commit()
+
+    @traced('phoneme_cache.get_word', 'db')
+    def get_word(self, scope, word):
+        row = self._conn().execute('SELECT phonemes, rating FROM words WHERE scope = ? AND word = ?',
+                                   (scope, word)).fetchone()
+        return tuple(row) if row else None
+
+    @traced('phoneme_cache.put_word', 'db')
+    def put_word(self, scope, word, phonemes, rating):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO words VALUES (?, ?, ?, ?)', (scope, word, phonemes, rating))
+        conn.commit()
+
+    def memoize_fallback(self, pipeline):
+        """Makes pipeline's espeak fallback (English pipelines only) go through the word cache."""
+        g2p = getattr(pipeline, 'g2p', None)
+        fallback = getattr(g2p, 'fallback', None)
+        if fallback is not None and not isinstance(fallback, _CachedFallback):
+            g2p.fallback = _CachedFallback(self, self.scope(pipeline.lang_code), fallback)
+
+    def phonemize(self, pipeline, text):
+        """Like phonemize(pipeline, text), through the cache."""
+        phonemes = self.get(pipeline.lang_code, text)
+        if phonemes is None:
+            self.memoize_fallback(pipeline)
+            phonemes = phonemize(pipeline, text)
+            self.put(pipeline.lang_code, text, phonemes)
+        return phonemes
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return f'Phoneme cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate)'
+
+
+phoneme_cache = PhonemeCache()
+
+_g2p_pipelines = {}  # lang_code -> G2P-only KPipeline used for pre-phonemization
+_g2p_lock = threading.Lock()
+
+
+def prephonemize_chunks(lang_code, chunks, cache=phoneme_cache):
+    """
+    Phonemizes (chunk_text, chars) chunks into the cache with a G2P-only pipeline of its own, so it can run in
+    another thread than synthesis and without loading the acoustic model. Returns how many weren't cached yet.
+    The G2P pipelines are shared by every thread (the text stage of synthesis, background passes) and are only
+    locked one chunk at a time, so a background pass never holds up synthesis for a whole chapter.
+    """
+    from kokoro import KPipeline
+    misses = 0
+    for chunk, _ in chunks:
+        if not chunk.strip() or cache.get(lang_code, chunk) is not None:
+            continue
+        with _g2p_lock:
+            if lang_code not in _g2p_pipelines:
+                _g2p_pipelines[lang_code] = KPipeline(lang_code=lang_code, model=False)
+            pipeline = _g2p_pipelines[lang_code]
+            cache.memoize_fallback(pipeline)
+            cache.put(lang_code, chunk, phonemize(pipeline, chunk))
+        misses += 1
+    return misses
+
+
+def prephonemize(lang_code, texts, cache=phoneme_cache):
+    """Pre-phonemizes chapter texts, split and filtered exactly like a synthesis run would."""
+    from audiblez.core import apply_filters, get_segmenter, text_chunks
+    filtered = [apply_filters(text) for text in texts if text and text.strip()]
+    return sum(prephonemize_chunks(lang_code, text_chunks(text, sentences), cache)
+               for text, sentences in zip(filtered, get_segmenter().split_many(filtered)))
+
+
+def prephonemize_in_background(lang_code, texts, name='book'):
+    """Runs prephonemize in a daemon thread, so that a later synthesis run only has to do acoustic inference."""
+
+    def run():
+        try:
+            from audiblez.core import set_espeak_library
+            set_espeak_library()
+            new = prephonemize(lang_code, texts)
+            print(f'Pre-phonemized {new} new chunks of {name}')
+        except Exception as e:
+            print(f'Pre-phonemization of {name} failed: {e}')
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Process-wide registry of warm Kokoro pipelines, and the memory-mapped voice cache they share.
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import torch
+from huggingface_hub import hf_hub_download
+from kokoro import KModel, KPipeline
+
+# How many language pipelines (G2P models and loaded voices) stay resident at the same time
+MAX_RESIDENT_PIPELINES = 2
+VOICES_DIR = os.path.expanduser('~/.audiblez/voices')
+
+
+# Synthesis engines: a torch device, 'int8' for a dynamically quantized model on CPU, or 'onnx' for onnxruntime on CPU
+ENGINES = ['cpu', 'cuda', 'int8', 'onnx']
+
+
+def default_device():
+    """The device set with torch.set_default_device (cli.py and the UI do that according to the chosen engine)."""
+    return torch.tensor([]).device.type
+
+
+def engine_device(engine):
+    return 'cpu' if engine in ('int8', 'onnx') else engine
+
+
+def quantize_model(model):
+    """Applies dynamic int8 quantization (in place) to the Linear and LSTM layers of a CPU KModel."""
+    torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True)
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.LSTM):
+            module.flatten_parameters = lambda: None  # kokoro calls it before every LSTM, quantized ones don't have it
+    return model
+
+
+class VoiceCache:
+    """
+    Voice tensors stored as .npy files in voices_dir and memory-mapped when loaded. A voice is downloaded and
+    deserialized from its .pt file only the first time it is used; afterwards every process (pool workers, the UI,
+    later runs) maps the same pages from the OS page cache instead of reading and unpickling its own copy.
+    """
+
+    def __init__(self, voices_dir=VOICES_DIR):
+        self.voices_dir = Path(voices_dir)
+        self._tensors = {}
+        self._lock = threading.Lock()
+
+    def path(self, voice):
+        return self.voices_dir / f'{voice}.npy'
+
+    def ensure(self, voice):
+        """Makes sure voice is in the cache, downloading it if needed, and returns its path."""
+        path = self.path(voice)
+        if not path.exists():
+            pt_file = hf_hub_download(repo_id=KModel.REPO_ID, filename=f'voices/{voice}.pt')
+            pack = torch.load(pt_file, weights_only=True).numpy()
+            self.voices_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f'{voice}.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, pack)
+            os.replace(tmp_path, path)
+        return path
+
+    def load(self, voice):
+        with self._lock:
+            if voice not in self._tensors:
+                # Copy-on-write mapping: pages are shared between processes, and torch gets a writable array
+                self._tensors[voice] = torch.from_numpy(np.load(self.ensure(voice), mmap_mode='c'))
+            return self._tensors[voice]
+
+    def preload(self, pipeline, voice):
+        """Puts voice (or each voice of a 'af_sky,af_bella' blend) into pipeline.voices, where KPipeline looks first."""
+        for name in voice.split(','):
+            if name.endswith('.pt') or name in pipeline.voices:
+                continue  # custom voice files are loaded by KPipeline itself
+            pipeline.voices[name] = self.load(name)
+
+
+voice_cache = VoiceCache()
+
+
+class PipelineRegistry:
+    """
+    Hands out warm KPipelines keyed by language code (the first letter of the voice), instead of loading a new model
+    every time a book, queue item or preview needs one. All pipelines share a single KModel, as kokoro recommends.
+    At most max_pipelines language pipelines are kept; the least recently used one is evicted beyond that.
+    Time spent loading and time saved by reusing warm pipelines are recorded for summary().
+    """
+
+    def __init__(self, max_pipelines=MAX_RESIDENT_PIPELINES):
+        self.max_pipelines = max_pipelines
+        self._pipelines = OrderedDict()  # lang_code -> KPipeline, least recently used first
+        self._load_seconds = {}  # lang_code -> seconds it took to build its pipeline
+        self._model = None
+        self._model_engine = None
+        self._model_threads = None
+        self._model_seconds = 0
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.reuses = 0
+        self.load_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def model(self, engine=None):
+        """The shared KModel for engine (see ENGINES); None means the current torch default device."""
+        engine = engine or default_device()
+        with self._lock:
+            # onnxruntime takes its thread count when the session is created, so follow torch.set_num_threads
+            threads = torch.get_num_threads() if engine == 'onnx' else None
+            if self._model is None or self._model_engine != engine or self._model_threads != threads:
+                start = time.perf_counter()
+                self._model = None  # let the previous model be freed before loading the next one
+                if engine == 'onnx':
+                    from audiblez.onnx_backend import OnnxModel
+                    self._model = OnnxModel(threads=threads)
+                else:
+                    model = KModel().to(engine_device(engine)).eval()
+                    self._model = quantize_model(model) if engine == 'int8' else model
+                self._model_engine, self._model_threads = engine, threads
+                self._model_seconds = time.perf_counter() - start
+                self._pipelines.clear()  # they hold a reference to the previous model
+                self.load_seconds += self._model_seconds
+                print(f'Loaded Kokoro model ({engine}) in {self._model_seconds:.1f}s')
+            return self._model
+
+    def get(self, lang_code, engine=None, voice=None):
+        pipeline = self._get(lang_code, engine)
+        if voice:
+            voice_cache.preload(pipeline, voice)
+        return pipeline
+
+    def _get(self, lang_code, engine):
+        with self._lock:
+            model = self.model(engine)
+            pipeline = self._pipelines.get(lang_code)
+            if pipeline is not None:
+                self._pipelines.move_to_end(lang_code)
+                self.reuses += 1
+                saved = self._load_seconds[lang_code] + self._model_seconds
+                self.saved_seconds += saved
+                print(f'Reusing warm "{lang_code}" pipeline (saved ~{saved:.1f}s of loading)')
+                return pipeline
+
+            start = time.perf_counter()
+            if self._model_engine == 'onnx':
+                from audiblez.onnx_backend import OnnxPipeline
+                pipeline = OnnxPipeline(lang_code, model)
+            else:
+                pipeline = KPipeline(lang_code=lang_code, model=model)
+            self._load_seconds[lang_code] = time.perf_counter() - start
+            self.loads += 1
+            self.load_seconds += self._load_seconds[lang_code]
+            print(f'Loaded "{lang_code}" pipeline in {self._load_seconds[lang_code]:.1f}s')
+            self._pipelines[lang_code] = pipeline
+            while len(self._pipelines) > self.max_pipelines:
+                evicted, _ = self._pipelines.popitem(last=False)
+                print(f'Evicted "{evicted}" pipeline')
+            return pipeline
+
+    def clear(self):
+        with self._lock:
+            self._pipelines.clear()
+            self._model = None
+            self._model_engine = None
+            self._model_threads = None
+
+    def summary(self):
+        return (f'Pipelines: {self.loads} loaded ({self.load_seconds:.1f}s), '
+                f'{self.reuses} reused (~{self.saved_seconds:.1f}s saved)')
+
+
+registry = PipelineRegistry()
+
+
+def get_pipeline(lang_code, engine=None, voice=None):
+    """Returns a warm KPipeline for lang_code from the process-wide registry, with voice preloaded if given."""
+    return registry.get(lang_code, engine, voice)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Trimming of the silence at the edges of each synthesized chunk, replaced by gaps of a controlled length.
+# A chunk is up to pack_max_chars of packed sentences: the pauses between the sentences inside it are the model's.
+import numpy as np
+
+DEFAULT_SENTENCE_GAP = 0.25  # seconds between chunks of the same paragraph
+DEFAULT_PARAGRAPH_GAP = 0.6  # seconds before a chunk that starts a paragraph
+THRESHOLD_DB = -45  # frames quieter than this (RMS, relative to full scale) count as silence
+FRAME_SECONDS = 0.01
+MARGIN_SECONDS = 0.02  # kept on each side of the speech, so soft onsets and releases aren't clipped
+
+
+def speech_bounds(audio, sample_rate=24000, threshold_db=THRESHOLD_DB):
+    """(start, end) sample indices of audio without its leading and trailing silence; (0, 0) if it is all silence."""
+    frame = int(sample_rate * FRAME_SECONDS)
+    frames = -(-len(audio) // frame)
+    padded = np.zeros(frames * frame, dtype=np.float32)
+    padded[:len(audio)] = audio
+    rms = np.sqrt(np.mean(padded.reshape(frames, frame) ** 2, axis=1))
+    loud = np.flatnonzero(rms >= 10 ** (threshold_db / 20))
+    if not len(loud):
+        return 0, 0
+    margin = int(sample_rate * MARGIN_SECONDS)
+    return max(0, loud[0] * frame - margin), min(len(audio), (loud[-1] + 1) * frame + margin)
+
+
+class SilenceTrimmer:
+    """
+    Post-processes the chunks of one chapter, in order: trims each chunk's edge silence and puts a precomputed gap
+    before it, paragraph_gap long if the chunk starts a paragraph, else sentence_gap (no gap before the first chunk).
+    removed_seconds is how much shorter the chapter got. `started` resumes a chapter that already has audio.
+    """
+
+    def __init__(self, sentence_gap=DEFAULT_SENTENCE_GAP, paragraph_gap=DEFAULT_PARAGRAPH_GAP, sample_rate=24000,
+                 started=False):
+        self.sample_rate = sample_rate
+        self.gaps = {False: np.zeros(round(sentence_gap * sample_rate), dtype=np.float32),
+                     True: np.zeros(round(paragraph_gap * sample_rate), dtype=np.float32)}
+        self.started = started
+        self.removed_samples = 0
+
+    @property
+    def removed_seconds(self):
+        return self.removed_samples / self.sample_rate
+
+    def process(self, audio, starts_paragraph=False):
+        audio = np.asarray(audio, dtype=np.float32)
+        start, end = speech_bounds(audio, self.sample_rate)
+        if start == end:
+            self.removed_samples += len(audio)
+            return audio[:0]
+        gap = self.gaps[starts_paragraph] if self.started else self.gaps[False][:0]
+        self.started = True
+        self.removed_samples += len(audio) - (end - start) - len(gap)
+        return np.concatenate([gap, audio[start:end]])
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Lightweight span tracing of a run, saved in the Chrome trace-event format (open it in ui.perfetto.dev or
+# chrome://tracing). Enabled with `audiblez --trace out.json`.
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_DISABLED = nullcontext()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer, self.name, self.cat, self.args = tracer, name, cat, args
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.time_ns()
+        self.tracer.add({'name': self.name, 'cat': self.cat, 'ph': 'X', 'ts': self.start / 1000,
+                         'dur': (end - self.start) / 1000, 'args': self.args})
+
+
+class Tracer:
+    """
+    Collects complete ('X') events for spans of work, per process and thread. While disabled, span() returns a shared
+    no-op context manager, so instrumented code costs next to nothing. Timestamps are wall-clock microseconds, so
+    the events of worker processes line up with the main process's.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events = []
+        self._named_threads = set()
+        self._lock = threading.Lock()
+
+    def enable(self, process_name='audiblez'):
+        self.enabled = True
+        self._events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': process_name}})
+
+    def span(self, name, cat='audiblez', **args):
+        return _Span(self, name, cat, args) if self.enabled else _DISABLED
+
+    def add(self, event):
+        pid, tid = os.getpid(), threading.get_ident()
+        event['pid'], event['tid'] = pid, tid
+        with self._lock:
+            if (pid, tid) not in self._named_threads:
+                self._named_threads.add((pid, tid))
+                self._events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                                     'args': {'name': threading.current_thread().name}})
+            self._events.append(event)
+
+    def take(self):
+        """Returns the events collected so far and forgets them (worker processes send them to the main one)."""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def extend(self, events):
+        with self._lock:
+            self._events.extend(events)
+
+    def save(self, path):
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f'Trace with {len(events)} events written to {path} (open it in https://ui.perfetto.dev)')
+
+
+tracer = Tracer()
+
+
+def span(name, cat='audiblez', **args):
+    """Context manager timing the enclosed block as a span named `name`, when tracing is enabled."""
+    return tracer.span(name, cat, **args)
+
+
+def traced(name=None, cat='audiblez'):
+    """Decorator recording every call of the function as a span (named after the function by default)."""
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(label, cat):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def traced_iter(iterable, name, cat='audiblez', **args):
+    """Yields from iterable, with a span around the production of each item (excluding the consumer's time)."""
+    iterator = iter(iterable)
+    while True:
+        with tracer.span(name, cat, **args):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -26,6 +26,7 @@ import audiblez.database as db  # Changed import for clarity
 import json  # For settings
 
 from audiblez.voices import voices, flags
+from audiblez.silence import DEFAULT_SENTENCE_GAP, DEFAULT_PARAGRAPH_GAP
 # from audiblez.database import load_all_user_settings, save_user_setting # Now use db. prefix
 
 # Theme definitions
@@ -197,6 +198,8 @@ class MainWindow(wx.Frame):
         self.selected_speed = 1.0 # Default speed
         self.custom_rate = None # Default custom rate
         self.m4b_assembly_method = 'original' # Default M4B assembly method
+        self.workers = 1 # Number of synthesis worker processes
+        self.silence_gaps = None # (sentence_gap, paragraph_gap) in seconds, or None to keep the model's pauses
 
         self.queue_processing_active = False
         self.current_queue_item_index = -1 # To track which item in self.queue_items is being processed
@@ -690,10 +693,14 @@ class MainWindow(wx.Frame):
         engine_toggle_panel = wx.Panel(panel)
         self.cpu_toggle = wx.ToggleButton(engine_toggle_panel, label="CPU")
         self.cuda_toggle = wx.ToggleButton(engine_toggle_panel, label="CUDA")
-        self.engine_toggles = [self.cpu_toggle, self.cuda_toggle]
+        self.int8_toggle = wx.ToggleButton(engine_toggle_panel, label="CPU int8")
+        self.int8_toggle.SetToolTip("Dynamically int8-quantized model on CPU: faster, with slightly different audio")
+        self.onnx_toggle = wx.ToggleButton(engine_toggle_panel, label="ONNX")
+        self.onnx_toggle.SetToolTip("ONNX Runtime on CPU. The model is exported to ~/.audiblez/models the first time")
+        self.engine_toggles = [self.cpu_toggle, self.cuda_toggle, self.int8_toggle, self.onnx_toggle]
 
         def on_select_engine(engine_type):
-            torch.set_default_device(engine_type)
+            torch.set_default_device('cpu' if engine_type in ('int8', 'onnx') else engine_type)
             db.save_user_setting('engine', engine_type)  # Use db prefix
             print(f"Engine set to {engine_type} and saved.")
 
@@ -703,17 +710,21 @@ class MainWindow(wx.Frame):
             for toggle in self.engine_toggles:
                 if toggle != toggled_button:
                     toggle.SetValue(False)
-            engine_type = 'cuda' if toggled_button == self.cuda_toggle else 'cpu'
-            on_select_engine(engine_type)
+            on_select_engine(self.get_selected_engine())
 
         self.cpu_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_engine_toggle)
         self.cuda_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_engine_toggle)
+        self.int8_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_engine_toggle)
+        self.onnx_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_engine_toggle)
 
         # Load saved engine or set default
         saved_engine = self.user_settings.get('engine')
         if saved_engine == 'cuda' and torch.cuda.is_available():
             self.cuda_toggle.SetValue(True)
             torch.set_default_device('cuda')
+        elif saved_engine in ('int8', 'onnx'):
+            (self.int8_toggle if saved_engine == 'int8' else self.onnx_toggle).SetValue(True)
+            torch.set_default_device('cpu')
         else:
             self.cpu_toggle.SetValue(True)
             torch.set_default_device('cpu')
@@ -724,6 +735,8 @@ class MainWindow(wx.Frame):
         engine_toggle_panel.SetSizer(engine_toggle_panel_sizer)
         engine_toggle_panel_sizer.Add(self.cpu_toggle, 0, wx.ALL, 5)
         engine_toggle_panel_sizer.Add(self.cuda_toggle, 0, wx.ALL, 5)
+        engine_toggle_panel_sizer.Add(self.int8_toggle, 0, wx.ALL, 5)
+        engine_toggle_panel_sizer.Add(self.onnx_toggle, 0, wx.ALL, 5)
 
         # Create a list of voices with flags
         flag_and_voice_list = []
@@ -782,14 +795,27 @@ class MainWindow(wx.Frame):
 
         self.m4b_assembly_original_toggle = wx.ToggleButton(m4b_assembly_panel, label="Original")
         self.m4b_assembly_crispy_toggle = wx.ToggleButton(m4b_assembly_panel, label="Extra Crispy")
-        self.m4b_toggles = [self.m4b_assembly_original_toggle, self.m4b_assembly_crispy_toggle]
+        self.m4b_assembly_pipe_toggle = wx.ToggleButton(m4b_assembly_panel, label="Pipe")
+        self.m4b_assembly_parallel_toggle = wx.ToggleButton(m4b_assembly_panel, label="Parallel")
+        self.m4b_assembly_stream_toggle = wx.ToggleButton(m4b_assembly_panel, label="Stream")
+        self.m4b_toggles = [self.m4b_assembly_original_toggle, self.m4b_assembly_crispy_toggle,
+                            self.m4b_assembly_pipe_toggle, self.m4b_assembly_parallel_toggle,
+                            self.m4b_assembly_stream_toggle]
 
         help_icon = wx.StaticText(m4b_assembly_panel, label="❓")
         help_icon.SetToolTip(
-            "Original method is time-tested. 'Extra Crispy' is best used when experiencing failures to produce an m4b under the original method, especially in Windows.")
+            "Original method is time-tested. 'Extra Crispy' is best used when experiencing failures to produce an m4b under the original method, especially in Windows. "
+            "'Pipe' feeds the chapters to the encoder directly, without writing a joined copy of the book first. "
+            "'Parallel' encodes the chapters on all CPU cores at once, then joins them; rebuilding a book only "
+            "encodes again the chapters that changed, which the other methods don't. "
+            "'Stream' encodes the audio while it is being read, without writing chapter WAVs: the fastest, "
+            "but an interrupted conversion starts over.")
 
         m4b_assembly_sizer.Add(self.m4b_assembly_original_toggle, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
         m4b_assembly_sizer.Add(self.m4b_assembly_crispy_toggle, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        m4b_assembly_sizer.Add(self.m4b_assembly_pipe_toggle, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        m4b_assembly_sizer.Add(self.m4b_assembly_parallel_toggle, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        m4b_assembly_sizer.Add(self.m4b_assembly_stream_toggle, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
         m4b_assembly_sizer.Add(help_icon, 0, wx.ALIGN_CENTER_VERTICAL)
 
         def on_select_m4b_method(method):
@@ -803,17 +829,38 @@ class MainWindow(wx.Frame):
             for toggle in self.m4b_toggles:
                 if toggle != toggled_button:
                     toggle.SetValue(False)
-            method = 'crispy' if toggled_button == self.m4b_assembly_crispy_toggle else 'original'
+            if toggled_button == self.m4b_assembly_crispy_toggle:
+                method = 'crispy'
+            elif toggled_button == self.m4b_assembly_pipe_toggle:
+                method = 'pipe'
+            elif toggled_button == self.m4b_assembly_parallel_toggle:
+                method = 'parallel'
+            elif toggled_button == self.m4b_assembly_stream_toggle:
+                method = 'stream'
+            else:
+                method = 'original'
             on_select_m4b_method(method)
 
         self.m4b_assembly_original_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_m4b_toggle)
         self.m4b_assembly_crispy_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_m4b_toggle)
+        self.m4b_assembly_pipe_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_m4b_toggle)
+        self.m4b_assembly_parallel_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_m4b_toggle)
+        self.m4b_assembly_stream_toggle.Bind(wx.EVT_TOGGLEBUTTON, on_m4b_toggle)
 
         # Load saved setting or set default
         saved_m4b_method = self.user_settings.get('m4b_assembly_method', 'original')
         if saved_m4b_method == 'crispy':
             self.m4b_assembly_crispy_toggle.SetValue(True)
             self.m4b_assembly_method = 'crispy'
+        elif saved_m4b_method == 'pipe':
+            self.m4b_assembly_pipe_toggle.SetValue(True)
+            self.m4b_assembly_method = 'pipe'
+        elif saved_m4b_method == 'parallel':
+            self.m4b_assembly_parallel_toggle.SetValue(True)
+            self.m4b_assembly_method = 'parallel'
+        elif saved_m4b_method == 'stream':
+            self.m4b_assembly_stream_toggle.SetValue(True)
+            self.m4b_assembly_method = 'stream'
         else:
             self.m4b_assembly_original_toggle.SetValue(True)
             self.m4b_assembly_method = 'original'
@@ -821,6 +868,73 @@ class MainWindow(wx.Frame):
         sizer.Add(m4b_assembly_label, pos=(5, 0), flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=border)
         sizer.Add(m4b_assembly_panel, pos=(5, 1), flag=wx.ALL, border=border)
 
+        # Parallel synthesis workers
+        workers_label = wx.StaticText(panel, label="Workers:")
+        self.workers_spin = wx.SpinCtrl(panel, min=1, max=os.cpu_count() or 1, initial=self.workers)
+        self.workers_spin.SetToolTip(
+            "Number of processes synthesizing chapters in parallel. Each worker loads its own copy of the model.")
+
+        def on_workers_change(event):
+            self.workers = self.workers_spin.GetValue()
+            print(f"Synthesis workers set to {self.workers}.")
+
+        self.workers_spin.Bind(wx.EVT_SPINCTRL, on_workers_change)
+        sizer.Add(workers_label, pos=(6, 0), flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=border)
+        sizer.Add(self.workers_spin, pos=(6, 1), flag=wx.ALL, border=border)
+
+        # Format of the chapter files; core.main reads the saved setting
+        chapter_format_label = wx.StaticText(panel, label="Chapter files:")
+        self.flac_checkbox = wx.CheckBox(panel, label="FLAC")
+        self.flac_checkbox.SetValue(self.user_settings.get('chapter_format') == 'flac')
+        self.flac_checkbox.SetToolTip(
+            "Write the chapters as lossless FLAC instead of WAV: about half the bytes, which helps on network folders.")
+
+        def on_flac_toggle(event):
+            chapter_format = 'flac' if self.flac_checkbox.GetValue() else 'wav'
+            db.save_user_setting('chapter_format', chapter_format)
+            print(f"Chapter file format set to {chapter_format} and saved.")
+
+        self.flac_checkbox.Bind(wx.EVT_CHECKBOX, on_flac_toggle)
+        sizer.Add(chapter_format_label, pos=(7, 0), flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=border)
+        sizer.Add(self.flac_checkbox, pos=(7, 1), flag=wx.ALL, border=border)
+
+        # Even pauses: the silence around each chunk replaced by fixed gaps (see silence.py), off by default
+        pauses_label = wx.StaticText(panel, label="Pauses:")
+        pauses_panel = wx.Panel(panel)
+        pauses_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        pauses_panel.SetSizer(pauses_sizer)
+        saved_gaps = json.loads(self.user_settings.get('silence_gaps') or 'null')
+        self.silence_gaps = tuple(saved_gaps) if saved_gaps else None
+        sentence_gap, paragraph_gap = self.silence_gaps or (DEFAULT_SENTENCE_GAP, DEFAULT_PARAGRAPH_GAP)
+        self.even_pauses_checkbox = wx.CheckBox(pauses_panel, label="Even pauses")
+        self.even_pauses_checkbox.SetValue(self.silence_gaps is not None)
+        self.even_pauses_checkbox.SetToolTip(
+            "Trim the silence the model leaves around each chunk (a few sentences read in one pass) and put the "
+            "gaps below in between. Pauses between the sentences of a chunk are the model's own.")
+        self.sentence_gap_spin = wx.SpinCtrlDouble(pauses_panel, min=0, max=5, initial=sentence_gap, inc=0.05)
+        self.sentence_gap_spin.SetToolTip("Seconds of silence between chunks")
+        self.paragraph_gap_spin = wx.SpinCtrlDouble(pauses_panel, min=0, max=5, initial=paragraph_gap, inc=0.05)
+        self.paragraph_gap_spin.SetToolTip("Seconds of silence before a chunk that starts a paragraph")
+        pauses_sizer.Add(self.even_pauses_checkbox, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        pauses_sizer.Add(self.sentence_gap_spin, 0, wx.RIGHT, 5)
+        pauses_sizer.Add(self.paragraph_gap_spin, 0)
+
+        def on_pauses_change(event):
+            enabled = self.even_pauses_checkbox.GetValue()
+            self.sentence_gap_spin.Enable(enabled)
+            self.paragraph_gap_spin.Enable(enabled)
+            self.silence_gaps = (self.sentence_gap_spin.GetValue(), self.paragraph_gap_spin.GetValue()) if enabled else None
+            db.save_user_setting('silence_gaps', json.dumps(self.silence_gaps))
+            print(f"Even pauses set to {self.silence_gaps} and saved." if enabled else "Even pauses turned off and saved.")
+
+        self.sentence_gap_spin.Enable(self.silence_gaps is not None)
+        self.paragraph_gap_spin.Enable(self.silence_gaps is not None)
+        self.even_pauses_checkbox.Bind(wx.EVT_CHECKBOX, on_pauses_change)
+        self.sentence_gap_spin.Bind(wx.EVT_SPINCTRLDOUBLE, on_pauses_change)
+        self.paragraph_gap_spin.Bind(wx.EVT_SPINCTRLDOUBLE, on_pauses_change)
+        sizer.Add(pauses_label, pos=(8, 0), flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=border)
+        sizer.Add(pauses_panel, pos=(8, 1), flag=wx.ALL, border=border)
+
     def create_synthesis_panel(self):
         # Think and identify layout issue with the folling code
         # --- Replacement for StaticBoxSizer ---
@@ -843,7 +957,13 @@ class MainWindow(wx.Frame):
         # Add Start button
         self.start_button = wx.Button(panel, label="🚀 Start Audiobook Synthesis")
         self.start_button.Bind(wx.EVT_BUTTON, self.on_start)
-        sizer.Add(self.start_button, 0, wx.ALL, 5)
+        self.estimate_button = wx.Button(panel, label="🧮 Estimate")
+        self.estimate_button.SetToolTip("Chapter lengths, expected audio duration and synthesis time, without loading the model")
+        self.estimate_button.Bind(wx.EVT_BUTTON, self.on_estimate)
+        start_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        start_sizer.Add(self.start_button, 0, wx.ALL, 0)
+        start_sizer.Add(self.estimate_button, 0, wx.LEFT, 5)
+        sizer.Add(start_sizer, 0, wx.ALL, 5)
 
         # Add Stop button
         # self.stop_button = wx.Button(panel, label="⏹️ Stop Synthesis")
@@ -885,6 +1005,20 @@ class MainWindow(wx.Frame):
         self.custom_rate_text_ctrl.Bind(wx.EVT_TEXT, self.on_set_custom_rate)
         sizer.Add(self.custom_rate_text_ctrl, 0, wx.ALL | wx.EXPAND, 5)
 
+        # Add torch threads input, with a button to find the fastest value on this machine
+        threads_label = wx.StaticText(panel, label="Torch threads (0 = torch default):")
+        sizer.Add(threads_label, 0, wx.ALL, 5)
+        threads_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        saved_threads = self.user_settings.get('torch_threads') or 0
+        self.threads_spin = wx.SpinCtrl(panel, min=0, max=os.cpu_count() or 1, initial=int(saved_threads))
+        self.threads_spin.Bind(wx.EVT_SPINCTRL, self.on_set_threads)
+        threads_sizer.Add(self.threads_spin, 0, wx.ALL, 0)
+        self.autotune_button = wx.Button(panel, label="Auto-tune")
+        self.autotune_button.SetToolTip("Time a short passage with a few thread counts and keep the fastest")
+        self.autotune_button.Bind(wx.EVT_BUTTON, self.on_autotune_threads)
+        threads_sizer.Add(self.autotune_button, 0, wx.LEFT, 5)
+        sizer.Add(threads_sizer, 0, wx.ALL, 5)
+
     def open_output_folder_dialog(self, event):
         with wx.DirDialog(self, "Choose a directory:", style=wx.DD_DEFAULT_STYLE) as dialog:
             if dialog.ShowModal() == wx.ID_CANCEL:
@@ -897,8 +1031,38 @@ class MainWindow(wx.Frame):
         self.selected_voice = self.voice_dropdown.GetValue()
         db.save_user_setting('voice', self.selected_voice)  # Use db prefix
         print(f"Voice set to {self.selected_voice} and saved.")
+        threading.Thread(target=self.prefetch_voice, args=(self.get_selected_voice(),), daemon=True).start()
         event.Skip()
 
+    def prefetch_voice(self, voice):
+        # Fetch the voice into the local voice cache while the user is still choosing, so previews start faster
+        try:
+            from audiblez.pipelines import voice_cache
+            voice_cache.ensure(voice)
+        except Exception as e:
+            print(f"Could not prefetch voice {voice}: {e}")
+
+    def on_set_threads(self, event):
+        threads = self.threads_spin.GetValue()
+        db.save_user_setting('torch_threads', threads or None)
+        print(f"Torch threads set to {threads or 'torch default'} and saved.")
+
+    def on_autotune_threads(self, event):
+        self.autotune_button.SetLabel("⏳")
+        self.autotune_button.Disable()
+        voice, engine = self.get_selected_voice(), self.get_selected_engine()
+
+        def autotune():
+            import audiblez.core as core
+            try:
+                best, _ = core.autotune_threads(voice, engine)  # saves the setting
+                wx.CallAfter(self.threads_spin.SetValue, best)
+            finally:
+                wx.CallAfter(self.autotune_button.SetLabel, "Auto-tune")
+                wx.CallAfter(self.autotune_button.Enable)
+
+        threading.Thread(target=autotune, daemon=True).start()
+
     def on_set_custom_rate(self, event):
         rate_str = event.GetString()
         if not rate_str: # Empty input
@@ -1593,7 +1757,7 @@ class MainWindow(wx.Frame):
         engine = synthesis_settings.get('engine', 'cpu') # Default to CPU if not specified
 
         # Set device for this specific core.main call
-        torch.set_default_device(engine)
+        torch.set_default_device('cpu' if engine in ('int8', 'onnx') else engine)
         print(f"Setting engine to: {engine} for book: {book_title}")
 
 
@@ -1628,7 +1792,11 @@ class MainWindow(wx.Frame):
             'selected_chapters': chapters_to_synthesize,
             'calibre_metadata': None,
             'calibre_cover_image_path': None,
-            'm4b_assembly_method': synthesis_settings.get('m4b_assembly_method', self.m4b_assembly_method)
+            'm4b_assembly_method': synthesis_settings.get('m4b_assembly_method', self.m4b_assembly_method),
+            'workers': int(synthesis_settings.get('workers', 1)),
+            'engine': engine,
+            # Queued before the setting existed: the model's pauses, like back then
+            'silence_gaps': tuple(synthesis_settings['silence_gaps']) if synthesis_settings.get('silence_gaps') else None,
         }
 
         # Try to get Calibre-specific details for this queued item
@@ -1777,7 +1945,7 @@ class MainWindow(wx.Frame):
             return
 
         # Retrieve current global synthesis settings
-        current_engine = 'cuda' if self.cuda_toggle.GetValue() else 'cpu'
+        current_engine = self.get_selected_engine()
         current_voice = self.voice_dropdown.GetValue()  # This includes the flag
         current_speed = self.speed_text_input.GetValue()
         current_output_folder = self.output_folder_text_ctrl.GetValue()
@@ -1791,6 +1959,8 @@ class MainWindow(wx.Frame):
             'calibre_metadata_override': None,
             'calibre_cover_path_override': None,
             'm4b_assembly_method': self.m4b_assembly_method,
+            'workers': self.workers,
+            'silence_gaps': self.silence_gaps,
         }
 
         # If the current book in UI (self.selected_file_path) was from Calibre,
@@ -1857,7 +2027,8 @@ class MainWindow(wx.Frame):
             })
 
         from audiblez.database import add_staged_book # Import moved here for clarity
-        book_id = add_staged_book(book_title, book_author, source_path, output_folder, chapters_to_stage)
+        book_id = add_staged_book(book_title, book_author, source_path, output_folder, chapters_to_stage,
+                                  voice=self.get_selected_voice())
 
         if book_id is not None:
             wx.MessageBox(f"Book '{book_title}' and its chapters have been staged.", "Book Staged", wx.OK | wx.ICON_INFORMATION)
@@ -2022,7 +2193,7 @@ class MainWindow(wx.Frame):
             })
 
         # Retrieve current global synthesis settings
-        current_engine = 'cuda' if self.cuda_toggle.GetValue() else 'cpu'
+        current_engine = self.get_selected_engine()
         current_voice = self.voice_dropdown.GetValue()
         current_speed = self.speed_text_input.GetValue()
         current_output_folder = self.output_folder_text_ctrl.GetValue()
@@ -2033,6 +2204,8 @@ class MainWindow(wx.Frame):
             'speed': current_speed,
             'output_folder': current_output_folder,
             'm4b_assembly_method': self.m4b_assembly_method,
+            'workers': self.workers,
+            'silence_gaps': self.silence_gaps,
         }
 
         db_queue_details = {
@@ -2060,6 +2233,13 @@ class MainWindow(wx.Frame):
     def get_selected_voice(self):
         return self.voice_dropdown.GetValue().split(' ')[1]
 
+    def get_selected_engine(self):
+        if self.cuda_toggle.GetValue():
+            return 'cuda'
+        if self.int8_toggle.GetValue():
+            return 'int8'
+        return 'onnx' if self.onnx_toggle.GetValue() else 'cpu'
+
     def get_selected_speed(self):
         return float(self.selected_speed)
 
@@ -2071,9 +2251,7 @@ class MainWindow(wx.Frame):
 
         def generate_preview():
             import audiblez.core as core
-            from kokoro import KPipeline
-            pipeline = KPipeline(lang_code=lang_code)
-            core.load_spacy()
+            pipeline = core.get_pipeline(lang_code, self.get_selected_engine(), voice=self.get_selected_voice())
             text = self.selected_chapter.extracted_text[:300]
             if len(text) == 0: return
             audio_segments = core.gen_audio_segments(
@@ -2097,15 +2275,12 @@ class MainWindow(wx.Frame):
         thread.start()
         self.preview_threads.append(thread)
 
+    def get_checked_chapters(self):
+        return [self.document_chapters[i] for i in range(self.table.GetItemCount()) if self.table.IsItemChecked(i)]
+
     def on_start(self, event):
         self.synthesis_in_progress = True
-        file_path = self.selected_file_path
-        voice = self.voice_dropdown.GetValue().split(' ')[1]
-        speed = float(self.selected_speed)
-        selected_chapters = []
-        for i in range(self.table.GetItemCount()):
-            if self.table.IsItemChecked(i):
-                selected_chapters.append(self.document_chapters[i])
+        selected_chapters = self.get_checked_chapters()
         self.start_button.Disable()
         self.params_panel.Disable()
 
@@ -2115,6 +2290,46 @@ class MainWindow(wx.Frame):
                 self.set_table_chapter_status(chapter_index, "Planned")
                 # self.table.SetItem(chapter_index, 0, '✔️') # Checkmarking handled by table.CheckItem in create_chapters_table_panel
 
+        core_params = self.get_core_params(selected_chapters)
+        print('Starting Audiobook Synthesis', core_params)
+        self.core_thread = CoreThread(params=core_params)
+        self.core_thread.start()
+
+    def on_estimate(self, event):
+        core_params = self.get_core_params(self.get_checked_chapters())
+        self.estimate_button.Disable()
+
+        def estimate():
+            import audiblez.core as core
+            try:
+                result = core.main(**core_params, dry_run=True)
+                if result:
+                    wx.CallAfter(self.show_estimate, result)
+            finally:
+                wx.CallAfter(self.estimate_button.Enable)
+
+        threading.Thread(target=estimate, daemon=True).start()
+
+    def show_estimate(self, result):
+        dialog = wx.Dialog(self, title=f"Estimate for {result['title']}", size=(900, 500),
+                           style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        text = wx.TextCtrl(dialog, value=result['table'], style=wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL)
+        text.SetFont(wx.Font(10, wx.MODERN, wx.NORMAL, wx.NORMAL))
+        sizer.Add(text, 1, wx.ALL | wx.EXPAND, 5)
+        sizer.Add(wx.StaticText(dialog, label=f"Estimated with {result['chars_per_sec']:.0f} chars/sec on "
+                                              f"{result['engine']}, the speed measured by the last run (or the custom rate)."),
+                  0, wx.ALL, 5)
+        sizer.Add(dialog.CreateButtonSizer(wx.OK), 0, wx.ALL | wx.ALIGN_RIGHT, 5)
+        dialog.SetSizer(sizer)
+        dialog.ShowModal()
+        dialog.Destroy()
+
+    def get_core_params(self, selected_chapters):
+        """The core.main arguments for converting selected_chapters of the open book with the current settings."""
+        file_path = self.selected_file_path
+        voice = self.voice_dropdown.GetValue().split(' ')[1]
+        speed = float(self.selected_speed)
         core_params = {
             'file_path': file_path, # This is the original input file path
             'voice': voice,
@@ -2124,7 +2339,10 @@ class MainWindow(wx.Frame):
             'selected_chapters': selected_chapters,
             'calibre_metadata': None, # Default to None
             'calibre_cover_image_path': None, # Default to None
-            'm4b_assembly_method': self.m4b_assembly_method
+            'm4b_assembly_method': self.m4b_assembly_method,
+            'workers': self.workers,
+            'engine': self.get_selected_engine(),
+            'silence_gaps': self.silence_gaps,
         }
 
         # Check if this book was loaded via Calibre by inspecting self.book_data
@@ -2140,11 +2358,7 @@ class MainWindow(wx.Frame):
             else:
                 # This case should ideally not happen if UI state is consistent.
                 print("Warning: Mismatch between current file_path and selected_file_path for Calibre data in on_start. Proceeding without Calibre specifics.")
-
-
-        print('Starting Audiobook Synthesis', core_params)
-        self.core_thread = CoreThread(params=core_params)
-        self.core_thread.start()
+        return core_params
 
     def on_open(self, event):
         with wx.FileDialog(self, "Open EPUB File", wildcard="*.epub", style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dialog:
@@ -2312,7 +2526,8 @@ class CoreThread(threading.Thread):
         self.params = params
 
     def run(self):
-        import core
+        # Import through the package so the thread shares core's process-wide state (segmenter etc.) with the UI
+        import audiblez.core as core
         core.main(**self.params, post_event=self.post_event)
 
     def post_event(self, event_name, **kwargs):
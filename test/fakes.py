@@ -0,0 +1,50 @@
+"""Stand-ins for the Kokoro pipeline and for chapter jobs, shared by the synthesis tests."""
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from audiblez.core import pack_max_chars, sample_rate
+
+
+class FakePipeline:
+    """
+    Stands in for KPipeline: each call yields `seconds` of constant audio, or audio(text) if given, after sleeping
+    `delay` seconds. It fails on the chunk whose text starts with `fail_on`, and raises KeyboardInterrupt (a crash)
+    once it was called `crash_after` times. `calls` holds the text of every call.
+    """
+
+    def __init__(self, seconds=0.1, audio=None, delay=0, fail_on=None, crash_after=None):
+        self.seconds = seconds
+        self.audio = audio
+        self.delay = delay
+        self.fail_on = fail_on
+        self.crash_after = crash_after
+        self.calls = []
+
+    def __call__(self, text, voice=None, speed=1, split_pattern=None):
+        if self.fail_on is not None and text.strip().startswith(self.fail_on):  # KPipeline strips the newline too
+            raise RuntimeError('model failure')
+        if self.crash_after is not None and len(self.calls) >= self.crash_after:
+            raise KeyboardInterrupt
+        time.sleep(self.delay)
+        self.calls.append(text)
+        audio = self.audio(text) if self.audio else np.full(round(self.seconds * sample_rate), 0.1, dtype=np.float32)
+        yield text, '', audio
+
+
+def paragraphs(count, prefix='Paragraph '):
+    """count sentences that each start a paragraph, long enough (over half of pack_max_chars) to be chunked alone."""
+    filler = ' and so on' * (pack_max_chars // 20)
+    return [f'\n{prefix}{n}{filler}.' for n in range(count)]
+
+
+def make_jobs(folder, chapters=3, sentences=5):
+    """Jobs for synthesize_chapters_pipelined: `sentences` one-chunk paragraphs per chapter, see paragraphs()."""
+    return [(i, i, Path(folder) / f'chapter_{i}.wav', f'Chapter {i}.', paragraphs(sentences, f'Sentence {i}.'))
+            for i in range(1, chapters + 1)]
+
+
+def make_stats(jobs):
+    return SimpleNamespace(total_chars=sum(len(s) for job in jobs for s in job[4]), processed_chars=0, chars_per_sec=100)
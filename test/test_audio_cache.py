@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from audiblez.audio_cache import AudioCache
+from audiblez.core import model_version
+
+
+class AudioCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = AudioCache('kokoro-test', cache_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_engines_with_their_own_model_do_not_share_entries(self):
+        versions = {engine: model_version(engine) for engine in (None, 'cpu', 'cuda', 'int8', 'onnx')}
+        self.assertEqual(versions[None], versions['cpu'])
+        self.assertEqual(versions['cpu'], versions['cuda'])
+        self.assertEqual(len({versions['cpu'], versions['int8'], versions['onnx']}), 3)
+        keys = {AudioCache(versions[engine], cache_dir=self.tmp.name).key('Hello there.', 'af_sky', 1.0)
+                for engine in ('cpu', 'int8', 'onnx')}
+        self.assertEqual(len(keys), 3)
+
+    def test_round_trip(self):
+        audio = np.linspace(-1, 1, 2400, dtype=np.float32)
+        key = self.cache.key('Hello there.', 'af_sky', 1.0)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, audio)
+        cached = self.cache.get(key)
+        self.assertEqual(cached.dtype, np.float32)
+        np.testing.assert_allclose(cached, audio, atol=1 / 32767)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key(self):
+        key = self.cache.key('Hello  there.\n', 'af_sky', 1.0)
+        self.assertEqual(key, self.cache.key(' Hello there.', 'af_sky', 1))
+        self.assertNotEqual(key, self.cache.key('Hello there.', 'af_bella', 1.0))
+        self.assertNotEqual(key, self.cache.key('Hello there.', 'af_sky', 1.2))
+        other_model = AudioCache('kokoro-other', cache_dir=self.tmp.name)
+        self.assertNotEqual(key, other_model.key('Hello there.', 'af_sky', 1.0))
+
+    def test_evicts_least_recently_used(self):
+        audio = np.zeros(10_000, dtype=np.float32)  # ~20 KB per entry
+        cache = AudioCache('kokoro-test', cache_dir=self.tmp.name, max_bytes=50_000)
+        keys = [cache.key(f'Sentence {i}.', 'af_sky', 1.0) for i in range(3)]
+        for n, key in enumerate(keys[:2]):
+            cache.put(key, audio)
+            os.utime(cache._path(key), (n, n))
+        cache.get(keys[0])  # the first entry is now the most recently used
+        cache.put(keys[2], audio)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertLessEqual(cache.size_bytes(), 50_000)
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from kokoro import KModel
+
+from audiblez.batching import forward_batch, length_buckets
+from audiblez.core import iter_audio_segments, sample_rate
+from fakes import FakePipeline
+
+PHONEMES = 'abdefhijklmnoprstuvwzæðŋɑɔəɛɪʃʊʌʒθˈˌː'
+
+
+def random_kmodel():
+    """Kokoro's architecture with random weights (and a smaller BERT), so no download is needed."""
+    config = {
+        'istftnet': {'upsample_kernel_sizes': [20, 12], 'upsample_rates': [10, 6], 'gen_istft_hop_size': 5,
+                     'gen_istft_n_fft': 20, 'resblock_dilation_sizes': [[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+                     'resblock_kernel_sizes': [3, 7, 11], 'upsample_initial_channel': 512},
+        'dim_in': 64, 'dropout': 0.2, 'hidden_dim': 512, 'max_conv_dim': 512, 'max_dur': 4, 'multispeaker': True,
+        'n_layer': 2, 'n_mels': 80, 'n_token': 178, 'style_dim': 128, 'text_encoder_kernel_size': 5,
+        'plbert': {'hidden_size': 64, 'num_attention_heads': 2, 'intermediate_size': 128,
+                   'max_position_embeddings': 512, 'num_hidden_layers': 2, 'dropout': 0.1},
+        'vocab': {p: i + 1 for i, p in enumerate(PHONEMES)},
+    }
+    torch.manual_seed(0)
+    with tempfile.NamedTemporaryFile(suffix='.pth') as weights:
+        torch.save({}, weights.name)
+        model = KModel(config=config, model=weights.name).eval()
+    source = model.decoder.generator.m_source
+    source.sine_amp = source.l_sin_gen.sine_amp = source.l_sin_gen.noise_std = 0  # no random excitation noise
+    return model
+
+
+class LengthBucketsTest(unittest.TestCase):
+    def test_groups_similar_lengths(self):
+        lengths = [50, 3, 48, 5, 4, 51]
+        self.assertEqual(length_buckets(lengths, 3), [[1, 4, 3], [2, 0, 5]])
+
+    def test_every_index_once(self):
+        buckets = length_buckets([7, 1, 9, 2, 2], 2)
+        self.assertEqual(sorted(i for bucket in buckets for i in bucket), list(range(5)))
+        self.assertTrue(all(len(bucket) <= 2 for bucket in buckets))
+
+
+class ForwardBatchTest(unittest.TestCase):
+    def test_matches_unbatched_forward(self):
+        # float64, so that any difference comes from batching rather than rounding
+        default_dtype = torch.get_default_dtype()
+        torch.set_default_dtype(torch.float64)
+        try:
+            model = random_kmodel()
+            torch.manual_seed(1)
+            voice = torch.randn(510, 1, 256) * 0.1
+            phonemes = [PHONEMES[i:i + n] for i, n in [(0, 5), (3, 9), (10, 12), (20, 7)]]
+            unbatched = [model(ps, voice[len(ps) - 1], 1) for ps in phonemes]
+            batched = forward_batch(model, phonemes, torch.cat([voice[len(ps) - 1] for ps in phonemes]), 1, 4)
+        finally:
+            torch.set_default_dtype(default_dtype)
+        for expected, audio in zip(unbatched, batched):
+            self.assertEqual(audio.shape, expected.shape)
+            # Only the last few samples see the next (padding) frame in the inverse STFT
+            np.testing.assert_allclose(audio[:-4], expected[:-4], rtol=1e-6, atol=1e-6 * expected.abs().max())
+
+
+def text_length_audio(text):
+    return np.full(len(text), len(text), dtype=np.float32)
+
+
+class BatchedSegmentsTest(unittest.TestCase):
+    def test_same_chunks_and_progress_as_unbatched(self):
+        sentences = [f'\nSentence {"x" * i}.' for i in range(20)]
+        results = []
+        for batch_size in (1, 4):
+            stats = SimpleNamespace(total_chars=sum(map(len, sentences)), processed_chars=0, chars_per_sec=sample_rate)
+            progress, done = [], []
+            audio = list(iter_audio_segments(FakePipeline(audio=text_length_audio), '', 'af_sky', 1.0, stats, sentences=sentences,
+                                             verbose=False, batch_size=batch_size, on_chunk_done=done.append,
+                                             post_event=lambda name, stats: progress.append(stats.processed_chars)))
+            results.append(([a.tolist() for a in audio], progress, done))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][1][-1], sum(map(len, sentences)))
+
+
+if __name__ == '__main__':
+    unittest.main()
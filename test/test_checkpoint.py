@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+from audiblez.core import synthesize_chapter, sample_rate
+from fakes import FakePipeline, paragraphs
+
+
+def counting_pipeline(crash_after=None):
+    """One second of audio per call, at a level that numbers the call (0.01 for the first)."""
+    pipeline = FakePipeline(crash_after=crash_after,
+                            audio=lambda text: np.full(sample_rate, len(pipeline.calls) / 100, dtype=np.float32))
+    return pipeline
+
+
+class ChapterCheckpointTest(unittest.TestCase):
+    sentences = paragraphs(10)  # one pipeline call per paragraph
+
+    def synthesize(self, path, pipeline):
+        return synthesize_chapter(pipeline, path, '', 'af_sky', 1.0, sentences=self.sentences)
+
+    def test_crash_leaves_no_chapter_file_and_resumes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.wav'
+            with self.assertRaises(KeyboardInterrupt):
+                self.synthesize(path, counting_pipeline(crash_after=4))
+            self.assertFalse(path.exists())
+
+            pipeline = counting_pipeline()
+            frames = self.synthesize(path, pipeline)
+            self.assertEqual(len(pipeline.calls), 6)
+            self.assertEqual(frames, 10 * sample_rate)
+            audio, _ = soundfile.read(str(path))
+            self.assertEqual(len(audio), frames)
+            self.assertAlmostEqual(audio[3 * sample_rate], 0.04, places=3)  # written before the crash
+            self.assertAlmostEqual(audio[4 * sample_rate], 0.01, places=3)  # first chunk of the resumed run
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ['chapter.wav'])
+
+    def test_changed_text_starts_over(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.wav'
+            with self.assertRaises(KeyboardInterrupt):
+                self.synthesize(path, counting_pipeline(crash_after=4))
+            pipeline = counting_pipeline()
+            synthesize_chapter(pipeline, path, '', 'af_bella', 1.0, sentences=self.sentences)
+            self.assertEqual(len(pipeline.calls), 10)
+
+    def test_flac_chapter_is_lossless_and_restarts_after_a_crash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.flac'
+            with self.assertRaises(KeyboardInterrupt):
+                self.synthesize(path, counting_pipeline(crash_after=4))
+            self.assertEqual([p.name for p in Path(tmp).iterdir()], ['chapter.flac.part'])
+
+            pipeline = counting_pipeline()
+            frames = self.synthesize(path, pipeline)
+            self.assertEqual(len(pipeline.calls), 10)
+            self.assertEqual(soundfile.info(str(path)).format, 'FLAC')
+            wav_path = Path(tmp) / 'chapter.wav'
+            self.synthesize(wav_path, counting_pipeline())
+            flac_audio, _ = soundfile.read(str(path), dtype='int16')
+            wav_audio, _ = soundfile.read(str(wav_path), dtype='int16')
+            self.assertEqual(len(flac_audio), frames)
+            np.testing.assert_array_equal(flac_audio, wav_audio)
+            self.assertLess(path.stat().st_size, wav_path.stat().st_size)
@@ -0,0 +1,29 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from audiblez import database as db
+
+
+class UserSettingsTest(unittest.TestCase):
+    def setUp(self):
+        home = tempfile.TemporaryDirectory()
+        self.addCleanup(home.cleanup)
+        patch = mock.patch.dict(os.environ, {'HOME': home.name})  # the database lives in ~/.audiblez
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_every_setting_round_trips(self):
+        for column in db.USER_SETTINGS_COLUMNS:
+            db.save_user_setting(column, f'{column} value')
+        self.assertEqual(db.load_all_user_settings(), {column: f'{column} value' for column in db.USER_SETTINGS_COLUMNS})
+
+    def test_silence_gaps_round_trip(self):
+        db.save_user_setting('silence_gaps', json.dumps((0.4, 1.2)))
+        self.assertEqual(json.loads(db.load_user_setting('silence_gaps')), [0.4, 1.2])
+        self.assertEqual(json.loads(db.load_all_user_settings()['silence_gaps']), [0.4, 1.2])
+
+    def test_added_columns_are_settings(self):
+        self.assertLessEqual(set(db.ADDED_USER_SETTINGS_COLUMNS), set(db.USER_SETTINGS_COLUMNS))
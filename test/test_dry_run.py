@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from audiblez import core
+
+
+class DryRunTest(unittest.TestCase):
+    @mock.patch('audiblez.core.get_pipeline', side_effect=AssertionError('the model must not be loaded'))
+    @mock.patch('audiblez.core.starting_chars_per_sec', return_value=100)
+    def test_estimates_each_chapter(self, starting_chars_per_sec, get_pipeline):
+        chapters = [
+            SimpleNamespace(title='One', extracted_text='First sentence. Second sentence.\nThird one here.'),
+            SimpleNamespace(title='Empty', extracted_text='.'),
+            SimpleNamespace(title='Three', extracted_text='A much longer chapter. ' * 30),
+        ]
+        estimate = core.estimate_book(chapters, 'Book', 'Author', 'af_sky', 1.5, 'cpu')
+        starting_chars_per_sec.assert_called_once_with('cpu', 'a', 1)
+        self.assertEqual([row['name'] for row in estimate['chapters']], ['One', 'Three'])
+        one, three = estimate['chapters']
+        self.assertEqual(one['chars'], len(core.apply_filters('Book – Author.\n\n' + chapters[0].extracted_text)))
+        self.assertEqual(three['sentences'], 30)
+        self.assertAlmostEqual(three['synthesis_seconds'], three['chars'] / 100)
+        self.assertAlmostEqual(three['audio_seconds'], three['chars'] / (core.spoken_chars_per_sec * 1.5))
+        self.assertEqual(estimate['chars'], one['chars'] + three['chars'])
+        self.assertIn('Total', estimate['table'])
+
+    @mock.patch('audiblez.core.get_pipeline', side_effect=AssertionError('the model must not be loaded'))
+    @mock.patch('audiblez.core.starting_chars_per_sec', return_value=100)
+    def test_leaves_no_output_folder(self, starting_chars_per_sec, get_pipeline):
+        chapter = SimpleNamespace(title='One', extracted_text='A sentence. ' * 10, get_name=lambda: 'One')
+        with tempfile.TemporaryDirectory() as tmp:
+            output_folder = Path(tmp) / 'out'
+            estimate = core.main('book.epub', 'af_sky', False, 1.0, output_folder=str(output_folder),
+                                 selected_chapters=[chapter], calibre_metadata={'title': 'Book'}, dry_run=True)
+            self.assertEqual(len(estimate['chapters']), 1)
+            self.assertFalse(output_folder.exists())
+
+    @mock.patch('audiblez.core.load_user_setting', return_value=None)
+    def test_pool_speed_is_kept_apart_from_the_single_process_speed(self, load_user_setting):
+        rates = {('cpu', 'a', 1): 40, ('cpu', 'a', 4): 150}
+        with mock.patch('audiblez.core.load_measured_rate', lambda engine, lang, workers=1: rates.get((engine, lang, workers))):
+            self.assertEqual(core.starting_chars_per_sec('cpu', 'a'), 40)
+            self.assertEqual(core.starting_chars_per_sec('cpu', 'a', 4), 150)
+            self.assertEqual(core.starting_chars_per_sec('cpu', 'a', 2), 40)  # no 2-worker run yet
+
+    def test_totals_across_books(self):
+        books = [{'title': title, 'chapters': [{}] * chapters, 'chars': chars, 'sentences': chars // 10,
+                  'audio_seconds': chars / 15, 'synthesis_seconds': chars / 50}
+                 for title, chapters, chars in [('One', 2, 3000), ('Two', 5, 12000)]]
+        totals = core.estimate_books(books)
+        self.assertEqual(totals['chars'], 15000)
+        self.assertEqual(totals['sentences'], 1500)
+        self.assertAlmostEqual(totals['synthesis_seconds'], 300)
+        self.assertIn('Total (2 books)', totals['table'])
+        self.assertIn('Two', totals['table'])
+
+
+if __name__ == '__main__':
+    unittest.main()
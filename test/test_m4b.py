@@ -0,0 +1,294 @@
+import io
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import soundfile
+
+from audiblez.core import concat_output, create_index_file, synthesize_chapters_pipelined, sample_rate
+from audiblez.checkpoint import ChapterWriter
+from audiblez.m4b import (EncodedChapterCache, StreamedChapter, StreamingM4bEncoder, adts_frame_count,
+                          chapter_bounds_ms, create_m4b_parallel, create_m4b_piped, iter_chapter_pcm,
+                          wav_pcm16_samples, write_index_file)
+from fakes import FakePipeline, make_jobs, make_stats
+
+
+class FakeEncoder:
+    def __init__(self, folder):
+        self.audio_path = Path(folder) / 'book.stream.m4a'
+        self.chapter_frames = []
+        self.audio = []
+
+    def write(self, audio):
+        self.audio.append(audio)
+
+
+def adts_frames(count, payload=b'aac'):
+    """count ADTS frames of one raw data block each, holding payload instead of actual AAC."""
+    length = 7 + len(payload)
+    header = bytes([0xFF, 0xF1, 0x58, 0x80 | length >> 11, length >> 3 & 0xFF, (length & 0x07) << 5 | 0x1F, 0xFC])
+    return (header + payload) * count
+
+
+class FakeFfmpeg:
+    """
+    Stands in for subprocess.run of ffmpeg: writes a dummy output file, one ADTS frame per byte of the source for
+    AAC encodes, and records the encodes and the files joined by the concat protocol.
+    """
+
+    def __init__(self):
+        self.encoded, self.overlap, self.lists = [], [], []
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, command, **kwargs):
+        source = command[command.index('-i') + 1]
+        if source.startswith('concat:'):
+            self.lists.append(source)
+        elif 'adts' in command:
+            with self.lock:
+                self.encoded.append(source)
+                self.running.add(source)
+                self.overlap.append(len(self.running))
+            time.sleep(0.05)
+            with self.lock:
+                self.running.discard(source)
+            Path(command[-1]).write_bytes(adts_frames(len(Path(source).read_bytes())))
+            return subprocess.CompletedProcess(command, 0, '', '')
+        else:
+            with self.lock:
+                self.encoded.append(source)
+                self.running.add(source)
+                self.overlap.append(len(self.running))
+            time.sleep(0.05)
+            with self.lock:
+                self.running.discard(source)
+        Path(command[-1]).write_bytes(b'aac')
+        return subprocess.CompletedProcess(command, 0, '', '')
+
+
+class FakeEncoderProcess:
+    """Stands in for the subprocess.Popen of the streaming AAC encoder, keeping what is written to its stdin."""
+
+    def __init__(self, command, **kwargs):
+        self.command = command
+        self.received = bytearray()
+        self.stdin = io.BufferedWriter(io.BytesIO())
+        self.stdin.raw.close = lambda: self.received.extend(self.stdin.raw.getvalue())
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        Path(self.command[-1]).write_bytes(b'aac')
+        self.returncode = 0
+        return 0
+
+
+def make_wavs(folder):
+    wavs = [Path(folder) / f'book_chapter_{i}.wav' for i in (1, 2, 3)]
+    for i, wav in enumerate(wavs, start=1):
+        wav.write_bytes(f'chapter {i}'.encode())
+    write_index_file(Path(folder) / 'chapters.txt', 'Book', 'Author', chapter_bounds_ms([sample_rate] * 3))
+    return wavs
+
+
+def tone_chapters(folder, seconds):
+    """Chapter WAVs of a tone with 0.1 s of silence at both ends, like synthesized speech, with their sample counts."""
+    chapters = {}
+    for n, length in enumerate(seconds, start=1):
+        audio = 0.3 * np.sin(2 * np.pi * 220 * n * np.arange(round(length * sample_rate)) / sample_rate)
+        audio[:sample_rate // 10] = audio[-sample_rate // 10:] = 0
+        path = Path(folder) / f'book_chapter_{n}.wav'
+        soundfile.write(path, audio, sample_rate, subtype='PCM_16')
+        chapters[path] = len(audio)
+    return chapters
+
+
+class M4bTest(unittest.TestCase):
+    def test_index_file_from_sample_counts(self):
+        bounds = chapter_bounds_ms([sample_rate, sample_rate * 3 // 2 + 7, sample_rate // 2])
+        self.assertEqual(bounds, [(0, 1000), (1000, 2500), (2500, 3000)])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapters.txt'
+            write_index_file(path, 'Book', 'Author', bounds[:2])
+            self.assertEqual(path.read_text(encoding='utf-8'),
+                             ';FFMETADATA1\ntitle=Book\nartist=Author\n\n'
+                             '[CHAPTER]\nTIMEBASE=1/1000\nSTART=0\nEND=1000\ntitle=Chapter 0\n\n'
+                             '[CHAPTER]\nTIMEBASE=1/1000\nSTART=1000\nEND=2500\ntitle=Chapter 1\n\n')
+
+    @mock.patch('audiblez.core.subprocess.run', side_effect=AssertionError('no ffprobe needed'))
+    def test_index_file_uses_counted_samples_then_wav_headers(self, run):
+        with tempfile.TemporaryDirectory() as tmp:
+            synthesized, skipped = Path(tmp) / 'chapter_1.wav', Path(tmp) / 'chapter_2.wav'
+            soundfile.write(skipped, np.zeros(sample_rate * 2, dtype=np.float32), sample_rate)
+            create_index_file('Book', 'Author', [synthesized, skipped], tmp, {synthesized: sample_rate // 2})
+            text = (Path(tmp) / 'chapters.txt').read_text(encoding='utf-8')
+        self.assertIn('START=0\nEND=500\ntitle=Chapter 0', text)
+        self.assertIn('START=500\nEND=2500\ntitle=Chapter 1', text)
+
+    def test_concat_output_follows_the_chapter_format(self):
+        self.assertEqual(concat_output(['a.wav', 'b.wav'], '.mp4'), ('.mp4', ['-c', 'copy']))
+        self.assertEqual(concat_output(['a.flac', 'b.FLAC'], '.wav'), ('.flac', ['-c', 'copy']))
+        self.assertEqual(concat_output(['a.wav', 'b.flac'], '.wav'), ('.flac', ['-c:a', 'flac']))
+
+    def test_streamed_chapters_skip_the_wav_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(tmp)
+            encoder = FakeEncoder(tmp)
+            written = synthesize_chapters_pipelined(FakePipeline(), jobs, 'af_sky', 1.0, make_stats(jobs),
+                                                    open_chapter=lambda path, fingerprint: StreamedChapter(encoder))
+            self.assertEqual(written, {job[2]: 5 * sample_rate // 10 for job in jobs})
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+        self.assertEqual(encoder.chapter_frames, [5 * sample_rate // 10] * 3)
+        self.assertEqual(sum(map(len, encoder.audio)), sum(encoder.chapter_frames))
+
+    def test_parallel_encodes_chapters_concurrently_then_joins_them(self):
+        ffmpeg = FakeFfmpeg()
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('audiblez.m4b.subprocess.run', ffmpeg):
+            wavs = make_wavs(tmp)
+            path = create_m4b_parallel(wavs, 'book.epub', b'jpeg', tmp, workers=3)
+            self.assertEqual(path, Path(tmp) / 'book.m4b')
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()),
+                             ['book.m4b'] + [w.name for w in wavs] + ['chapters.txt'])
+            marks = (Path(tmp) / 'chapters.txt').read_text(encoding='utf-8')
+        self.assertEqual(max(ffmpeg.overlap), 3)
+        self.assertEqual(ffmpeg.lists, ['concat:' + '|'.join(w.with_suffix('.aac').resolve().as_posix() for w in wavs)])
+        # 9 frames per chapter: the marks follow the encoded audio, not the sample counts of chapters.txt
+        frames_ms = 9 * 1024 * 1000 // sample_rate
+        self.assertIn(f'START=0\nEND={frames_ms}\n', marks)
+        self.assertIn(f'START={2 * frames_ms}\nEND={3 * frames_ms}\n', marks)
+
+    def test_adts_frames_are_counted_from_their_headers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.aac'
+            path.write_bytes(adts_frames(5, b'x' * 300) + adts_frames(2))
+            self.assertEqual(adts_frame_count(path), 7)
+            path.write_bytes(b'RIFF....WAVE')
+            self.assertRaises(RuntimeError, adts_frame_count, path)
+
+    def test_rebuild_only_encodes_changed_chapters(self):
+        ffmpeg = FakeFfmpeg()
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('audiblez.m4b.subprocess.run', ffmpeg):
+            cache = EncodedChapterCache(Path(tmp) / 'cache')
+            wavs = make_wavs(tmp)
+            create_m4b_parallel(wavs, 'book.epub', None, tmp, cache=cache)
+            self.assertEqual(len(ffmpeg.encoded), 3)
+            create_m4b_parallel(wavs, 'book.epub', None, tmp, cache=cache)
+            self.assertEqual(len(ffmpeg.encoded), 3)
+            wavs[1].write_bytes(b'chapter 4')  # as long as the others, so all the entries have the same size
+            create_m4b_parallel(wavs, 'book.epub', None, tmp, cache=cache)
+            self.assertEqual(ffmpeg.encoded[3:], [str(wavs[1])])
+            self.assertEqual((cache.hits, cache.misses), (5, 4))
+            self.assertEqual(len(list(cache.cache_dir.glob('*/*.aac'))), 4)
+            self.assertEqual(len(set(ffmpeg.lists)), 2)
+
+            cache.max_bytes = 2 * len(adts_frames(len(b'chapter 1')))
+            cache.evict()
+            self.assertEqual(len(list(cache.cache_dir.glob('*/*.aac'))), 2)
+
+    def test_wav_samples_are_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = np.sin(np.arange(sample_rate) / 10).astype(np.float32) * 0.5
+            for suffix in ('wav', 'flac'):
+                writer = ChapterWriter(Path(tmp) / f'chapter.{suffix}', '')
+                writer.write(audio)
+                writer.finish()
+            expected, _ = soundfile.read(Path(tmp) / 'chapter.wav', dtype='int16')
+            samples = wav_pcm16_samples(Path(tmp) / 'chapter.wav')
+            self.assertIsInstance(samples, np.memmap)
+            np.testing.assert_array_equal(samples, expected)
+            self.assertIsNone(wav_pcm16_samples(Path(tmp) / 'chapter.flac'))
+            for suffix in ('wav', 'flac'):
+                blocks = list(iter_chapter_pcm(Path(tmp) / f'chapter.{suffix}', block_frames=10000))
+                self.assertEqual([len(b) for b in blocks], [10000, 10000, 4000])
+                np.testing.assert_array_equal(np.concatenate(blocks), expected)
+            del samples, blocks
+
+    def test_pipe_feeds_the_chapter_files_to_one_encoder(self):
+        processes = []
+
+        def popen(command, **kwargs):
+            processes.append(FakeEncoderProcess(command, **kwargs))
+            return processes[-1]
+
+        ffmpeg = FakeFfmpeg()
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('audiblez.m4b.subprocess.Popen', popen), \
+                mock.patch('audiblez.m4b.subprocess.run', ffmpeg):
+            chapters = [Path(tmp) / 'book_chapter_1.wav', Path(tmp) / 'book_chapter_2.flac']
+            for n, path in enumerate(chapters, start=1):
+                soundfile.write(path, np.full(n * sample_rate, n * 1000, dtype=np.int16), sample_rate)
+            (Path(tmp) / 'chapters.txt').write_text('index')
+            path = create_m4b_piped(chapters, 'book.epub', None, tmp)
+            self.assertEqual(path, Path(tmp) / 'book.m4b')
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()),
+                             ['book.m4b', 'book_chapter_1.wav', 'book_chapter_2.flac', 'chapters.txt'])
+            self.assertEqual((Path(tmp) / 'chapters.txt').read_text(), 'index')
+        process, = processes
+        self.assertIn('s16le', process.command)
+        pcm = np.frombuffer(bytes(process.received), dtype='<i2')
+        np.testing.assert_array_equal(pcm, np.repeat([1000, 2000], [sample_rate, 2 * sample_rate]))
+        self.assertEqual(ffmpeg.encoded, [str(Path(tmp) / 'book.stream.m4a')])  # the final mux, a stream copy
+
+    @unittest.skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), 'ffmpeg is not installed')
+    def test_streaming_encoder_creates_m4b(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            encoder = StreamingM4bEncoder(tmp, 'book.epub', 'Book', 'Author')
+            for seconds in (1, 2):
+                chapter = encoder.chapter()
+                chapter.write(np.full(seconds * sample_rate, 0.1, dtype=np.float32))
+                chapter.finish()
+            path = encoder.close()
+            self.assertEqual(path, Path(tmp) / 'book.m4b')
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ['book.m4b', 'chapters.txt'])
+            probe = subprocess.run(['ffprobe', '-v', 'quiet', '-of', 'json', '-show_chapters', str(path)],
+                                   capture_output=True, text=True, check=True)
+            chapters = json.loads(probe.stdout)['chapters']
+            self.assertEqual([float(c['end_time']) for c in chapters], [1.0, 3.0])
+
+    @unittest.skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), 'ffmpeg is not installed')
+    def test_parallel_chapter_marks_match_the_joined_audio(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            chapters = tone_chapters(tmp, [1.3, 2.71, 0.9, 3.05, 1.77, 2.2])
+            create_index_file('Book', 'Author', list(chapters), tmp, chapters)
+            path = create_m4b_parallel(list(chapters), 'book.epub', None, tmp, workers=2)
+            probe = subprocess.run(['ffprobe', '-v', 'quiet', '-of', 'json', '-show_chapters', '-show_format',
+                                    str(path)], capture_output=True, text=True, check=True)
+            probe = json.loads(probe.stdout)
+            pcm = subprocess.run(['ffmpeg', '-v', 'error', '-i', str(path), '-f', 's16le', '-'],
+                                 capture_output=True, check=True).stdout
+        audio = np.frombuffer(pcm, dtype='<i2')
+        marks = [float(c['start_time']) for c in probe['chapters']]
+        self.assertAlmostEqual(float(probe['chapters'][-1]['end_time']), float(probe['format']['duration']), delta=0.002)
+        self.assertAlmostEqual(len(audio) / sample_rate, float(probe['format']['duration']), delta=0.002)
+        self.assertGreaterEqual(len(audio), sum(chapters.values()))
+        # Every chapter's tone starts the same time after its mark (its silence and the encoder priming), without
+        # drifting from one chapter to the next, and nothing but silence is heard around the chapter boundaries
+        loud = np.flatnonzero(np.abs(audio) > 3000)
+        onsets = [loud[0]] + [b for a, b in zip(loud[:-1], loud[1:]) if b - a > sample_rate // 10]
+        delays = [onset / sample_rate - mark for onset, mark in zip(onsets, marks)]
+        self.assertEqual(len(onsets), len(chapters))
+        self.assertLess(max(delays) - min(delays), 0.003)
+        for mark in marks[1:]:
+            start = round(mark * sample_rate)
+            self.assertLess(np.abs(audio[start - sample_rate // 20:start + sample_rate // 20]).max(), 100)
+
+    def test_empty_chapter_gets_no_mark(self):
+        encoder = SimpleNamespace(audio_path=Path('unused'), chapter_frames=[], write=lambda audio: None)
+        chapter = StreamedChapter(encoder)
+        chapter.close()
+        self.assertEqual(chapter.finish(), 0)
+        self.assertEqual(encoder.chapter_frames, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
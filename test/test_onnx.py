@@ -0,0 +1,65 @@
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import torch
+
+from audiblez.onnx_backend import OnnxModel, export_onnx
+from audiblez.pipelines import PipelineRegistry
+from test_batching import PHONEMES, random_kmodel
+
+
+def with_fixed_noise(model):
+    """
+    Adds a fixed noise to the harmonic source of the model, so that its STFT has well defined phases: random_kmodel's
+    source is a constant, which leaves the phase of all but the DC bin to rounding noise. The first frame is left
+    silent, as reflection padding makes it symmetric, with rounding noise for imaginary parts even in torch.stft.
+    """
+    source = model.decoder.generator.m_source
+    n_fft = model.decoder.generator.stft.filter_length
+    noise = torch.randn(1, 100_000, 1, generator=torch.Generator().manual_seed(0)) * 0.1
+    noise[:, :n_fft // 2 + 1] = 0
+    forward = source.forward
+
+    def forward_with_noise(f0):
+        har_source, noise_source, uv = forward(f0)
+        length = har_source.shape[1]
+        return torch.where(noise[:, :length] != 0, har_source + noise[:, :length], 0), noise_source, uv
+
+    source.forward = forward_with_noise
+    return model
+
+
+@unittest.skipUnless(importlib.util.find_spec('onnxruntime') and importlib.util.find_spec('onnx'),
+                     'onnxruntime is not installed')
+class OnnxExportTest(unittest.TestCase):
+    def test_matches_torch(self):
+        model = with_fixed_noise(random_kmodel())
+        torch.manual_seed(1)
+        ref_s = torch.randn(1, 256) * 0.3
+        with tempfile.TemporaryDirectory() as tmp:
+            onnx_model = OnnxModel(export_onnx(Path(tmp) / 'kokoro.onnx', model), threads=1)
+            for phonemes in [PHONEMES[:5], PHONEMES[3:19], PHONEMES[:30]]:
+                with torch.no_grad():
+                    expected = model(phonemes, ref_s, 1)
+                audio = onnx_model(phonemes, ref_s, 1)
+                self.assertEqual(audio.shape, expected.shape)
+                self.assertLess((audio - expected).abs().max().item(), 1e-4)
+
+
+class OnnxSessionThreadsTest(unittest.TestCase):
+    def test_session_follows_torch_threads(self):
+        original_threads = torch.get_num_threads()
+        registry = PipelineRegistry()
+        try:
+            with mock.patch('audiblez.onnx_backend.OnnxModel', lambda threads: mock.Mock(threads=threads)):
+                torch.set_num_threads(1)
+                model = registry.model('onnx')
+                self.assertIs(registry.model('onnx'), model)
+                torch.set_num_threads(2)
+                self.assertEqual(registry.model('onnx').threads, 2)
+        finally:
+            torch.set_num_threads(original_threads)
@@ -0,0 +1,32 @@
+import unittest
+
+from audiblez.core import pack_sentences
+
+
+class PackSentencesTest(unittest.TestCase):
+    def test_merges_short_sentences(self):
+        packs = pack_sentences(['Yes.', ' He nodded.', ' "In a minute."'], max_chars=100)
+        self.assertEqual(packs, [('Yes. He nodded. "In a minute."', 30)])
+
+    def test_respects_max_chars(self):
+        sentences = ['a' * 30 + '.', ' ' + 'b' * 30 + '.', ' ' + 'c' * 30 + '.']
+        packs = pack_sentences(sentences, max_chars=70)
+        self.assertEqual(len(packs), 2)
+        self.assertTrue(all(chars <= 70 for _, chars in packs))
+
+    def test_long_sentence_gets_its_own_chunk(self):
+        packs = pack_sentences(['Short.', ' ' + 'x' * 200 + '.', ' Tail.'], max_chars=50)
+        self.assertEqual([text for text, _ in packs], ['Short.', 'x' * 200 + '.', 'Tail.'])
+
+    def test_packs_across_paragraphs_keeping_the_breaks(self):
+        packs = pack_sentences(['"Yes."', '\nHe nodded.', ' "Now?"', '\n"Now."'], max_chars=400)
+        self.assertEqual(packs, [('"Yes." \nHe nodded. "Now?" \n"Now."', 31)])
+        packs = pack_sentences(['First paragraph.', '\nSecond paragraph.', ' Same paragraph.'], max_chars=40)
+        self.assertEqual([text for text, _ in packs], ['First paragraph. \nSecond paragraph.', 'Same paragraph.'])
+        packs = pack_sentences(['First paragraph.', '\nSecond paragraph.'], max_chars=20)
+        self.assertEqual([text for text, _ in packs], ['First paragraph.', '\nSecond paragraph.'])
+
+    def test_char_accounting_is_exact(self):
+        sentences = ['One.', ' Two.', '\n', '\nThree.', ' ' + 'y' * 500 + '.', ' Four.']
+        packs = pack_sentences(sentences, max_chars=100)
+        self.assertEqual(sum(chars for _, chars in packs), sum(map(len, sentences)))
@@ -0,0 +1,77 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from kokoro import KPipeline
+
+from audiblez.core import set_espeak_library
+from audiblez import phonemes
+from audiblez.phonemes import PhonemeCache, phonemize, prephonemize_chunks
+
+
+class CountingG2P:
+    def __init__(self, g2p):
+        self.g2p = g2p
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return self.g2p(text)
+
+
+class PhonemeCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        set_espeak_library()
+        cls.pipeline = KPipeline(lang_code='e', model=False)
+
+    def test_phonemizes_each_text_once(self):
+        g2p = self.pipeline.g2p = CountingG2P(self.pipeline.g2p)
+        self.addCleanup(setattr, self.pipeline, 'g2p', g2p.g2p)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'phonemes.db')
+            cache = PhonemeCache(path)
+            text = 'Hola, me llamo Ana.\n\n\nEncantada.'
+            phonemes = cache.phonemize(self.pipeline, text)
+            self.assertEqual(phonemes, phonemize(self.pipeline, text))
+            calls = g2p.calls
+
+            self.assertEqual(cache.phonemize(self.pipeline, text), phonemes)
+            self.assertEqual(PhonemeCache(path).phonemize(self.pipeline, text.replace(' ', '  ')), phonemes)
+            self.assertEqual(g2p.calls, calls)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_prephonemize_counts_its_misses_and_locks_per_chunk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = PhonemeCache(str(Path(tmp) / 'phonemes.db'))
+            chunks = [('Hola.', 5), ('\nAdiós.', 7), (' ', 1)]
+            self.assertEqual(prephonemize_chunks('e', chunks, cache), 2)
+            cache.misses += 10  # other threads' lookups don't count
+            # Cached chunks need no G2P, so they don't wait for another thread phonemizing
+            results = []
+            with phonemes._g2p_lock:
+                thread = threading.Thread(target=lambda: results.append(prephonemize_chunks('e', chunks, cache)))
+                thread.start()
+                thread.join(timeout=5)
+            self.assertEqual(results, [0])
+
+    def test_fallback_words_are_cached(self):
+        words = []
+
+        def fallback(token):
+            words.append(token.text)
+            return token.text.upper(), 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'phonemes.db')
+            for _ in range(2):
+                pipeline = SimpleNamespace(lang_code='a', g2p=SimpleNamespace(fallback=fallback))
+                PhonemeCache(path).memoize_fallback(pipeline)
+                self.assertEqual(pipeline.g2p.fallback(SimpleNamespace(text='Zorblax')), ('ZORBLAX', 1))
+            self.assertEqual(words, ['Zorblax'])
+
+
+if __name__ == '__main__':
+    unittest.main()
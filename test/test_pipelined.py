@@ -0,0 +1,54 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import soundfile
+
+from audiblez.core import synthesize_chapters_pipelined, sample_rate
+from fakes import FakePipeline, make_jobs, make_stats
+
+
+class PipelinedSynthesisTest(unittest.TestCase):
+    def test_writes_every_chapter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(tmp)
+            stats = make_stats(jobs)
+            events = []
+            written = synthesize_chapters_pipelined(FakePipeline(), jobs, 'af_sky', 1.0, stats,
+                                                    post_event=lambda name, **kw: events.append(name))
+            self.assertEqual(written, {job[2]: 5 * sample_rate // 10 for job in jobs})
+            for job in jobs:
+                self.assertEqual(soundfile.info(str(job[2])).frames, 5 * sample_rate // 10)
+            self.assertEqual(stats.processed_chars, stats.total_chars)
+            self.assertEqual(events.count('CORE_CHAPTER_FINISHED'), 3)
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), [f'chapter_{i}.wav' for i in (1, 2, 3)])
+
+    def test_model_failure_stops_all_stages_and_keeps_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(tmp)
+            threads = threading.active_count()
+            with self.assertRaisesRegex(RuntimeError, 'model failure'):
+                synthesize_chapters_pipelined(FakePipeline(fail_on='Sentence 2.3'), jobs, 'af_sky', 1.0,
+                                              make_stats(jobs))
+            self.assertEqual(threading.active_count(), threads)
+            self.assertTrue(jobs[0][2].exists())
+            self.assertFalse(jobs[1][2].exists())
+            self.assertTrue(jobs[1][2].with_name('chapter_2.wav.journal').exists())
+
+            # Running again resumes chapter 2 and completes the rest
+            written = synthesize_chapters_pipelined(FakePipeline(), jobs[1:], 'af_sky', 1.0, make_stats(jobs))
+            self.assertEqual(written, {job[2]: 5 * sample_rate // 10 for job in jobs[1:]})
+            self.assertEqual(soundfile.info(str(jobs[1][2])).frames, 5 * sample_rate // 10)
+
+    def test_writer_failure_is_raised(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(Path(tmp) / 'missing_folder', chapters=2, sentences=40)
+            threads = threading.active_count()
+            with self.assertRaises(Exception):
+                synthesize_chapters_pipelined(FakePipeline(), jobs, 'af_sky', 1.0, make_stats(jobs))
+            self.assertEqual(threading.active_count(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
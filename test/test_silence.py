@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from audiblez.core import iter_audio_segments, sample_rate
+from audiblez.silence import SilenceTrimmer, speech_bounds
+from fakes import FakePipeline
+
+
+def padded_tone(seconds=0.5, silence=0.3):
+    """A tone with `silence` seconds of near-silence (low noise) on both sides."""
+    rng = np.random.default_rng(0)
+    pad = (rng.standard_normal(int(silence * sample_rate)) * 1e-4).astype(np.float32)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return np.concatenate([pad, 0.5 * np.sin(2 * np.pi * 220 * t).astype(np.float32), pad])
+
+
+class SilenceTest(unittest.TestCase):
+    def test_speech_bounds(self):
+        audio = padded_tone()
+        start, end = speech_bounds(audio)
+        self.assertAlmostEqual(start / sample_rate, 0.3, delta=0.03)
+        self.assertAlmostEqual((len(audio) - end) / sample_rate, 0.3, delta=0.03)
+        self.assertEqual(speech_bounds(np.zeros(1000, dtype=np.float32)), (0, 0))
+
+    def test_gaps_between_sentences_and_paragraphs(self):
+        trimmer = SilenceTrimmer(sentence_gap=0.1, paragraph_gap=0.5)
+        first = trimmer.process(padded_tone())
+        sentence = trimmer.process(padded_tone())
+        paragraph = trimmer.process(padded_tone(), starts_paragraph=True)
+        self.assertEqual(len(sentence) - len(first), int(0.1 * sample_rate))
+        self.assertEqual(len(paragraph) - len(first), int(0.5 * sample_rate))
+        self.assertFalse(sentence[:int(0.1 * sample_rate)].any())
+        removed = 3 * len(padded_tone()) - len(first) - len(sentence) - len(paragraph)
+        self.assertEqual(trimmer.removed_samples, removed)
+        self.assertEqual(len(trimmer.process(np.zeros(500, dtype=np.float32))), 0)
+
+    def test_chapter_segments_are_trimmed(self):
+        sentences = ['One.', ' Two.', '\nThree.']
+        trimmer = SilenceTrimmer(sentence_gap=0.1, paragraph_gap=0.5)
+        audio = list(iter_audio_segments(FakePipeline(audio=lambda text: padded_tone()), '', 'af_sky', 1.0, sentences=sentences, pack=False,
+                                         verbose=False, trimmer=trimmer))
+        tone = np.diff(speech_bounds(padded_tone()))[0]
+        self.assertEqual([len(a) for a in audio],
+                         [tone, tone + int(0.1 * sample_rate), tone + int(0.5 * sample_rate)])
+        self.assertEqual(trimmer.removed_samples, 3 * len(padded_tone()) - sum(map(len, audio)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+import soundfile
+
+from audiblez.core import iter_audio_segments, write_chapter_audio, sample_rate
+from fakes import FakePipeline, paragraphs
+
+
+class StreamingWriterTest(unittest.TestCase):
+    def write_chapter(self, seconds):
+        sentences = paragraphs(seconds)  # one pipeline call per paragraph
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.wav'
+            tracemalloc.start()
+            frames = write_chapter_audio(path, iter_audio_segments(FakePipeline(seconds=1), '', 'af_sky', 1.0, sentences=sentences))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(frames, seconds * sample_rate)
+            self.assertEqual(soundfile.info(str(path)).frames, frames)
+        return peak
+
+    def test_peak_memory_does_not_grow_with_chapter_length(self):
+        chunk_bytes = sample_rate * 4  # one second of float32
+        short_peak = self.write_chapter(60)  # ~5.5 MB of audio
+        long_peak = self.write_chapter(600)  # ~55 MB of audio
+        self.assertLess(long_peak, 8 * chunk_bytes)
+        self.assertLess(long_peak, short_peak + 2 * chunk_bytes)
+
+    def test_no_audio_no_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'chapter.wav'
+            self.assertEqual(write_chapter_audio(path, iter([])), 0)
+            self.assertFalse(path.exists())
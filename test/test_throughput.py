@@ -0,0 +1,53 @@
+import queue
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from audiblez.core import PoolProgress, iter_audio_segments, update_throughput
+from fakes import FakePipeline
+
+
+class ThroughputTest(unittest.TestCase):
+    def test_moving_average_converges_to_measured_speed(self):
+        stats = SimpleNamespace(chars_per_sec=50)
+        for _ in range(40):
+            update_throughput(stats, 300, 1.0)
+        self.assertAlmostEqual(stats.chars_per_sec, 300, delta=1)
+        update_throughput(stats, 0, 1.0)
+        update_throughput(stats, 100, 0)
+        self.assertAlmostEqual(stats.chars_per_sec, 300, delta=1)
+
+    def test_synthesis_updates_rate(self):
+        sentences = [f'\nSentence number {n}.' for n in range(3)]
+        stats = SimpleNamespace(total_chars=sum(map(len, sentences)), processed_chars=0, chars_per_sec=1e6)
+        etas = []
+        list(iter_audio_segments(FakePipeline(delay=0.05), '', 'af_sky', 1.0, stats, sentences=sentences, pack=False,
+                                 verbose=False, post_event=lambda name, stats: etas.append(stats.chars_per_sec)))
+        self.assertLess(stats.chars_per_sec, 1e6)
+        self.assertEqual(etas, sorted(etas, reverse=True))
+
+    def test_pool_rate_stays_bounded_with_bursts_of_events(self):
+        clock = SimpleNamespace(now=1000.0)
+
+        def time():  # every reading is a microsecond later, like back-to-back events
+            clock.now += 1e-6
+            return clock.now
+
+        stats = SimpleNamespace(total_chars=10 ** 6, processed_chars=0, chars_per_sec=1000)
+        events = queue.Queue()
+        with mock.patch('audiblez.core.time.time', time), mock.patch('audiblez.core.update_progress'):
+            progress = PoolProgress(stats)
+            done = {1: 0, 2: 0}
+            for _ in range(40):  # 4 workers' worth of reports every half second: 1600 chars/sec in all
+                clock.now += 0.5
+                for i in (1, 2, 1, 2):
+                    done[i] += 200
+                    events.put(('CORE_PROGRESS', i, i, done[i]))
+                progress.drain(events)
+                self.assertLess(stats.chars_per_sec, 2000)
+        self.assertEqual(stats.processed_chars, 32000)
+        self.assertAlmostEqual(stats.chars_per_sec, 1600, delta=50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from audiblez.core import synthesize_chapters_pipelined
+from audiblez.tracing import Tracer, tracer, traced_iter
+from fakes import FakePipeline, make_jobs, make_stats
+
+
+class TracerTest(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        t = Tracer()
+        with t.span('work'):
+            pass
+        self.assertEqual(t.take(), [])
+
+    def test_nested_spans_and_thread_names(self):
+        t = Tracer()
+        t.enable()
+        with t.span('outer', 'run', n=1):
+            with t.span('inner'):
+                time.sleep(0.01)
+
+        def helper():
+            with t.span('elsewhere'):
+                pass
+
+        thread = threading.Thread(target=helper, name='helper')
+        thread.start()
+        thread.join()
+        events = t.take()
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(spans['outer']['args'], {'n': 1})
+        self.assertGreaterEqual(spans['inner']['dur'], 10000)
+        self.assertLessEqual(spans['outer']['ts'], spans['inner']['ts'])
+        self.assertGreaterEqual(spans['outer']['dur'], spans['inner']['dur'])
+        names = [e['args']['name'] for e in events if e['name'] == 'thread_name']
+        self.assertEqual(names, [threading.current_thread().name, 'helper'])
+
+    def test_traced_iter_excludes_consumer_time(self):
+        t = Tracer()
+        t.enable()
+
+        def produce():
+            for _ in range(2):
+                time.sleep(0.01)
+                yield
+
+        import audiblez.tracing
+        self.addCleanup(setattr, audiblez.tracing, 'tracer', audiblez.tracing.tracer)
+        audiblez.tracing.tracer = t
+        for _ in traced_iter(produce(), 'produce'):
+            time.sleep(0.05)
+        durations = [e['dur'] for e in t.take() if e['ph'] == 'X']
+        self.assertEqual(len(durations), 3)  # two items, then the end of the iterator
+        self.assertTrue(all(d < 40000 for d in durations))
+
+    def test_pipelined_run_is_traced(self):
+        tracer.enable()
+        self.addCleanup(tracer.take)
+        self.addCleanup(setattr, tracer, 'enabled', False)
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(tmp, chapters=2)
+            synthesize_chapters_pipelined(FakePipeline(), jobs, 'af_sky', 1.0, make_stats(jobs))
+            path = Path(tmp) / 'trace.json'
+            tracer.save(path)
+            events = json.loads(path.read_text())['traceEvents']
+        spans = {e['name'] for e in events if e['ph'] == 'X'}
+        self.assertTrue({'prepare_text', 'chapter', 'pipeline', 'write', 'checkpoint', 'finish_chapter'} <= spans)
+        threads = {e['args']['name'] for e in events if e['name'] == 'thread_name'}
+        self.assertTrue({'text stage', 'writer stage'} <= threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
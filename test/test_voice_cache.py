@@ -0,0 +1,23 @@
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from audiblez.pipelines import VoiceCache
+
+
+class VoiceCacheTest(unittest.TestCase):
+    def test_preload_maps_cached_voices_into_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = VoiceCache(tmp)
+            packs = {name: np.random.rand(510, 1, 256).astype(np.float32) for name in ['af_one', 'af_two']}
+            for name, pack in packs.items():
+                np.save(cache.path(name), pack)
+
+            pipeline = SimpleNamespace(voices={})
+            cache.preload(pipeline, 'af_one,af_two')
+            self.assertEqual(sorted(pipeline.voices), ['af_one', 'af_two'])
+            for name, pack in packs.items():
+                np.testing.assert_array_equal(pipeline.voices[name].numpy(), pack)
+            self.assertIs(cache.load('af_one'), pipeline.voices['af_one'])  # loaded once per process